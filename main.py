@@ -1,5 +1,6 @@
 from src.bot.tg_bot import *
 from src.config.settings import settings
+from src.config.startup import startup_report
 from datetime import datetime
 import logging
 
@@ -23,7 +24,8 @@ logger = logging.getLogger(__name__)
 
 def main():
     
-    app = ApplicationBuilder().token(settings.telegram_token).build()
+    # Запросы обрабатываются параллельно: пайплайн хранится отдельно для каждого ответа
+    app = ApplicationBuilder().token(settings.telegram_token).concurrent_updates(True).build()
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_question))
@@ -32,6 +34,7 @@ def main():
     app.add_handler(CallbackQueryHandler(show_param_value, pattern="^param_"))
     app.add_handler(CallbackQueryHandler(back_to_answer, pattern="^back_to_answer$"))
 
+    startup_report.log()
     logger.info("Бот запущен и готов к работе")
     app.run_polling()
 
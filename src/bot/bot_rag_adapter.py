@@ -1,6 +1,7 @@
 from src.rag.rag_system import RAGSystem
 from src.models.pipeline import RAGPipeline 
 from dataclasses import asdict, is_dataclass
+from typing import Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,13 +9,14 @@ logger = logging.getLogger(__name__)
 class RAGAdapter:
     def __init__(self):
         self.rag = RAGSystem()
-        self.context: RAGPipeline | None = None
 
         # соответствие внутренних ключей и отображаемых в меню названий
         self.MODULE_NAMES = {
             "retriever": "Извлечение документов",
             "reranker": "Реранжирование",
+            "policy": "Политика реранкинга",
             "generator": "Генерация ответа",
+            "cache": "Кэш ответов",
             "general": "Общая статистика"
         }
 
@@ -22,11 +24,20 @@ class RAGAdapter:
             "retriever": {
                 "duration": "Время выполнения",
                 "results": "Top-n найденных документов",
+                "query_embedding_cached": "Эмбеддинг запроса из кэша",
             },
             "reranker": {
                 "duration": "Время выполнения",
                 "results": "Top-n найденных документов",
                 "total_tokens_used": "Использовано токенов",
+                "cache_hits": "Оценок из кэша",
+            },
+            "policy": {
+                "skipped": "Реранкинг пропущен",
+                "reason": "Причина",
+                "candidates": "Кандидатов для реранкинга",
+                "total_candidates": "Кандидатов после поиска",
+                "margin": "Отрыв лучшего документа",
             },
             "generator": {
                 "duration": "Время генерации",
@@ -35,6 +46,11 @@ class RAGAdapter:
                 "input_tokens": "Входные токены",
                 "output_tokens": "Выходные токены",
                 "source_documents": "Инструкции откуда была взята информация"
+            },
+            "cache": {
+                "cached_query": "Ответ построен для запроса",
+                "similarity": "Близость запросов",
+                "age": "Возраст ответа",
             },
              "general": {
                 "total_duration": "Общее время выполнения",
@@ -42,23 +58,32 @@ class RAGAdapter:
             }
         }
 
-    def answer_question(self, question: str) -> str:
-        """Получает ответ от RAG и сохраняет контекст выполнения"""
-        response = self.rag.request(question)
-        self.context = self.rag.get_debug_info()
+    def answer_question(self, question: str) -> Tuple[str, RAGPipeline]:
+        """Получает ответ от RAG вместе с пайплайном этого запроса"""
+        pipeline = self.rag.request(question)
+        return self._format_answer(pipeline), pipeline
 
-        if not self.context or not self.context.generation:
-            return response
+    async def aanswer_question(self, question: str) -> Tuple[str, RAGPipeline]:
+        """Асинхронно получает ответ от RAG вместе с пайплайном этого запроса"""
+        pipeline = await self.rag.arequest(question)
+        return self._format_answer(pipeline), pipeline
 
-        sources = self.context.generation.source_urls or []
+    def _format_answer(self, pipeline: RAGPipeline) -> str:
+        """Дополняет ответ списком источников и полезных документов"""
+        if not pipeline.generation:
+            return ""
+
+        response = pipeline.generation.answer
+        sources = pipeline.generation.source_urls or []
         sources_str = "\n".join(sources) if sources else "—"
 
         threshold = 3  # ваш порог
+        reranked = pipeline.reranking.results if pipeline.reranking else []
         other_docs = [
-            r.document for r in self.context.reranking.results 
+            r.document for r in reranked
             if r.rerank_score is not None and r.rerank_score >= threshold
         ]
-        # other_docs = [r.document for r in self.context.reranking.results]
+        # other_docs = [r.document for r in pipeline.reranking.results]
         other_docs = [doc for doc in other_docs if doc.url not in sources]
         other_docs_str = "\n".join(f"{doc.title} — {doc.url}" for doc in other_docs) if other_docs else "—"
 
@@ -66,23 +91,32 @@ class RAGAdapter:
 
         return final_response
 
-    def get_all_debug_info(self) -> dict:
+    def cache_note(self, pipeline: RAGPipeline | None) -> str:
+        """Пометка об ответе из кэша (пустая строка, если ответ построен заново)"""
+        hit = pipeline.answer_cache if pipeline else None
+        if not hit:
+            return ""
+        return f"Ответ взят из кэша: построен для запроса \"{hit.cached_query}\" (близость {hit.similarity:.3f})"
+
+    def get_all_debug_info(self, pipeline: RAGPipeline | None) -> dict:
         """Преобразует весь контекст в словарь"""
-        if not self.context:
+        if not pipeline:
             return {}
 
-        if is_dataclass(self.context):
-            return asdict(self.context)
-        return self.context
+        if is_dataclass(pipeline):
+            return asdict(pipeline)
+        return pipeline
 
-    def get_module_info(self, module: str) -> dict:
+    def get_module_info(self, pipeline: RAGPipeline | None, module: str) -> dict:
         """Возвращает словарь с информацией по конкретному этапу RAG"""
-        data = self.get_all_debug_info()
+        data = self.get_all_debug_info(pipeline)
 
         mapping = {
             "retriever": "retriever",
             "reranker": "reranking",
+            "policy": "rerank_decision",
             "generator": "generation",
+            "cache": "answer_cache",
             "general": "general"
         }
 
@@ -92,9 +126,9 @@ class RAGAdapter:
 
         return data.get(key, {})
         
-    def get_param_info(self, module: str, param: str):
+    def get_param_info(self, pipeline: RAGPipeline | None, module: str, param: str):
         """Возвращает значение конкретного параметра"""
-        info = self.get_module_info(module)
+        info = self.get_module_info(pipeline, module)
         if not info:
             return None
         if param in info:
@@ -153,6 +187,17 @@ class RAGAdapter:
 
             return "\n".join(lines)
 
+        # флаги
+        if isinstance(value, bool):
+            return f"{name}: {'да' if value else 'нет'}"
+
+        if param == "age" and isinstance(value, (float, int)):
+            return f"{name}: {value:.0f} сек."
+
+        # отрыв по векторному расстоянию и близость запросов
+        if param in ("margin", "similarity") and isinstance(value, float):
+            return f"{name}: {value:.3f}"
+
         # обычные числовые значения
         if isinstance(value, (float, int)):
             return f"{name}: {value}"
@@ -163,36 +208,41 @@ class RAGAdapter:
 
         return f"{name}: {value}"
 
-    def format_debug_info(self, module: str = None, param: str = None) -> str:
+    def format_debug_info(self, pipeline: RAGPipeline | None, module: str = None, param: str = None) -> str:
         """Главная функция форматирования"""
-        if not self.context:
+        if not pipeline:
             return "Нет данных для отображения. Сначала задай вопрос."
 
+        if module == "cache" and not pipeline.answer_cache:
+            return "Ответ построен заново, не из кэша ответов"
+
         # Отдельный параметр
         if module and param:
-            value = self.get_param_info(module, param)
+            value = self.get_param_info(pipeline, module, param)
             if value is None:
                 return "Нет данных"
             return self.format_param(module, param, value)
 
         # Один модуль
         if module:
-            info = self.get_module_info(module)
+            info = self.get_module_info(pipeline, module)
             if not info:
                 return f"Нет данных по модулю '{module}'"
             title = self.MODULE_NAMES.get(module, module.upper())
             lines = [f"*{title}*"]
             for param_key in self.PARAM_NAMES[module].keys():
-                value = self.get_param_info(module, param_key)
+                value = self.get_param_info(pipeline, module, param_key)
                 if value is not None:
                     lines.append(self.format_param(module, param_key, value))
             return "\n".join(lines)
 
         # Общая сводка
-        data = self.get_all_debug_info()
+        data = self.get_all_debug_info(pipeline)
         total = data.get("total_duration", None)
         text = ["*Сводка по RAG-пайплайну:*"]
         text.append(f"Запрос: _{data.get('query', '')}_")
+        if pipeline.answer_cache:
+            text.append(self.cache_note(pipeline))
         if total:
             text.append(f"Общее время: {total:.3f} сек.\n")
 
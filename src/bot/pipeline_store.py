@@ -0,0 +1,42 @@
+from src.models.pipeline import RAGPipeline
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+@dataclass
+class StoredAnswer:
+    """Ответ бота и пайплайн запроса, на который он был дан"""
+    answer: str
+    pipeline: RAGPipeline
+
+
+class PipelineStore:
+    """
+    Хранилище пайплайнов по сообщениям бота.
+
+    Ключ - (chat_id, message_id) сообщения с ответом, поэтому меню отладки
+    каждого сообщения показывает именно его пайплайн, даже если запросы
+    разных пользователей обрабатываются параллельно. При переполнении
+    вытесняются самые давние записи.
+    """
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._items: OrderedDict[Tuple[int, int], StoredAnswer] = OrderedDict()
+
+    def save(self, chat_id: int, message_id: int, answer: str, pipeline: RAGPipeline) -> None:
+        """Сохраняет ответ и пайплайн для сообщения"""
+        key = (chat_id, message_id)
+        self._items[key] = StoredAnswer(answer, pipeline)
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def get(self, chat_id: int, message_id: int) -> Optional[StoredAnswer]:
+        """Возвращает сохраненный ответ для сообщения или None"""
+        return self._items.get((chat_id, message_id))
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -4,10 +4,14 @@ from telegram.ext import (
     filters, ContextTypes, CallbackQueryHandler
 )
 from .bot_rag_adapter import RAGAdapter
+from .pipeline_store import PipelineStore
+from src.config.settings import settings
 
 # Сохраняем контекст сессии для пользователя
 user_context = {}
 adapter = RAGAdapter()
+# Пайплайны запросов по сообщениям с ответами
+pipelines = PipelineStore(max_size=settings.bot_pipeline_store_size)
 
 # Команда /start
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -27,15 +31,15 @@ async def handle_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     await update.message.reply_text("Думаю над ответом...")
 
-    answer = adapter.answer_question(question)
+    answer, pipeline = await adapter.aanswer_question(question)
 
     user_context[user_id]["last_question"] = question
-    user_context[user_id]["last_answer"] = answer
     
     keyboard = [
         [InlineKeyboardButton("Больше информации об ответе", callback_data="more_info")]
     ]
-    await update.message.reply_text(answer, reply_markup=InlineKeyboardMarkup(keyboard))
+    message = await update.message.reply_text(answer, reply_markup=InlineKeyboardMarkup(keyboard))
+    pipelines.save(message.chat_id, message.message_id, answer, pipeline)
 
 async def show_modules(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -48,8 +52,10 @@ async def show_modules(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]
     keyboard.append([InlineKeyboardButton("Назад к ответу", callback_data="back_to_answer")])
 
+    stored = pipelines.get(query.message.chat_id, query.message.message_id)
+    note = adapter.cache_note(stored.pipeline if stored else None)
     await query.edit_message_text(
-        "Выбери модуль, информацию о котором хочешь посмотреть:",
+        (f"{note}\n\n" if note else "") + "Выбери модуль, информацию о котором хочешь посмотреть:",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
@@ -77,7 +83,8 @@ async def show_param_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     _, module_key, param_key = query.data.split("_", 2)
-    text = adapter.format_debug_info(module_key, param_key)
+    stored = pipelines.get(query.message.chat_id, query.message.message_id)
+    text = adapter.format_debug_info(stored.pipeline if stored else None, module_key, param_key)
 
     keyboard = [[InlineKeyboardButton("Назад", callback_data=f"module_{module_key}")]]
     keyboard.append([InlineKeyboardButton("Назад к ответу", callback_data="back_to_answer")])
@@ -86,13 +93,9 @@ async def show_param_value(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def back_to_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    user_id = update.effective_user.id
-    
-    # Инициализируем контекст пользователя, если его нет
-    if user_id not in user_context:
-        user_context[user_id] = {"last_question": None}
     
-    answer = user_context[user_id].get("last_answer", "Ответ не найден.")
+    stored = pipelines.get(query.message.chat_id, query.message.message_id)
+    answer = stored.answer if stored else "Ответ не найден."
     
     # Восстанавливаем исходную клавиатуру
     keyboard = [
@@ -21,6 +21,9 @@ RERANK_SYSTEM_PROMPT_1 = {
    - Объективность: Оценивайте блоки, основываясь только на их содержании относительно запроса.
    - Никаких предположений: Не выводите информацию за рамки того, что явно указано в блоке."""
 }
+# Меняется при любом изменении промптов реранкинга: оценки в кэше реранкера с другой версией не используются
+RERANK_PROMPT_VERSION = "1"
+
 RERANK_SYSTEM_PROMPT = """Ты - эксперт по оценке релевантности документов. 
 Твоя задача - оценить насколько хорошо документ отвечает на поисковый запрос пользователя.
 
@@ -33,6 +36,20 @@ RERANK_SYSTEM_PROMPT = """Ты - эксперт по оценке релеван
 
 Верни ТОЛЬКО число от 1 до 5, без дополнительных объяснений."""
 
+LISTWISE_RERANK_SYSTEM_PROMPT = """Ты - эксперт по оценке релевантности документов.
+Тебе дан поисковый запрос пользователя и пронумерованный список документов.
+Оцени, насколько хорошо каждый документ отвечает на запрос, по шкале от 1 до 5:
+- 1: Совершенно не релевантен запросу
+- 2: Слабо связан с запросом
+- 3: Частично релевантен
+- 4: Хорошо отвечает на запрос
+- 5: Идеально подходит для ответа на запрос
+
+Верни ТОЛЬКО оценки, по одной строке на каждый документ, в формате "номер: оценка", например:
+1: 4
+2: 1
+Без дополнительных объяснений."""
+
 RAG_SYSTEM_PROMPT = """Ты помощник, который отвечает на вопросы пользователей на основе предоставленных документов.
 ПРАВИЛА:
 1. Отвечай только на основе предоставленной информации из документов.
@@ -63,6 +80,24 @@ def create_rerank_messages(query: str, document_text: str) -> List[str]:
     ]
 
 
+def create_listwise_rerank_messages(query: str, document_texts: List[str]) -> List[str]:
+    documents = "\n\n".join(f"[{i}] {text}" for i, text in enumerate(document_texts, 1))
+    return [
+        {
+            "role": "system",
+            "content": LISTWISE_RERANK_SYSTEM_PROMPT
+        },
+        {"role": "user",
+        "content":
+        f"""Запрос пользователя: {query}
+
+        Документы для оценки:
+        {documents}
+
+        Оценки релевантности (номер: оценка 1-5) для документов 1-{len(document_texts)}:"""}
+    ]
+
+
 def create_response_messages(query: str, documents: List[Document]) -> List[str]:
     return [
         {
@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
 from enum import Enum
+from typing import Optional
 
 class EmbeddingProviderType(str, Enum):
     LOCAL = "local"
@@ -11,6 +12,11 @@ class RerankerProviderType(str, Enum):
     LocalBGE = "bge"
     LocalJina = "jina"
 
+class VectorBackendType(str, Enum):
+    CHROMA = "chroma"
+    NUMPY = "numpy"
+    FAISS = "faiss"
+
 class LLMClientType(str, Enum):
     OLLAMA = "ollama"
     GIGACHAT = "gigachat"
@@ -22,13 +28,43 @@ class AppSettings(BaseSettings):
     # Настройки ChromaDB
     chroma_db_path: str = Field(default="storage/chroma_db", description="Путь к ChromaDB")
     collection_name: str = Field(default="documents", description="Имя коллекции")
+    vector_backend: VectorBackendType = Field(default=VectorBackendType.CHROMA, description="Векторное хранилище (при смене нужна переиндексация)")
+    numpy_vector_dtype: str = Field(default="float32", pattern="^(float32|float16|int8)$", description="Тип векторов в NumPy-хранилище (int8 - с масштабом на вектор)")
+    vector_reduce_dim: Optional[int] = Field(default=None, ge=8, description="Уменьшать размерность векторов NumPy-хранилища до указанной")
+    vector_reduction: str = Field(default="truncate", pattern="^(truncate|pca)$", description="Способ уменьшения размерности: отбросить хвост или PCA")
+    vector_rescore_factor: int = Field(default=0, ge=0, description="Пересчитывать top-k * factor кандидатов по полным векторам (0 - без пересчета)")
+    faiss_index_type: str = Field(default="hnsw", pattern="^(hnsw|ivfpq)$", description="Тип индекса FAISS")
+    faiss_hnsw_m: int = Field(default=32, ge=4, description="Число связей на вершину графа HNSW")
+    faiss_ef_construction: int = Field(default=200, ge=1, description="Ширина поиска при построении HNSW")
+    faiss_ef_search: int = Field(default=64, ge=1, description="Ширина поиска HNSW при запросе (точность против задержки)")
+    faiss_nlist: int = Field(default=1024, ge=1, description="Число кластеров IVF")
+    faiss_pq_m: int = Field(default=16, ge=1, description="Число подвекторов PQ")
+    faiss_nprobe: int = Field(default=16, ge=1, description="Сколько кластеров IVF просматривать при запросе (точность против задержки)")
     
     # Настройки эмбеддингов
     # text_splitter: bool = Field(default=False, description="Использовать сегментацию текста для запроса пользователя")
     embedding_provider: EmbeddingProviderType = Field(default=EmbeddingProviderType.OLLAMA)
     embedding_model: str = Field(default="qwen3-embedding:0.6b", description="Модель эмбеддингов")
     batch_size: int = Field(default=1, ge=1, description="Размер батча для индексации")
-    show_progress: bool = Field(default=True, description="Показывать прогресс")
+    show_progress: bool = Field(default=True, description="Показывать прогресс при индексации")
+    ollama_embed_batched: bool = Field(default=False, description="Пакетные эмбеддинги через /api/embed (нормализованные векторы, в отличие от /api/embeddings); при смене режима нужна переиндексация")
+    embedding_max_concurrent_batches: int = Field(default=4, ge=1, description="Максимум параллельных батчей эмбеддингов")
+    embedding_max_batch_tokens: int = Field(default=16384, ge=1, description="Бюджет токенов (с паддингом) на батч локальной модели")
+    embedding_micro_batch_wait_ms: float = Field(default=5.0, ge=0, description="Сколько ждать одновременные запросы для общего батча эмбеддингов, мс (0 - без микробатчинга)")
+    embedding_micro_batch_max: int = Field(default=32, ge=1, description="Максимум текстов в микробатче запросов")
+    embedding_max_retries: int = Field(default=3, ge=1, description="Число попыток для батча эмбеддингов")
+    
+    index_batch_size: int = Field(default=256, ge=1, description="Документов в одной записи в ChromaDB при индексации")
+    chunking_enabled: bool = Field(default=True, description="Разбивать документы на чанки по заголовкам ##/### при индексации")
+    chunk_max_tokens: int = Field(default=512, ge=16, description="Максимальный размер чанка (в словах)")
+    chunk_overlap_tokens: int = Field(default=64, ge=0, description="Перекрытие соседних чанков (в словах)")
+    index_keep_versions: int = Field(default=1, ge=0, description="Сколько предыдущих версий коллекции хранить после переиндексации")
+    document_store_enabled: bool = Field(default=True, description="Хранить тексты в memory-mapped хранилище документов, а не в ChromaDB")
+    document_store_path: str = Field(default="storage/documents/documents.store", description="Путь к хранилищу документов (к имени файла добавляется версия коллекции)")
+    document_store_compression: bool = Field(default=False, description="Сжимать тексты в хранилище zstd (нужен пакет zstandard)")
+    embedding_cache_enabled: bool = Field(default=True, description="Кэшировать эмбеддинги документов при индексации")
+    embedding_cache_path: str = Field(default="storage/embedding_cache.sqlite", description="Путь к кэшу эмбеддингов")
+    embedding_cache_max_entries: int = Field(default=1_000_000, ge=1, description="Максимум векторов в кэше эмбеддингов")
     
     # Настройки LLM
     ollama_base_url: str = Field(default="http://172.16.100.164:11434", description="URL Ollama сервера")
@@ -40,6 +76,22 @@ class AppSettings(BaseSettings):
     # Настройки поиска
     initial_candidates: int = Field(default=10, ge=1, description="Кандидаты из векторного поиска")
     final_results: int = Field(default=5, ge=1, description="Финальные результаты")
+    chunk_search_multiplier: int = Field(default=3, ge=1, description="Во сколько раз больше чанков запрашивать, чтобы после схлопывания осталось достаточно документов")
+    query_embedding_cache_size: int = Field(default=1024, ge=0, description="Размер кэша эмбеддингов запросов (0 - без кэша)")
+    query_embedding_cache_ttl: int = Field(default=3600, ge=0, description="Время жизни эмбеддинга запроса в кэше, сек. (0 - без ограничения)")
+    hybrid_search_enabled: bool = Field(default=True, description="Объединять векторный поиск с лексическим BM25")
+    bm25_index_path: str = Field(default="storage/documents/bm25.npz", description="Путь к индексу BM25")
+    bm25_k1: float = Field(default=1.2, ge=0.0, description="Параметр k1 BM25")
+    bm25_b: float = Field(default=0.75, ge=0.0, le=1.0, description="Параметр b BM25")
+    rrf_k: int = Field(default=60, ge=1, description="Константа reciprocal rank fusion")
+    near_duplicate_enabled: bool = Field(default=True, description="Кластеризовать почти одинаковые документы при индексации и оставлять в выдаче один документ кластера")
+    near_duplicate_index_path: str = Field(default="storage/documents/near_duplicates.npz", description="Путь к индексу кластеров дубликатов")
+    near_duplicate_threshold: float = Field(default=0.9, ge=0.5, le=1.0, description="Минимальная оценка похожести Жаккара (MinHash) для дубликатов")
+    near_duplicate_shingle_size: int = Field(default=5, ge=1, description="Длина словесных шинглов для MinHash")
+    answer_cache_size: int = Field(default=0, ge=0, description="Размер семантического кэша ответов (0 - без кэша; включать только после подбора answer_cache_similarity для модели эмбеддингов)")
+    answer_cache_ttl: int = Field(default=3600, ge=0, description="Время жизни ответа в кэше, сек. (0 - без ограничения)")
+    answer_cache_similarity: float = Field(default=0.95, ge=0.0, le=1.0, description="Минимальная косинусная близость запроса к закэшированному для повторного использования ответа")
+    lean_retrieval: bool = Field(default=True, description="Не загружать текст документов при поиске, подгружать только для реранкинга и генерации")
     max_context_documents: int = Field(default=5, ge=1, le=20, description="Максимум документов в контексте")
     
     # Настройки реранкера
@@ -49,6 +101,17 @@ class AppSettings(BaseSettings):
     reranker_model: str = Field(default="gemma3:4b-it-qat", description="Модель реранкера")
     reranker_top_k: int = Field(default=40, ge=1, description="Топ-к реранкера")
     reranker_top_p: float = Field(default=0.95, ge=0.0, le=1.0, description="Топ-п реранкера")
+    reranker_mode: str = Field(default="listwise", pattern="^(pointwise|listwise)$", description="Режим LLM реранкера: pointwise - запрос на каждый документ, listwise - один запрос на всех кандидатов")
+    reranker_listwise_max_chars: int = Field(default=1500, ge=100, description="Сколько символов документа передавать в listwise реранкинг")
+    rerank_cache_enabled: bool = Field(default=True, description="Хранить оценки реранкера в персистентном кэше")
+    rerank_cache_path: str = Field(default="storage/rerank_cache.sqlite", description="Путь к кэшу оценок реранкера")
+    rerank_cache_max_entries: int = Field(default=200_000, ge=1, description="Максимум оценок в кэше реранкера")
+    adaptive_rerank_enabled: bool = Field(default=True, description="Выбирать число кандидатов для реранкинга по векторным скорам и пропускать его при явном лидере (только для нормированных эмбеддингов, проверяется при запуске)")
+    rerank_skip_margin: float = Field(default=0.15, ge=0.0, description="Отрыв лучшего документа по векторному расстоянию (квадрат L2 нормированных векторов, 2 - 2cos), при котором реранкинг пропускается")
+    rerank_skip_max_distance: float = Field(default=0.6, ge=0.0, description="Максимальное векторное расстояние (2 - 2cos) лучшего документа для пропуска реранкинга")
+    rerank_candidate_window: float = Field(default=0.2, ge=0.0, description="Реранжировать кандидатов не дальше этого расстояния (2 - 2cos) от лучшего")
+    rerank_min_candidates: int = Field(default=3, ge=1, description="Минимум кандидатов для реранкинга")
+    rerank_max_candidates: Optional[int] = Field(default=None, ge=1, description="Максимум кандидатов для реранкинга (по умолчанию - все)")
     
     # Настройки генерации ответа
     generation_model: str = Field(default="gemma3:4b-it-qat", description="Модель генерации ответа")
@@ -58,6 +121,7 @@ class AppSettings(BaseSettings):
 
     # Настройки телеграм бота
     telegram_token: str = Field(default=None, description="Токен аутентификации бота")
+    bot_pipeline_store_size: int = Field(default=1000, ge=1, description="Сколько последних ответов бот хранит для меню отладки")
 
     class Config:
         env_file = ".env"
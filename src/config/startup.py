@@ -0,0 +1,78 @@
+"""
+Отчет о запуске: время импорта тяжелых зависимостей и инициализации компонентов
+"""
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+import importlib
+import logging
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    Собирает стоимость запуска по компонентам.
+
+    Тяжелые библиотеки (torch через sentence_transformers, FlagEmbedding,
+    transformers, gigachat) импортируются через import_module только тогда,
+    когда фабрика действительно создает использующий их провайдер. Время
+    инициализации компонента включает время импортов внутри нее.
+    """
+
+    def __init__(self):
+        # (компонент, этап, секунды, прирост пиковой памяти в МБ)
+        self.entries: List[Tuple[str, str, float, Optional[float]]] = []
+        self._lock = threading.Lock()
+
+    def import_module(self, name: str, component: str):
+        """Импортирует модуль по требованию; первый импорт попадает в отчет"""
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+
+        with self.measure(component, f"import {name}"):
+            try:
+                return importlib.import_module(name)
+            except ImportError as e:
+                raise ImportError(f"Для компонента {component} нужен пакет {name}: {e}") from e
+
+    @contextmanager
+    def measure(self, component: str, stage: str = "init"):
+        start = time.perf_counter()
+        start_rss = self._peak_rss_mb()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            end_rss = self._peak_rss_mb()
+            memory = end_rss - start_rss if start_rss is not None and end_rss is not None else None
+            with self._lock:
+                self.entries.append((component, stage, seconds, memory))
+
+    def format(self) -> str:
+        lines = ["Отчет о запуске:"]
+        for component, stage, seconds, memory in self.entries:
+            memory_str = f", +{memory:.0f} МБ" if memory else ""
+            lines.append(f"  {component:<12} {stage:<32} {seconds:7.3f} с{memory_str}")
+        return "\n".join(lines)
+
+    def log(self) -> None:
+        logger.info(self.format())
+
+    @staticmethod
+    def _peak_rss_mb() -> Optional[float]:
+        """Пиковый RSS процесса в МБ (ru_maxrss в Linux - в КБ)"""
+        if resource is None:
+            return None
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+startup_report = StartupReport()
@@ -0,0 +1,191 @@
+"""
+Лексический индекс BM25 с русской токенизацией и стеммингом
+"""
+from ..models.document import Document
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import logging
+import os
+import re
+import threading
+
+try:
+    import snowballstemmer
+except ImportError:
+    snowballstemmer = None
+
+logger = logging.getLogger(__name__)
+
+# Слова, коды ошибок и версии: "err-404", "v1.2", "ключ_api" остаются одним токеном
+TOKEN_PATTERN = re.compile(r"[0-9a-zа-я]+(?:[-_.][0-9a-zа-я]+)*")
+CYRILLIC = re.compile(r"[а-я]")
+
+STOP_WORDS = frozenset("""
+    а без более бы был была были было быть в вам вас весь во вот все всего всех вы где да даже для до
+    его ее ей если есть еще же за здесь и из или им их к как какая какой когда кто ли либо мне может
+    мы на над надо не него нее нет ни них но ну о об однако он она они оно от очень по под после при
+    про с со так также такой там те тем то того тоже той только том ты у уже чем что чтобы эта эти
+    это этого этой этом этот эту я
+""".split())
+
+# Окончания для упрощенного стемминга, если snowballstemmer не установлен
+RUSSIAN_ENDINGS = sorted("""
+    иями ями ами ого его ому ему ыми ими ешь ишь ться ется ится ает яет ает ают яют ует уют ала яла
+    ила али яли или ая яя ое ее ые ие ый ий ой ей ом ем ам ям ах ях ую юю ов ев ия ья ью ть ет ит ют
+    ут ат ят ла ло ли ал ил а я о е ы и у ю ь й
+""".split(), key=len, reverse=True)
+
+_local = threading.local()
+
+
+def _snowball(language: str):
+    # Стеммеры snowballstemmer хранят состояние - по экземпляру на поток
+    stemmers = getattr(_local, "stemmers", None)
+    if stemmers is None:
+        stemmers = _local.stemmers = {}
+    if language not in stemmers:
+        stemmers[language] = snowballstemmer.stemmer(language)
+    return stemmers[language]
+
+
+@lru_cache(maxsize=200_000)
+def stem(word: str) -> str:
+    """Основа слова: русские и английские слова стеммятся, токены с цифрами - нет"""
+    if any(c.isdigit() for c in word):
+        return word
+
+    russian = bool(CYRILLIC.search(word))
+    if snowballstemmer is not None:
+        return _snowball("russian" if russian else "english").stemWord(word)
+
+    if not russian:
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Нижний регистр, ё -> е, без стоп-слов; составные токены дополняются частями"""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower().replace("ё", "е")):
+        token = match.group()
+        parts = re.split(r"[-_.]", token)
+        if len(parts) > 1:
+            tokens.append(token)
+        tokens.extend(stem(part) for part in parts if part not in STOP_WORDS)
+    return tokens
+
+
+class Bm25Index:
+    """
+    Инвертированный индекс BM25 только для чтения.
+
+    Формат - один .npz: ID записей, длины, словарь и постинги в виде
+    CSR (смещения терминов, номера записей, частоты). Индекс строится
+    целиком из файла документов рядом с хранилищем документов и заменяется
+    атомарно (Bm25Index.build), читатели переоткрывают его по mtime.
+
+    Attributes:
+        k1, b: Параметры BM25
+    """
+
+    def __init__(self, path: str | Path, k1: float = 1.2, b: float = 0.75):
+        self.path = Path(path)
+        self.k1 = k1
+        self.b = b
+
+        with np.load(self.path) as data:
+            self.ids = data["ids"]
+            lengths = data["lengths"].astype(np.float32)
+            terms = data["terms"]
+            self.offsets = data["offsets"]
+            self.postings = data["postings"]
+            self.frequencies = data["frequencies"].astype(np.float32)
+
+        self.vocabulary: Dict[str, int] = {str(term): i for i, term in enumerate(terms)}
+        n = len(self.ids)
+        document_frequency = np.diff(self.offsets).astype(np.float32)
+        self.idf = np.log(1 + (n - document_frequency + 0.5) / (document_frequency + 0.5))
+        # Нормализация длины считается один раз при загрузке
+        avg_length = lengths.mean() if n else 1.0
+        self.length_norm = self.k1 * (1 - self.b + self.b * lengths / max(avg_length, 1e-6))
+        logger.debug(f"Открыт индекс BM25 {self.path}: {n} записей, {len(terms)} терминов")
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """(ID записи, скор BM25) лучших записей, по убыванию скора"""
+        terms = [self.vocabulary[token] for token in dict.fromkeys(tokenize(query)) if token in self.vocabulary]
+        if not terms or not len(self.ids):
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in terms:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs = self.postings[start:end]
+            tf = self.frequencies[start:end]
+            scores[docs] += self.idf[term] * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        order = np.lexsort((matched, -scores[matched]))
+        return [(int(self.ids[i]), float(scores[i])) for i in matched[order]]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def mtime(path: str | Path) -> Optional[float]:
+        """Время изменения файла индекса или None, если его нет"""
+        try:
+            return os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def build(path: str | Path, documents: Iterable[Document]) -> int:
+        """
+        Строит индекс по записям (документам или чанкам) и атомарно заменяет файл.
+
+        Returns:
+            Количество записей
+        """
+        ids: List[int] = []
+        lengths: List[int] = []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+
+        for position, doc in enumerate(documents):
+            tokens = tokenize(f"{doc.title}\n{doc.section or ''}\n{doc.text}")
+            ids.append(doc.id)
+            lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                postings.setdefault(token, []).append((position, count))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(postings[term])
+        docs = np.fromiter((p for term in terms for p, _ in postings[term]), dtype=np.int32, count=int(offsets[-1]))
+        frequencies = np.fromiter((min(c, 65535) for term in terms for _, c in postings[term]), dtype=np.uint16, count=int(offsets[-1]))
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp_path,
+            ids=np.array(ids, dtype=np.int64),
+            lengths=np.array(lengths, dtype=np.int32),
+            terms=np.array(terms, dtype=str),
+            offsets=offsets,
+            postings=docs,
+            frequencies=frequencies
+        )
+        tmp_path.replace(path)
+        logger.info(f"Индекс BM25 {path} собран: {len(ids)} записей, {len(terms)} терминов")
+        return len(ids)
@@ -0,0 +1,176 @@
+"""
+Конвейерная возобновляемая запись документов в ChromaDB
+"""
+from .chroma_manager import ChromaDBManager
+from .embedding_providers import BaseEmbeddingProvider
+from ..models.document import DocumentCollection
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IndexCheckpoint:
+    """
+    Прогресс записи файла документов в коллекцию.
+
+    Документы читаются из файла в одном и том же порядке, поэтому для
+    продолжения пропускаются documents_done исходных документов. Чекпоинт
+    действителен, только пока не изменились файл, коллекция, модель
+    эмбеддингов, размер батча и параметры чанкинга.
+    """
+    collection: str
+    source: str
+    source_size: int
+    source_mtime: float
+    embedding_model: str
+    batch_size: int = 0
+    chunking: str = ""
+    batches_done: int = 0
+    documents_done: int = 0
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['IndexCheckpoint']:
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(**json.load(f))
+
+    @classmethod
+    def for_source(cls,
+                   collection: str,
+                   source: str,
+                   embedding_model: str,
+                   batch_size: int,
+                   chunking: str) -> 'IndexCheckpoint':
+        stat = os.stat(source)
+        return cls(collection, str(source), stat.st_size, stat.st_mtime, embedding_model, batch_size=batch_size, chunking=chunking)
+
+    def save(self, path: Path) -> None:
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(asdict(self), f, ensure_ascii=False)
+        tmp_path.replace(path)
+
+    def matches(self, other: 'IndexCheckpoint') -> bool:
+        """Относится ли чекпоинт к тому же файлу, коллекции, модели и параметрам записи"""
+        return self._identity() == other._identity()
+
+    def _identity(self) -> tuple:
+        return (self.collection, self.source, self.source_size, self.source_mtime,
+                self.embedding_model, self.batch_size, self.chunking)
+
+
+class BulkIndexWriter:
+    """
+    Запись файла документов в коллекцию батчами.
+
+    Эмбеддинги батча N+1 считаются, пока батч N записывается в ChromaDB
+    в отдельном потоке. После каждого записанного батча обновляется
+    чекпоинт, поэтому прерванная индексация продолжается с места остановки.
+    Пропускная способность (документов/с и эмбеддингов/с) пишется в лог.
+
+    Attributes:
+        db_connector: Коллекция, в которую идет запись
+        embedding_provider: Провайдер эмбеддингов для документов
+        checkpoint_path: Путь к файлу чекпоинта
+        transform: Преобразование батча перед записью (чанкинг)
+        embedding_model: Идентификатор модели для проверки чекпоинта
+        chunking: Параметры чанкинга для проверки чекпоинта
+    """
+
+    def __init__(self,
+                 db_connector: ChromaDBManager,
+                 embedding_provider: BaseEmbeddingProvider,
+                 checkpoint_path: Path,
+                 transform: Callable[[DocumentCollection], DocumentCollection],
+                 embedding_model: str,
+                 chunking: str = ""):
+        self.db_connector = db_connector
+        self.embedding_provider = embedding_provider
+        self.checkpoint_path = Path(checkpoint_path)
+        self.transform = transform
+        self.embedding_model = embedding_model
+        self.chunking = chunking
+
+    def run(self, documents_path: str, batch_size: int) -> dict:
+        """
+        Записывает документы файла, продолжая с чекпоинта, если он подходит.
+
+        Returns:
+            Статистика: documents, records, seconds, docs_per_second, embeddings_per_second
+        """
+        checkpoint = IndexCheckpoint.for_source(
+            self.db_connector.collection.name,
+            documents_path,
+            self.embedding_model,
+            batch_size,
+            self.chunking
+        )
+        saved = IndexCheckpoint.load(self.checkpoint_path)
+        if saved and saved.matches(checkpoint):
+            checkpoint = saved
+            logger.info(f"Продолжаем индексацию с батча {saved.batches_done} ({saved.documents_done} документов уже записано)")
+
+        start_time = time.time()
+        embed_time = 0.0
+        documents, records = 0, 0
+        pending: Optional[Tuple[Future, int, int]] = None
+
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            batches = DocumentCollection.iter_batches(documents_path, batch_size, skip=checkpoint.documents_done)
+            for i, batch in enumerate(batches, checkpoint.batches_done):
+                chunks = self.transform(batch)
+                embed_start = time.time()
+                prepared = self.db_connector.prepare_documents(chunks, self.embedding_provider)
+                embed_time += time.time() - embed_start
+
+                # Дожидаемся записи предыдущего батча только после подготовки текущего
+                if pending:
+                    self._complete(pending, checkpoint)
+                pending = (writer.submit(self.db_connector.write_prepared, prepared), i, len(batch.documents))
+
+                documents += len(batch.documents)
+                records += len(chunks.documents)
+                self._log_progress(documents, records, start_time)
+
+            if pending:
+                self._complete(pending, checkpoint)
+
+        self.checkpoint_path.unlink(missing_ok=True)
+
+        seconds = time.time() - start_time
+        stats = {
+            "documents": documents,
+            "records": records,
+            "seconds": round(seconds, 3),
+            "docs_per_second": round(documents / seconds, 2) if seconds else 0.0,
+            "embeddings_per_second": round(records / seconds, 2) if seconds else 0.0,
+            "embedding_seconds": round(embed_time, 3)
+        }
+        logger.info(f"Запись в ChromaDB завершена: {stats}")
+        return stats
+
+    def _complete(self, pending: Tuple[Future, int, int], checkpoint: IndexCheckpoint) -> None:
+        """Ждет записи батча и сохраняет чекпоинт"""
+        future, batch_index, batch_documents = pending
+        future.result()
+        checkpoint.batches_done = batch_index + 1
+        checkpoint.documents_done += batch_documents
+        checkpoint.save(self.checkpoint_path)
+
+    @staticmethod
+    def _log_progress(documents: int, records: int, start_time: float) -> None:
+        seconds = time.time() - start_time
+        if seconds > 0:
+            logger.info(
+                f"Подготовлено {documents} документов ({records} эмбеддингов): "
+                f"{documents / seconds:.1f} док/с, {records / seconds:.1f} эмб/с"
+            )
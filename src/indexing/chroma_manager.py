@@ -1,41 +1,142 @@
 import chromadb
 from ..models.document import DocumentCollection
+from .embedding_providers import BaseEmbeddingProvider
+from .collection_alias import CollectionAlias
+from .numpy_vector_store import NumpyVectorClient, CollectionNotFoundError
+from .faiss_vector_store import FaissVectorClient, FaissIndexParams
+from ..config.settings import settings, VectorBackendType
 from chromadb.errors import NotFoundError
+from typing import Dict, Iterable, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
 class ChromaDBManager:
 
-    def __init__(self, db_path, collection_name, embed_func):
-        self.client = chromadb.PersistentClient(path=db_path) 
+    def __init__(self, db_path, collection_name, embed_func, use_alias: bool = True, store_texts: bool = True):
+        """
+        Args:
+            db_path: Путь к ChromaDB
+            collection_name: Логическое имя коллекции (или имя версии при use_alias=False)
+            embed_func: Функция эмбеддингов коллекции
+            use_alias: Открывать версию коллекции, на которую указывает алиас
+            store_texts: Хранить тексты в ChromaDB (не нужно, если они лежат в DocumentStore)
+        """
+        self.client = self._create_client(db_path)
+        self.store_texts = store_texts
+        self.alias = CollectionAlias(db_path, collection_name)
 
+        name = self.alias.resolve() if use_alias else collection_name
         self.collection = self.client.get_or_create_collection(
-                name=collection_name,
+                name=name,
                 embedding_function=embed_func
             )
     
-    def add_documents(self, documents: DocumentCollection):
+    @staticmethod
+    def _create_client(db_path):
+        """Клиент выбранного в настройках векторного хранилища"""
+        if settings.vector_backend == VectorBackendType.NUMPY:
+            return NumpyVectorClient(
+                db_path,
+                dtype=settings.numpy_vector_dtype,
+                reduce_dim=settings.vector_reduce_dim,
+                reduction=settings.vector_reduction,
+                rescore_factor=settings.vector_rescore_factor
+            )
+        if settings.vector_backend == VectorBackendType.FAISS:
+            return FaissVectorClient(db_path, FaissIndexParams(
+                index_type=settings.faiss_index_type,
+                hnsw_m=settings.faiss_hnsw_m,
+                ef_construction=settings.faiss_ef_construction,
+                ef_search=settings.faiss_ef_search,
+                nlist=settings.faiss_nlist,
+                pq_m=settings.faiss_pq_m,
+                nprobe=settings.faiss_nprobe
+            ))
+        return chromadb.PersistentClient(path=db_path)
+
+    def add_documents(self, documents: DocumentCollection, embedding_provider: Optional[BaseEmbeddingProvider] = None):
+        """
+        Добавляет документы в коллекцию.
+
+        Если передан embedding_provider, эмбеддинги считаются им (например,
+        через кэш), иначе - функцией эмбеддингов коллекции.
+        """
         try:
             logger.info(f"Добавляем {len(documents.documents)} документов в ChromaDB")
-            
-            self.collection.add(
-                ids=[str(d.id) for d in documents.documents],
-                documents=[f"{d.title}\n{d.text}" for d in documents.documents],
-                metadatas=documents.to_list_of_dict()
-            )
-            
+            self._write(self.collection.add, documents, embedding_provider)
             logger.info("Документы успешно добавлены в ChromaDB")
             
         except Exception as e:
             logger.error(f"Ошибка при добавлении документов в ChromaDB: {e}")
             raise
 
+    def upsert_documents(self, documents: DocumentCollection, embedding_provider: Optional[BaseEmbeddingProvider] = None):
+        """Добавляет новые и обновляет существующие документы"""
+        try:
+            logger.info(f"Обновляем {len(documents.documents)} документов в ChromaDB")
+            self._write(self.collection.upsert, documents, embedding_provider)
+            logger.info("Документы успешно обновлены в ChromaDB")
+
+        except Exception as e:
+            logger.error(f"Ошибка при обновлении документов в ChromaDB: {e}")
+            raise
+
+    def delete_documents(self, ids: List[str]):
+        """Удаляет документы по ID"""
+        if not ids:
+            return
+        logger.info(f"Удаляем {len(ids)} документов из ChromaDB")
+        self.collection.delete(ids=ids)
+
+    def get_content_hashes(self) -> Dict[str, Optional[str]]:
+        """Возвращает {id: хэш содержимого} для всех проиндексированных документов"""
+        data = self.collection.get(include=["metadatas"])
+        return {
+            doc_id: (metadata or {}).get("content_hash")
+            for doc_id, metadata in zip(data["ids"], data["metadatas"])
+        }
+
+    def prepare_documents(self, documents: DocumentCollection, embedding_provider: Optional[BaseEmbeddingProvider] = None) -> dict:
+        """Готовит аргументы записи: ID, тексты, эмбеддинги и метаданные с хэшами содержимого"""
+        texts = [f"{d.title}\n{d.text}" for d in documents.documents]
+        embeddings = embedding_provider.encode(texts) if embedding_provider else None
+        # Текст уже хранится в documents, в метаданных он не дублируется
+        metadatas = [
+            {**{k: v for k, v in d.to_dict().items() if k != 'text'}, "content_hash": d.content_hash()}
+            for d in documents.documents
+        ]
+        return {
+            "ids": [str(d.id) for d in documents.documents],
+            "documents": texts if self.store_texts else None,
+            "embeddings": embeddings,
+            "metadatas": metadatas
+        }
+
+    def write_prepared(self, prepared: dict, upsert: bool = True):
+        """Записывает подготовленный батч (upsert идемпотентен при повторе после сбоя)"""
+        if not prepared["ids"]:
+            return
+        method = self.collection.upsert if upsert else self.collection.add
+        method(**prepared)
+
+    def _write(self, method, documents: DocumentCollection, embedding_provider: Optional[BaseEmbeddingProvider]):
+        """Записывает документы методом коллекции (add/upsert) вместе с хэшами содержимого"""
+        if not documents.documents:
+            return
+        method(**self.prepare_documents(documents, embedding_provider))
+
+    def flush(self):
+        """Завершает запись: хранилища с журналом (NumPy) сливают его в основной файл"""
+        compact = getattr(self.collection, "compact", None)
+        if compact is not None:
+            compact()
+
     def collection_exists(self) -> bool:
         try:
             self.client.get_collection(name=self.collection.name)
             return True
-        except NotFoundError as e:
+        except (NotFoundError, CollectionNotFoundError):
             return False
 
     def delete_collection(self):
@@ -48,4 +149,33 @@ class ChromaDBManager:
             "count": self.collection.count(),
             "metadata": self.collection.metadata
         }
-    
+
+    def list_versions(self) -> List[str]:
+        """
+        Имена всех версий коллекции, от старых к новым.
+
+        Коллекция с логическим именем (индекс, построенный до появления
+        версий) считается самой старой версией.
+        """
+        names = [c if isinstance(c, str) else c.name for c in self.client.list_collections()]
+        legacy = [self.alias.name] if self.alias.name in names else []
+        return legacy + sorted(name for name in names if self.alias.is_version(name))
+
+    def garbage_collect(self, keep: int = 1, in_progress: Iterable[str] = ()) -> List[str]:
+        """
+        Удаляет старые версии коллекции.
+
+        Активная версия не удаляется никогда, кроме нее остаются keep
+        последних версий (для отката и запросов, еще не переключившихся
+        на новую версию). Недописанные версии (in_progress) не удаляются
+        и не занимают места среди keep последних.
+        """
+        active = self.alias.resolve()
+        skip = {active, *in_progress}
+        inactive = [name for name in self.list_versions() if name not in skip]
+        to_delete = inactive[:-keep] if keep > 0 else inactive
+
+        for name in to_delete:
+            self.client.delete_collection(name=name)
+            logger.info(f"Удалена старая версия коллекции {name}")
+        return to_delete
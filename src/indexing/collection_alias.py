@@ -0,0 +1,78 @@
+"""
+Указатель (алиас) на активную версию коллекции ChromaDB
+"""
+from pathlib import Path
+from typing import Optional
+from datetime import datetime
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class CollectionAlias:
+    """
+    Алиас логического имени коллекции на ее активную версию.
+
+    Хранится JSON-файлом рядом с базой ChromaDB и переключается атомарной
+    заменой файла, поэтому читатели всегда видят либо старую, либо новую
+    версию. Вместе с версией хранятся провайдер и модель эмбеддингов, которыми
+    она построена, - по ним процесс бота понимает, какой моделью векторизовать
+    запросы после переключения, - и полный ключ эмбеддингов (с режимом
+    эндпоинта Ollama), по которому проверяется совместимость векторов.
+
+    Attributes:
+        name: Логическое имя коллекции (settings.collection_name)
+        path: Путь к файлу алиаса
+    """
+
+    def __init__(self, db_path: str, name: str):
+        self.name = name
+        self.path = Path(db_path) / f"{name}.alias.json"
+
+    def read(self) -> Optional[dict]:
+        """Возвращает {"collection", "embedding_provider", "embedding_model", "embedding_key", "updated_at"} или None"""
+        if not self.path.exists():
+            return None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def resolve(self) -> str:
+        """Имя активной версии коллекции (без алиаса - само логическое имя)"""
+        data = self.read()
+        return data["collection"] if data else self.name
+
+    def switch(self,
+               collection: str,
+               embedding_provider: str,
+               embedding_model: str,
+               embedding_key: Optional[str] = None) -> None:
+        """Атомарно переключает алиас на новую версию"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "collection": collection,
+                "embedding_provider": embedding_provider,
+                "embedding_model": embedding_model,
+                "embedding_key": embedding_key,
+                "updated_at": datetime.now().isoformat()
+            }, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.path)
+        logger.info(f"Алиас {self.name} переключен на {collection}")
+
+    def mtime(self) -> Optional[float]:
+        """Время изменения файла алиаса (для дешевой проверки переключения)"""
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def new_version_name(self) -> str:
+        """Имя для новой версии коллекции"""
+        return f"{self.name}__v{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+
+    def is_version(self, collection: str) -> bool:
+        """Является ли коллекция версией этого алиаса"""
+        return collection.startswith(f"{self.name}__v")
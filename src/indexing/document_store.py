@@ -0,0 +1,182 @@
+"""
+Компактное хранилище текстов документов в одном memory-mapped файле
+"""
+from ..models.document import Document
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RAGDOCS1"
+HEADER = struct.Struct("<8sQQ")     # magic, смещение индекса, длина индекса
+
+
+class DocumentStore:
+    """
+    Хранилище текстов документов только для чтения.
+
+    Формат файла: заголовок, затем тексты всех записей подряд (UTF-8,
+    опционально каждая запись сжата zstd для произвольного доступа), в конце -
+    JSON-индекс {id: смещение, длина, метаданные}. Файл открывается через
+    mmap, поэтому несколько процессов-воркеров делят одни и те же страницы
+    в памяти. Поиск по ID и URL - O(1) по словарям, построенным из индекса.
+
+    Файл пересобирается целиком и заменяется атомарно (DocumentStore.build),
+    уже открытые читатели продолжают видеть прежнюю версию. У каждой версии
+    коллекции свой файл (DocumentStore.for_collection), поэтому откат на
+    старую версию не теряет ее тексты.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._file = open(self.path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, index_offset, index_length = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} не является хранилищем документов")
+
+        index = json.loads(self._mm[index_offset:index_offset + index_length])
+        self.compression: Optional[str] = index["compression"]
+        if self.compression == "zstd" and zstandard is None:
+            raise ImportError("Для чтения сжатого хранилища нужен пакет zstandard")
+
+        # id -> (смещение, длина, заголовок, url, parent_id, chunk_index, section)
+        self._entries: Dict[int, tuple] = {}
+        self._by_url: Dict[str, List[int]] = {}
+        for entry in index["entries"]:
+            doc_id = entry[0]
+            self._entries[doc_id] = tuple(entry[1:])
+            self._by_url.setdefault(entry[4], []).append(doc_id)
+
+        self._local = threading.local()
+        logger.debug(f"Открыто хранилище документов {self.path}: {len(self._entries)} записей")
+
+    def get_text(self, doc_id: int) -> Optional[str]:
+        """Текст записи по ID или None"""
+        entry = self._entries.get(doc_id)
+        if entry is None:
+            return None
+        offset, length = entry[0], entry[1]
+        data = self._mm[offset:offset + length]
+        if self.compression == "zstd":
+            data = self._decompressor().decompress(data)
+        return data.decode("utf-8")
+
+    def get(self, doc_id: int) -> Optional[Document]:
+        """Запись по ID в виде Document"""
+        entry = self._entries.get(doc_id)
+        if entry is None:
+            return None
+        _, _, title, url, parent_id, chunk_index, section = entry
+        return Document(
+            id=doc_id,
+            title=title,
+            url=url,
+            text=self.get_text(doc_id),
+            parent_id=parent_id,
+            chunk_index=chunk_index,
+            section=section
+        )
+
+    def get_texts(self, doc_ids: Iterable[int]) -> Dict[int, str]:
+        """Тексты нескольких записей (отсутствующие ID пропускаются)"""
+        texts = {}
+        for doc_id in doc_ids:
+            text = self.get_text(doc_id)
+            if text is not None:
+                texts[doc_id] = text
+        return texts
+
+    def ids_by_url(self, url: str) -> List[int]:
+        """ID записей документа по URL (для чанков - в порядке записи)"""
+        return list(self._by_url.get(url, []))
+
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def _decompressor(self):
+        # Объекты zstandard нельзя использовать из нескольких потоков одновременно
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor()
+            self._local.decompressor = decompressor
+        return decompressor
+
+    @staticmethod
+    def mtime(path: str | Path) -> Optional[float]:
+        """Время изменения файла хранилища или None, если его нет"""
+        try:
+            return os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def for_collection(path: str | Path, collection: str) -> Path:
+        """Путь к хранилищу версии коллекции: documents.store -> documents.<collection>.store"""
+        path = Path(path)
+        return path.with_name(f"{path.stem}.{collection}{path.suffix}")
+
+    @staticmethod
+    def build(path: str | Path, documents: Iterable[Document], compress: bool = False) -> int:
+        """
+        Потоково записывает документы в новый файл и атомарно заменяет старый.
+
+        Args:
+            path: Путь к файлу хранилища
+            documents: Записи (документы или чанки) в порядке записи
+            compress: Сжимать тексты zstd
+
+        Returns:
+            Количество записей
+        """
+        if compress and zstandard is None:
+            raise ImportError("Для сжатия хранилища нужен пакет zstandard")
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        compressor = zstandard.ZstdCompressor(level=3) if compress else None
+
+        entries: List[Tuple] = []
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 0, 0))
+            offset = HEADER.size
+            for doc in documents:
+                data = doc.text.encode("utf-8")
+                if compressor:
+                    data = compressor.compress(data)
+                f.write(data)
+                entries.append((doc.id, offset, len(data), doc.title, doc.url, doc.parent_id, doc.chunk_index, doc.section))
+                offset += len(data)
+
+            index = json.dumps({
+                "compression": "zstd" if compress else None,
+                "entries": entries
+            }, ensure_ascii=False).encode("utf-8")
+            f.write(index)
+
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, offset, len(index)))
+
+        tmp_path.replace(path)
+        logger.info(f"Хранилище документов {path} собрано: {len(entries)} записей")
+        return len(entries)
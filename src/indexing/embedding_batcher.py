@@ -0,0 +1,128 @@
+"""
+Микробатчинг одновременных запросов к провайдеру эмбеддингов
+"""
+from .embedding_providers import BaseEmbeddingProvider
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatchingEmbeddingProvider(BaseEmbeddingProvider):
+    """
+    Обертка, объединяющая одновременные запросы в один батч.
+
+    Фоновый поток берет первый запрос из очереди и еще max_wait_ms ждет
+    следующие (пока в батче меньше max_batch текстов), затем делает один
+    вызов encode и раздает каждому вызывающему его векторы. Под нагрузкой
+    это заменяет N запросов к Ollama или N прогонов модели одним.
+    Запросы не меньше max_batch текстов идут в провайдер напрямую.
+
+    Attributes:
+        provider: Оборачиваемый провайдер
+        max_wait_ms: Сколько ждать попутные запросы после первого
+        max_batch: Максимум текстов в батче
+        requests: Количество обработанных запросов
+        batches: Количество вызовов провайдера
+    """
+
+    def __init__(self, provider: BaseEmbeddingProvider, max_wait_ms: float = 5.0, max_batch: int = 32):
+        self.provider = provider
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.requests = 0
+        self.batches = 0
+
+        self._queue: "queue.Queue[Optional[Tuple[List[str], Future]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="embedding-micro-batcher", daemon=True)
+        self._worker.start()
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        future: Future = Future()
+        with self._lock:
+            if self._closed or len(texts) >= self.max_batch:
+                future = None
+            else:
+                self._queue.put((texts, future))
+
+        if future is None:
+            return self.provider.encode(texts)
+        return future.result()
+
+    def get_dimension(self) -> int:
+        return self.provider.get_dimension()
+
+    def progress(self, enabled: bool = True):
+        return self.provider.progress(enabled)
+
+    def close(self) -> None:
+        """Останавливает фоновый поток после обработки уже поставленных запросов"""
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch": round(self.requests / self.batches, 2) if self.batches else 0.0
+        }
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            pending = [item]
+            size = len(item[0])
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                pending.append(item)
+                size += len(item[0])
+
+            self._flush(pending)
+            if stop:
+                return
+
+    def _flush(self, pending: List[Tuple[List[str], Future]]) -> None:
+        """Один вызов провайдера на весь батч, результаты раздаются по запросам"""
+        texts = [text for request_texts, _ in pending for text in request_texts]
+        try:
+            vectors = self.provider.encode(texts)
+        except Exception as e:
+            logger.error(f"Ошибка при пакетной векторизации {len(pending)} запросов: {e}")
+            for _, future in pending:
+                future.set_exception(e)
+            return
+
+        self.requests += len(pending)
+        self.batches += 1
+        if len(pending) > 1:
+            logger.debug(f"Объединено {len(pending)} запросов эмбеддингов ({len(texts)} текстов)")
+
+        offset = 0
+        for request_texts, future in pending:
+            future.set_result(vectors[offset:offset + len(request_texts)])
+            offset += len(request_texts)
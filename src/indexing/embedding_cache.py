@@ -0,0 +1,162 @@
+"""
+Персистентный кэш эмбеддингов с адресацией по содержимому
+"""
+from .embedding_providers import BaseEmbeddingProvider
+from array import array
+from pathlib import Path
+from typing import Dict, List
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEmbeddingProvider(BaseEmbeddingProvider):
+    """
+    Кэширующая обертка над любым провайдером эмбеддингов.
+
+    Векторы хранятся в SQLite по ключу (модель, sha256 текста), поэтому при
+    переиндексации заново векторизуются только новые и измененные тексты.
+    Размер кэша ограничен max_entries: при переполнении удаляются записи,
+    к которым дольше всего не обращались.
+
+    Attributes:
+        provider: Оборачиваемый провайдер
+        model_key: Идентификатор модели в ключе кэша
+        hits: Количество найденных в кэше текстов
+        misses: Количество текстов, векторизованных провайдером
+    """
+
+    def __init__(self,
+                 provider: BaseEmbeddingProvider,
+                 model_key: str,
+                 db_path: str = "storage/embedding_cache.sqlite",
+                 max_entries: int = 1_000_000):
+        self.provider = provider
+        self.model_key = model_key
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        logger.debug(f"Кэш эмбеддингов {db_path} для модели {model_key}")
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        hashes = [self._hash(text) for text in texts]
+        cached = self._get_many(set(hashes))
+
+        # Уникальные тексты, которых нет в кэше
+        missing: Dict[str, str] = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in cached and text_hash not in missing:
+                missing[text_hash] = text
+
+        missed = sum(1 for text_hash in hashes if text_hash not in cached)
+        self.hits += len(texts) - missed
+        self.misses += missed
+        logger.debug(f"Кэш эмбеддингов: {len(texts) - missed} из {len(texts)} найдено")
+
+        if missing:
+            vectors = self.provider.encode(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._put_many(computed)
+            cached.update(computed)
+
+        return [cached[text_hash] for text_hash in hashes]
+
+    def get_dimension(self) -> int:
+        return self.provider.get_dimension()
+
+    def progress(self, enabled: bool = True):
+        return self.provider.progress(enabled)
+
+    def stats(self) -> dict:
+        """Статистика попаданий в кэш"""
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries
+        }
+
+    def clear(self) -> None:
+        """Удаляет из кэша все векторы текущей модели"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings WHERE model = ?", (self.model_key,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Закрывает соединение с базой кэша"""
+        with self._lock:
+            self._conn.close()
+
+    def _get_many(self, hashes: set) -> Dict[str, List[float]]:
+        """Читает векторы по хэшам и обновляет время последнего обращения"""
+        found = {}
+        hashes = list(hashes)
+        now = time.time()
+        with self._lock:
+            # Ограничение SQLite на число параметров запроса
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (self.model_key, *chunk)
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_key, text_hash) for text_hash in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _put_many(self, vectors: Dict[str, List[float]]) -> None:
+        """Сохраняет векторы и вытесняет самые давние записи при переполнении"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                [(self.model_key, text_hash, array("f", vector).tobytes(), now) for text_hash, vector in vectors.items()]
+            )
+
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                evicted = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                    (evicted,)
+                )
+                logger.debug(f"Из кэша эмбеддингов вытеснено {evicted} записей")
+            self._conn.commit()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
@@ -34,11 +34,23 @@ class EmbeddingProviderFactory:
         """
         
         if provider_type == EmbeddingProviderType.LOCAL:
-            return LocalEmbeddingProvider(model_name)
+            return LocalEmbeddingProvider(
+                model_name,
+                batch_size=settings.batch_size,
+                max_batch_tokens=settings.embedding_max_batch_tokens
+            )
         
         elif provider_type == EmbeddingProviderType.OLLAMA:
             base_url = settings.ollama_base_url
-            return OllamaEmbeddingProvider(model_name, base_url)
+            return OllamaEmbeddingProvider(
+                model_name,
+                base_url,
+                batch_size=settings.batch_size,
+                timeout=settings.ollama_timeout,
+                max_concurrent_batches=settings.embedding_max_concurrent_batches,
+                max_retries=settings.embedding_max_retries,
+                batched=settings.ollama_embed_batched
+            )
         
         else:
             raise ValueError(f"Неподдерживаемый тип провайдера: {provider_type}")
\ No newline at end of file
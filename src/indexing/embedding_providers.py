@@ -3,15 +3,23 @@
 """
 from abc import ABC, abstractmethod
 from typing import List
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 import requests
 import logging
-from sentence_transformers import SentenceTransformer
+import time
+from tqdm import tqdm
+from src.config.startup import startup_report
 
 logger = logging.getLogger(__name__)
 
 
 class BaseEmbeddingProvider(ABC):
     """Абстрактный базовый класс для провайдеров эмбеддингов"""
+
+    # Вывод прогресса включается только на время офлайн-индексации
+    show_progress: bool = False
     
     @abstractmethod
     def encode(self, texts: List[str]) -> List[List[float]]:
@@ -23,50 +31,182 @@ class BaseEmbeddingProvider(ABC):
         """Получить размерность векторов"""
         pass
 
+    @contextmanager
+    def progress(self, enabled: bool = True):
+        """Включает вывод прогресса векторизации внутри блока with"""
+        previous = self.show_progress
+        self.show_progress = enabled
+        try:
+            yield self
+        finally:
+            self.show_progress = previous
+
 
 class LocalEmbeddingProvider(BaseEmbeddingProvider):
-    """Локальная модель через SentenceTransformers"""
+    """
+    Локальная модель через SentenceTransformers.
+
+    Тексты сортируются по длине и группируются в батчи не больше batch_size
+    текстов и не больше max_batch_tokens токенов с учетом паддинга (длина
+    самого длинного текста батча * размер батча). Это минимизирует паддинг,
+    а результаты возвращаются в исходном порядке.
+    """
     
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, batch_size: int = 1, max_batch_tokens: int = 16384):
         logger.debug(f"Инициализация локальной модели эмбеддингов: {model_name}")
-        self.model = SentenceTransformer(model_name)
+        sentence_transformers = startup_report.import_module("sentence_transformers", "embeddings")
+        self.model = sentence_transformers.SentenceTransformer(model_name)
         self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
     
     def encode(self, texts: List[str]) -> List[List[float]]:
         logger.debug(f"Векторизация {len(texts)} текстов через локальную модель")
-        return self.model.encode(
-            texts, 
-            batch_size=1,
-            show_progress_bar=True
-        ).tolist()
+        if not texts:
+            return []
+
+        lengths = self._token_lengths(texts)
+        batches = self._make_batches(lengths)
+
+        embeddings: List[List[float] | None] = [None] * len(texts)
+        for batch in tqdm(batches, desc="Эмбеддинги", disable=not self.show_progress):
+            vectors = self.model.encode(
+                [texts[i] for i in batch],
+                batch_size=len(batch),
+                show_progress_bar=False
+            )
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = vector.tolist()
+
+        return embeddings
+
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        """Длины текстов в токенах с учетом обрезки до max_seq_length модели"""
+        max_length = self.model.max_seq_length or None
+        tokenized = self.model.tokenizer(texts, add_special_tokens=True, truncation=False)["input_ids"]
+        return [min(len(ids), max_length) if max_length else len(ids) for ids in tokenized]
+
+    def _make_batches(self, lengths: List[int]) -> List[List[int]]:
+        """Разбивает индексы текстов, отсортированные по длине, на батчи с бюджетом токенов"""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+
+        batches = []
+        current = []
+        for i in order:
+            # Тексты отсортированы по возрастанию, поэтому текущий - самый длинный в батче
+            padded_tokens = lengths[i] * (len(current) + 1)
+            if current and (len(current) >= self.batch_size or padded_tokens > self.max_batch_tokens):
+                batches.append(current)
+                current = []
+            current.append(i)
+
+        if current:
+            batches.append(current)
+        return batches
     
     def get_dimension(self) -> int:
         return self.model.get_sentence_embedding_dimension()
 
 
 class OllamaEmbeddingProvider(BaseEmbeddingProvider):
-    """Эмбеддинги через API Ollama"""
+    """
+    Эмбеддинги через API Ollama.
+
+    В пакетном режиме тексты отправляются батчами по batch_size в эндпоинт
+    /api/embed (несколько входов за один запрос). Батчи обрабатываются
+    параллельно (не более max_concurrent_batches одновременно) через общую
+    сессию с пулом keep-alive соединений, неудачные батчи повторяются.
+    Без пакетного режима используется старый эндпоинт /api/embeddings.
+    """
     
-    def __init__(self, model_name: str, base_url: str):
+    def __init__(self,
+                 model_name: str,
+                 base_url: str,
+                 batch_size: int = 1,
+                 timeout: int = 30,
+                 max_concurrent_batches: int = 1,
+                 max_retries: int = 3,
+                 batched: bool = False):
         self.model_name = model_name
         self.base_url = base_url
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.max_concurrent_batches = max_concurrent_batches
+        self.max_retries = max_retries
+        self.batched = batched
         self._dimension = None
+
+        # Общая сессия с пулом соединений на все параллельные батчи
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_concurrent_batches,
+            pool_maxsize=max_concurrent_batches
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         logger.debug(f"Инициализация Ollama провайдера: {model_name} на {base_url}")
     
     def encode(self, texts: List[str]) -> List[List[float]]:
+        if not self.batched:
+            return self._encode_single(texts)
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        logger.debug(f"Векторизация {len(texts)} текстов через Ollama API: {len(batches)} батчей")
+
+        if len(batches) <= 1 or self.max_concurrent_batches == 1:
+            batch_embeddings = [self._embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_batches) as executor:
+                # map сохраняет порядок батчей
+                batch_embeddings = list(executor.map(self._embed_batch, batches))
+
+        return [embedding for batch in batch_embeddings for embedding in batch]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Получает эмбеддинги для одного батча через /api/embed с повторами"""
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/api/embed",
+                    json={
+                        "model": self.model_name,
+                        "input": batch
+                    },
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                embeddings = response.json()["embeddings"]
+
+                if len(embeddings) != len(batch):
+                    raise ValueError(f"Ollama вернула {len(embeddings)} эмбеддингов для {len(batch)} текстов")
+                return embeddings
+
+            except (requests.exceptions.RequestException, ValueError) as e:
+                if attempt == self.max_retries:
+                    logger.error(f"Ошибка при получении эмбеддингов для батча из {len(batch)} текстов: {e}")
+                    raise
+                delay = 2 ** (attempt - 1)
+                logger.warning(f"Попытка {attempt}/{self.max_retries} не удалась: {e}. Повтор через {delay} с")
+                time.sleep(delay)
+            except KeyError as e:
+                logger.error(f"Неверная структура ответа от Ollama API: {e}")
+                raise
+
+    def _encode_single(self, texts: List[str]) -> List[List[float]]:
+        """Получает эмбеддинги по одному тексту через /api/embeddings"""
         logger.debug(f"Векторизация {len(texts)} текстов через Ollama API")
         embeddings = []
         
         for i, text in enumerate(texts):
             try:
                 logger.debug(f"Обрабатываем текст {i+1}/{len(texts)}")
-                response = requests.post(
+                response = self.session.post(
                     f"{self.base_url}/api/embeddings",
                     json={
                         "model": self.model_name,
                         "prompt": text
                     },
-                    timeout=30
+                    timeout=self.timeout
                 )
                 response.raise_for_status()
                 embedding = response.json()["embedding"]
@@ -88,4 +228,4 @@ class OllamaEmbeddingProvider(BaseEmbeddingProvider):
             test_embedding = self.encode(["test"])[0]
             self._dimension = len(test_embedding)
             logger.debug(f"Размерность эмбеддингов: {self._dimension}")
-        return self._dimension
\ No newline at end of file
+        return self._dimension
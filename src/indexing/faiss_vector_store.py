@@ -0,0 +1,481 @@
+"""
+Векторное хранилище на FAISS (HNSW или IVF-PQ) для больших корпусов
+"""
+from .numpy_vector_store import CollectionNotFoundError
+from src.config.startup import startup_report
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Доля удаленных векторов, после которой индекс пересобирается при flush
+REBUILD_DEAD_RATIO = 0.2
+# Минимум векторов на кластер IVF для обучения
+IVF_POINTS_PER_CENTROID = 39
+# Обучение PQ с 8 битами на код требует хотя бы 256 векторов
+PQ_MIN_TRAIN = 256
+
+
+@dataclass
+class FaissIndexParams:
+    """
+    Параметры индекса FAISS.
+
+    Attributes:
+        index_type: "hnsw" или "ivfpq"
+        hnsw_m: Число связей на вершину графа HNSW
+        ef_construction: Ширина поиска при построении HNSW
+        ef_search: Ширина поиска HNSW при запросе (больше - точнее и медленнее)
+        nlist: Число кластеров IVF (уменьшается, если векторов мало)
+        pq_m: Число подвекторов PQ (подбирается делителем размерности)
+        nprobe: Сколько кластеров IVF просматривать при запросе
+    """
+    index_type: str = "hnsw"
+    hnsw_m: int = 32
+    ef_construction: int = 200
+    ef_search: int = 64
+    nlist: int = 1024
+    pq_m: int = 16
+    nprobe: int = 16
+
+
+class FaissCollection:
+    """
+    Коллекция на FAISS с API, совместимым с используемой частью коллекции ChromaDB.
+
+    Источник истины - журнал векторов vectors.f32 (вектор с меткой i лежит
+    по смещению i * dim) и таблица records в SQLite (метка, ID, метаданные,
+    текст). Индекс FAISS (index.faiss) - производный: в нем векторы под теми
+    же метками, и при открытии в него досыпаются векторы, записанные после
+    последнего flush. Поэтому прерванная запись ничего не теряет.
+
+    Обновление записи - новая метка, старая становится "мертвой": удаленные
+    метки отсеиваются при запросе, а при flush индекс пересобирается, если
+    их доля превысила REBUILD_DEAD_RATIO. IVF-PQ обучается при первом flush,
+    до этого поиск идет точным перебором по журналу векторов.
+
+    Процессы, которые только читают, открывают индекс через mmap и
+    перечитывают его, когда меняется файл VERSION.
+    """
+
+    def __init__(self, path: Path, name: str, embedding_function=None, params: Optional[FaissIndexParams] = None):
+        self.path = Path(path)
+        self.name = name
+        self.metadata = None
+        self._embedding_function = embedding_function
+        self.params = params or FaissIndexParams()
+        self._faiss = startup_report.import_module("faiss", "retriever")
+        self._lock = threading.RLock()
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path / "records.sqlite", check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                label INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                metadata TEXT,
+                document TEXT
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.commit()
+
+        self._index = None
+        self._writable = False
+        self._version = None
+        self._truncate_vectors()
+
+    # --- API коллекции ---
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def add(self, ids: List[str], embeddings=None, metadatas=None, documents=None):
+        self._write(ids, embeddings, metadatas, documents, upsert=False)
+
+    def upsert(self, ids: List[str], embeddings=None, metadatas=None, documents=None):
+        self._write(ids, embeddings, metadatas, documents, upsert=True)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM records WHERE id = ?", [(doc_id,) for doc_id in ids])
+            self._conn.commit()
+
+    def get(self, ids: Optional[List[str]] = None, include: Sequence[str] = ("metadatas", "documents")) -> Dict[str, Any]:
+        with self._lock:
+            if ids is None:
+                rows = self._conn.execute("SELECT id, metadata, document, label FROM records ORDER BY label").fetchall()
+            else:
+                found = {}
+                for chunk in self._chunks(list(ids)):
+                    placeholders = ",".join("?" * len(chunk))
+                    for row in self._conn.execute(f"SELECT id, metadata, document, label FROM records WHERE id IN ({placeholders})", chunk):
+                        found[row[0]] = row
+                rows = [found[doc_id] for doc_id in ids if doc_id in found]
+
+            result = {"ids": [row[0] for row in rows]}
+            if "metadatas" in include:
+                result["metadatas"] = [json.loads(row[1]) if row[1] is not None else None for row in rows]
+            if "documents" in include:
+                result["documents"] = [row[2] for row in rows]
+            if "embeddings" in include:
+                labels = np.array([row[3] for row in rows], dtype=np.int64)
+                result["embeddings"] = np.asarray(self._raw_vectors()[labels]).tolist() if len(labels) else []
+        return result
+
+    def distances(self, ids: List[str], query_embedding) -> Dict[str, float]:
+        """Точные расстояния (2 - 2cos) от запроса до заданных записей по нормализованным векторам"""
+        query = self._normalize(np.asarray([query_embedding], dtype=np.float32))[0]
+        with self._lock:
+            labels = {}
+            for chunk in self._chunks(list(ids)):
+                placeholders = ",".join("?" * len(chunk))
+                for doc_id, label in self._conn.execute(f"SELECT id, label FROM records WHERE id IN ({placeholders})", chunk):
+                    labels[doc_id] = label
+            if not labels:
+                return {}
+            vectors = np.asarray(self._raw_vectors()[np.array(list(labels.values()), dtype=np.int64)])
+        return {doc_id: float(2.0 - 2.0 * score) for doc_id, score in zip(labels, vectors @ query)}
+
+    def query(self,
+              query_texts: Optional[List[str]] = None,
+              query_embeddings=None,
+              n_results: int = 10,
+              include: Sequence[str] = ("metadatas", "documents", "distances")) -> Dict[str, Any]:
+        """Приближенный поиск top-k для одного или нескольких запросов"""
+        if query_embeddings is None:
+            query_embeddings = self._embedding_function(query_texts)
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+
+        with self._lock:
+            self._reload_if_changed()
+            labels, scores = self._search(queries, n_results)
+            records = self._records_by_label({label for row in labels for label in row})
+
+        result = {"ids": [[records[label][0] for label in row] for row in labels]}
+        if "distances" in include:
+            result["distances"] = [[2.0 - 2.0 * float(score) for score in row] for row in scores]
+        if "metadatas" in include:
+            result["metadatas"] = [[json.loads(records[label][1]) if records[label][1] is not None else None for label in row] for row in labels]
+        if "documents" in include:
+            result["documents"] = [[records[label][2] for label in row] for row in labels]
+        return result
+
+    def compact(self) -> None:
+        """Обучает (IVF-PQ), при необходимости пересобирает и сохраняет индекс на диск"""
+        with self._lock:
+            index = self._writable_index()
+            total = self._next_label()
+            if total == 0:
+                return
+
+            live = self._live_labels()
+            dead = (index.ntotal - len(live)) if index is not None else 0
+            if index is None or (index.ntotal and dead / index.ntotal > REBUILD_DEAD_RATIO):
+                index = self._build_index(live)
+                if index is None:
+                    return
+                self._index = index
+
+            tmp = self.path / "index.faiss.tmp"
+            self._faiss.write_index(index, str(tmp))
+            tmp.replace(self.path / "index.faiss")
+            self._set_meta("indexed", total)
+            self._bump_version()
+            logger.info(f"Индекс FAISS коллекции {self.name} сохранен: {index.ntotal} векторов ({len(live)} активных)")
+
+    # --- Поиск ---
+
+    def _search(self, queries: np.ndarray, k: int) -> Tuple[List[List[int]], List[List[float]]]:
+        """Метки и скоры top-k активных записей для каждого запроса"""
+        index = self._index if self._index is not None else self._load_index(writable=False)
+        if index is None:
+            return self._exact_search(queries, k)
+
+        if index.ntotal == 0:
+            return [[] for _ in queries], [[] for _ in queries]
+
+        self._apply_search_params(index)
+        live_count = self.count()
+        fetch = min(k, index.ntotal)
+        # Мертвые метки отсеиваются, поэтому при нехватке результатов запрос повторяется с запасом
+        while True:
+            scores, labels = index.search(queries, fetch)
+            alive = self._live_subset({int(label) for label in labels.ravel() if label >= 0})
+            rows = [
+                [(int(label), float(score)) for label, score in zip(label_row, score_row) if label >= 0 and int(label) in alive][:k]
+                for label_row, score_row in zip(labels, scores)
+            ]
+            if fetch >= index.ntotal or all(len(row) >= min(k, live_count) for row in rows):
+                break
+            fetch = min(fetch * 2, index.ntotal)
+
+        return [[label for label, _ in row] for row in rows], [[score for _, score in row] for row in rows]
+
+    def _exact_search(self, queries: np.ndarray, k: int) -> Tuple[List[List[int]], List[List[float]]]:
+        """Точный перебор по журналу векторов (пока IVF-PQ не обучен)"""
+        live = np.array(self._live_labels(), dtype=np.int64)
+        if not len(live):
+            return [[] for _ in queries], [[] for _ in queries]
+
+        scores = queries @ self._raw_vectors()[live].T
+        k = min(k, len(live))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.lexsort((top, -top_scores), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return live[top].tolist(), np.take_along_axis(top_scores, order, axis=1).tolist()
+
+    def _apply_search_params(self, index) -> None:
+        if self.params.index_type == "hnsw":
+            self._faiss.downcast_index(index.index).hnsw.efSearch = self.params.ef_search
+        else:
+            self._faiss.extract_index_ivf(index).nprobe = self.params.nprobe
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return np.ascontiguousarray(vectors / norms, dtype=np.float32)
+
+    # --- Запись ---
+
+    def _write(self, ids, embeddings, metadatas, documents, upsert: bool):
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self._embedding_function(documents)
+
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+
+        with self._lock:
+            dim = self._get_meta("dim")
+            if dim is None:
+                self._set_meta("dim", vectors.shape[1])
+            elif dim != vectors.shape[1]:
+                raise ValueError(f"Размерность {vectors.shape[1]} не совпадает с размерностью коллекции {dim}")
+            index = self._writable_index()
+
+            existing = self._existing_ids(ids)
+            if existing and not upsert:
+                logger.warning(f"{len(existing)} ID уже есть в коллекции {self.name}, add их пропускает")
+                keep = [i for i, doc_id in enumerate(ids) if doc_id not in existing]
+                ids, vectors = [ids[i] for i in keep], vectors[keep]
+                metadatas, documents = [metadatas[i] for i in keep], [documents[i] for i in keep]
+                if not ids:
+                    return
+
+            # Сначала журнал векторов, затем записи: без коммита записей хвост журнала отбрасывается
+            start = self._next_label()
+            labels = np.arange(start, start + len(ids), dtype=np.int64)
+            with open(self.path / "vectors.f32", 'ab') as f:
+                f.write(vectors.tobytes())
+
+            self._conn.executemany("DELETE FROM records WHERE id = ?", [(doc_id,) for doc_id in ids])
+            self._conn.executemany(
+                "INSERT INTO records (label, id, metadata, document) VALUES (?, ?, ?, ?)",
+                [
+                    (int(label), doc_id, json.dumps(metadata, ensure_ascii=False) if metadata is not None else None, document)
+                    for label, doc_id, metadata, document in zip(labels, ids, metadatas, documents)
+                ]
+            )
+            self._set_meta("next_label", start + len(ids), commit=False)
+            self._conn.commit()
+
+            if index is not None:
+                index.add_with_ids(vectors, labels)
+
+    def _build_index(self, live: List[int]):
+        """Строит индекс заново по активным векторам журнала"""
+        dim = self._get_meta("dim")
+        labels = np.array(live, dtype=np.int64)
+        vectors = np.ascontiguousarray(self._raw_vectors()[labels]) if len(labels) else None
+
+        if self.params.index_type == "hnsw":
+            index = self._faiss.index_factory(dim, f"IDMap2,HNSW{self.params.hnsw_m}", self._faiss.METRIC_INNER_PRODUCT)
+            self._faiss.downcast_index(index.index).hnsw.efConstruction = self.params.ef_construction
+        else:
+            if len(labels) < PQ_MIN_TRAIN:
+                logger.info(f"Векторов меньше {PQ_MIN_TRAIN}, IVF-PQ не обучается, поиск остается точным")
+                return None
+            nlist = max(1, min(self.params.nlist, len(labels) // IVF_POINTS_PER_CENTROID))
+            pq_m = max(m for m in range(1, self.params.pq_m + 1) if dim % m == 0)
+            index = self._faiss.index_factory(dim, f"IVF{nlist},PQ{pq_m}", self._faiss.METRIC_INNER_PRODUCT)
+            logger.info(f"Обучение IVF{nlist},PQ{pq_m} на {len(labels)} векторах")
+            index.train(vectors)
+
+        if len(labels):
+            index.add_with_ids(vectors, labels)
+        return index
+
+    # --- Загрузка и персистентность ---
+
+    def _writable_index(self):
+        """Индекс, в который можно добавлять (загружается целиком, а не через mmap)"""
+        if not self._writable:
+            self._index = self._load_index(writable=True)
+            self._writable = True
+
+        # HNSW строится сразу, IVF-PQ - только при flush, когда векторов хватает для обучения
+        if self._index is None and self.params.index_type == "hnsw" and self._get_meta("dim") is not None:
+            self._index = self._build_index(self._live_labels())
+        return self._index
+
+    def _load_index(self, writable: bool):
+        index_file = self.path / "index.faiss"
+        self._version = self._read_version()
+        if not index_file.exists():
+            return None
+
+        if writable:
+            index = self._faiss.read_index(str(index_file))
+            # Досыпаем векторы, записанные после последнего сохранения индекса
+            indexed, total = self._get_meta("indexed") or 0, self._next_label()
+            if total > indexed:
+                live = set(self._live_labels())
+                tail = np.array([label for label in range(indexed, total) if label in live], dtype=np.int64)
+                if len(tail):
+                    index.add_with_ids(np.ascontiguousarray(self._raw_vectors()[tail]), tail)
+            return index
+
+        try:
+            index = self._faiss.read_index(str(index_file), self._faiss.IO_FLAG_MMAP)
+        except RuntimeError:
+            index = self._faiss.read_index(str(index_file))
+        self._index = index
+        return index
+
+    def _reload_if_changed(self) -> None:
+        """Читающий процесс перечитывает индекс, сохраненный другим процессом"""
+        if not self._writable and self._read_version() != self._version:
+            self._index = self._load_index(writable=False)
+
+    def _raw_vectors(self) -> np.ndarray:
+        dim = self._get_meta("dim")
+        return np.memmap(self.path / "vectors.f32", dtype=np.float32, mode="r").reshape(-1, dim)
+
+    def _truncate_vectors(self) -> None:
+        """Отбрасывает хвост журнала векторов, записи для которого не были закоммичены"""
+        vectors_file = self.path / "vectors.f32"
+        dim = self._get_meta("dim")
+        if not vectors_file.exists() or dim is None:
+            return
+        expected = self._next_label() * dim * 4
+        if vectors_file.stat().st_size > expected:
+            with open(vectors_file, 'r+b') as f:
+                f.truncate(expected)
+            logger.warning(f"Журнал векторов коллекции {self.name} обрезан до последней завершенной записи")
+
+    def _bump_version(self) -> None:
+        tmp = self.path / "VERSION.tmp"
+        tmp.write_text(f"{os.getpid()}-{os.urandom(8).hex()}")
+        tmp.replace(self.path / "VERSION")
+        self._version = self._read_version()
+
+    def _read_version(self) -> Optional[str]:
+        try:
+            return (self.path / "VERSION").read_text()
+        except FileNotFoundError:
+            return None
+
+    # --- Записи ---
+
+    def _next_label(self) -> int:
+        return self._get_meta("next_label") or 0
+
+    def _get_meta(self, key: str) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: int, commit: bool = True) -> None:
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, int(value)))
+        if commit:
+            self._conn.commit()
+
+    def _live_labels(self) -> List[int]:
+        return [row[0] for row in self._conn.execute("SELECT label FROM records ORDER BY label")]
+
+    def _live_subset(self, labels: set) -> set:
+        alive = set()
+        for chunk in self._chunks(list(labels)):
+            placeholders = ",".join("?" * len(chunk))
+            alive.update(row[0] for row in self._conn.execute(f"SELECT label FROM records WHERE label IN ({placeholders})", chunk))
+        return alive
+
+    def _existing_ids(self, ids: List[str]) -> set:
+        existing = set()
+        for chunk in self._chunks(list(ids)):
+            placeholders = ",".join("?" * len(chunk))
+            existing.update(row[0] for row in self._conn.execute(f"SELECT id FROM records WHERE id IN ({placeholders})", chunk))
+        return existing
+
+    def _records_by_label(self, labels: set) -> Dict[int, tuple]:
+        records = {}
+        for chunk in self._chunks(list(labels)):
+            placeholders = ",".join("?" * len(chunk))
+            for row in self._conn.execute(f"SELECT label, id, metadata, document FROM records WHERE label IN ({placeholders})", chunk):
+                records[row[0]] = row[1:]
+        return records
+
+    @staticmethod
+    def _chunks(items: list, size: int = 500):
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class FaissVectorClient:
+    """
+    Клиент FAISS-хранилища с API, совместимым с используемой частью
+    chromadb.PersistentClient: коллекции лежат в {path}/faiss/{имя}/.
+    """
+
+    def __init__(self, path: str, params: Optional[FaissIndexParams] = None):
+        # faiss импортируется, только если выбрано это хранилище
+        startup_report.import_module("faiss", "retriever")
+        self.root = Path(path) / "faiss"
+        self.params = params or FaissIndexParams()
+        self._collections: Dict[str, FaissCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name: str, embedding_function=None) -> FaissCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = FaissCollection(self.root / name, name, embedding_function, self.params)
+                self._collections[name] = collection
+            elif embedding_function is not None:
+                collection._embedding_function = embedding_function
+            return collection
+
+    def get_collection(self, name: str, embedding_function=None) -> FaissCollection:
+        if name not in self._collections and not (self.root / name).exists():
+            raise CollectionNotFoundError(name)
+        return self.get_or_create_collection(name, embedding_function)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            collection = self._collections.pop(name, None)
+            if collection is not None:
+                collection.close()
+            shutil.rmtree(self.root / name, ignore_errors=True)
+
+    def list_collections(self) -> List[str]:
+        names = set(self._collections)
+        if self.root.exists():
+            names.update(p.name for p in self.root.iterdir() if p.is_dir())
+        return sorted(names)
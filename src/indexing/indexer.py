@@ -1,8 +1,23 @@
 from .chroma_manager import ChromaDBManager
 from .chroma_embedding_adapter import ChromaEmbeddingAdapter
+from .embedding_cache import CachedEmbeddingProvider
+from .embedding_batcher import MicroBatchingEmbeddingProvider
 from ..models.document import DocumentCollection
 from src.config.settings import EmbeddingProviderType
 from .embedding_factory import EmbeddingProviderFactory
+from .embedding_providers import BaseEmbeddingProvider
+from .collection_alias import CollectionAlias
+from .bulk_writer import BulkIndexWriter, IndexCheckpoint
+from .document_store import DocumentStore
+from .bm25_index import Bm25Index
+from .near_duplicates import NearDuplicateIndex
+from .vector_codec import compare_recall, default_candidates
+from ..parser.chunker import MarkdownChunker
+from src.config import settings
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+import threading
 import logging
 import os
 
@@ -15,67 +30,501 @@ class DocumentIndexer:
                  chroma_db_path: str = "storage/chroma_db",
                  collection_name: str = "documents",
                  **provider_kwargs):
-        
-        # Создаем провайдер эмбеддингов
-        self.embedding_provider = EmbeddingProviderFactory.create_provider(
-            embedding_provider, 
-            embedding_model,
-            **provider_kwargs
+        self.chroma_db_path = chroma_db_path
+        self.collection_name = collection_name
+        self.provider_kwargs = provider_kwargs
+        self._lock = threading.Lock()
+
+        # Если алиас уже переключен на версию с другой моделью - используем ее
+        alias = CollectionAlias(chroma_db_path, collection_name).read()
+        if alias:
+            embedding_provider = EmbeddingProviderType(alias["embedding_provider"])
+            embedding_model = alias["embedding_model"]
+            self._check_embedding_key(alias, embedding_provider, embedding_model)
+
+        self.embedding_provider_type = embedding_provider
+        self.embedding_model = embedding_model
+
+        # Создаем провайдер эмбеддингов. Для индексации векторы берутся
+        # из персистентного кэша, запросы идут напрямую
+        self.embedding_provider, self.index_embedding_provider = self._create_providers(
+            embedding_provider,
+            embedding_model
         )
-        
+
+        # Документы перед записью в индекс режутся на чанки по заголовкам
+        self.chunker = None
+        if settings.chunking_enabled:
+            self.chunker = MarkdownChunker(settings.chunk_max_tokens, settings.chunk_overlap_tokens)
+
         # Создаем адаптер для ChromaDB
         embedding_fn = ChromaEmbeddingAdapter(self.embedding_provider)
 
-        # Инициализируем ChromaDB
+        # Инициализируем ChromaDB. Если тексты лежат в хранилище документов,
+        # в векторной базе остаются только векторы и метаданные
         self.db_connector = ChromaDBManager(
             chroma_db_path,
             collection_name,
-            embedding_fn
+            embedding_fn,
+            store_texts=not settings.document_store_enabled
+        )
+        self._alias_mtime = self.db_connector.alias.mtime()
+
+    def _create_providers(self,
+                          provider_type: EmbeddingProviderType,
+                          model: str
+    ) -> Tuple[BaseEmbeddingProvider, BaseEmbeddingProvider]:
+        """
+        Создает провайдер эмбеддингов для запросов и обертку для индексации.
+
+        Запросы идут через микробатчер (одновременные запросы векторизуются
+        одним вызовом), индексация - через персистентный кэш.
+        """
+        provider = EmbeddingProviderFactory.create_provider(
+            provider_type,
+            model,
+            **self.provider_kwargs
         )
+
+        index_provider = provider
+        if settings.embedding_cache_enabled:
+            index_provider = CachedEmbeddingProvider(
+                provider,
+                model_key=self.model_key(provider_type, model),
+                db_path=settings.embedding_cache_path,
+                max_entries=settings.embedding_cache_max_entries
+            )
+
+        query_provider = provider
+        if settings.embedding_micro_batch_wait_ms > 0:
+            query_provider = MicroBatchingEmbeddingProvider(
+                provider,
+                max_wait_ms=settings.embedding_micro_batch_wait_ms,
+                max_batch=settings.embedding_micro_batch_max
+            )
+        return query_provider, index_provider
+
+    @staticmethod
+    def model_key(provider_type: EmbeddingProviderType, model: str) -> str:
+        """
+        Идентификатор модели в ключах кэшей и чекпоинта.
+
+        Для Ollama в ключ входит эндпоинт: /api/embed возвращает
+        нормализованные векторы, а /api/embeddings - нет.
+        """
+        if provider_type == EmbeddingProviderType.OLLAMA:
+            mode = "embed" if settings.ollama_embed_batched else "embeddings"
+            return f"{provider_type.value}:{model}:{mode}"
+        return f"{provider_type.value}:{model}"
+
+    def _check_embedding_key(self, alias: dict, provider_type: EmbeddingProviderType, model: str):
+        """
+        Проверяет, что версия построена теми же эмбеддингами, которыми векторизуются запросы.
+
+        Режимы Ollama дают векторы в разных пространствах (/api/embed
+        нормализует их, /api/embeddings - нет), поэтому версию, построенную
+        в другом режиме, обслуживать нельзя. Алиасы без ключа (записанные
+        до его появления) не проверяются.
+        """
+        built = alias.get("embedding_key")
+        expected = self.model_key(provider_type, model)
+        if built and built != expected:
+            message = (
+                f"Версия {alias['collection']} построена эмбеддингами {built}, а запросы векторизуются как {expected}. "
+                f"Выполните переиндексацию или верните прежнее значение ollama_embed_batched"
+            )
+            logger.error(message)
+            raise RuntimeError(message)
+
+    @staticmethod
+    def _close_provider(provider: BaseEmbeddingProvider):
+        """Останавливает фоновые потоки и закрывает кэш провайдера, который больше не используется"""
+        if isinstance(provider, (MicroBatchingEmbeddingProvider, CachedEmbeddingProvider)):
+            provider.close()
         
-    def index_documents(self, documents_json_path: str, force_reindex: bool = False):
+    def index_documents(self, documents_json_path: str, force_reindex: bool = False, incremental: bool = False):
+        """
+        Индексирует документы из documents.jsonl (или documents.json).
+
+        Документы читаются потоково и записываются батчами по index_batch_size.
+
+        Args:
+            documents_json_path: Путь к documents.jsonl или documents.json
+            force_reindex: Пересоздать индекс с нуля
+            incremental: Синхронизировать индекс с файлом: векторизуются только
+                новые и измененные документы, удаленные убираются из коллекции
+        """
         try:
             if not os.path.exists(documents_json_path):
                 raise FileNotFoundError(f"Файл {documents_json_path} не найден")
 
-            # Проверяем, есть ли уже документы в коллекции
+            if incremental and not force_reindex:
+                self.sync_documents(documents_json_path)
+                return
+
+            # Проверяем, есть ли уже документы в коллекции (незавершенную индексацию продолжаем)
             collection_info = self.db_connector.get_collection_info()
-            if collection_info["count"] > 0 and not force_reindex:
+            checkpoint = IndexCheckpoint.load(self._checkpoint_path())
+            resuming = checkpoint is not None and checkpoint.collection == collection_info["name"]
+            if collection_info["count"] > 0 and not force_reindex and not resuming:
                 print("Индексация уже существует. Используйте force_reindex=True для переиндексации.")
                 return
             
             if force_reindex:
-                self.clear_index()
-
-            documents = DocumentCollection.from_json_file(documents_json_path)
+                # Пересборка в теневой коллекции: живой индекс не очищается
+                self.reindex_with_new_model(documents_json_path)
+                return
 
-            self.db_connector.add_documents(documents)
+            # Тексты нужны раньше векторов: записанное сразу доступно поиску
+            self._build_document_store(documents_json_path, self.db_connector.collection.name)
+            total = self._write_all(self.db_connector, documents_json_path, self.index_embedding_provider)
+            self._build_lexical_index(documents_json_path)
+            self._build_near_duplicate_index(documents_json_path)
 
-            logger.info(f"Индексация завершена. Добавлено {len(documents.documents)} документов.")
+            logger.info(f"Индексация завершена. Добавлено {total} документов.")
+            self._log_cache_stats()
         except Exception as e:
             logger.error(f"Ошибка при индексации документов: {e}")
             raise
+
+    def sync_documents(self, documents_json_path: str):
+        """
+        Инкрементально синхронизирует коллекцию с файлом документов через upsert/delete.
+
+        Порядок сохраняет тексты всех записей коллекции в хранилище документов
+        на любом шаге: сначала удаляются исчезнувшие записи, затем хранилище
+        пересобирается по новому файлу, и только потом записываются новые векторы.
+        """
+        try:
+            indexed = self.db_connector.get_content_hashes()
+            current_ids = {str(doc.id) for doc in self._records(documents_json_path)}
+            removed_ids = [doc_id for doc_id in indexed if doc_id not in current_ids]
+            self.db_connector.delete_documents(removed_ids)
+            self._build_document_store(documents_json_path, self.db_connector.collection.name)
+            changed = 0
+
+            with self.index_embedding_provider.progress(settings.show_progress):
+                for batch in DocumentCollection.iter_batches(documents_json_path, settings.index_batch_size):
+                    batch = self._chunk(batch)
+                    batch_changed = DocumentCollection(documents=[
+                        doc for doc in batch.documents
+                        if indexed.get(str(doc.id)) != doc.content_hash()
+                    ])
+                    self.db_connector.upsert_documents(batch_changed, self.index_embedding_provider)
+                    changed += len(batch_changed.documents)
+
+            self.db_connector.flush()
+            self._build_lexical_index(documents_json_path)
+            self._build_near_duplicate_index(documents_json_path)
+
+            logger.info(
+                f"Синхронизация завершена. Обновлено: {changed}, "
+                f"удалено: {len(removed_ids)}, без изменений: {len(current_ids) - changed}"
+            )
+            self._log_cache_stats()
+        except Exception as e:
+            logger.error(f"Ошибка при синхронизации индекса: {e}")
+            raise
+
+    def _chunk(self, documents: DocumentCollection) -> DocumentCollection:
+        """Разбивает документы батча на чанки, если чанкинг включен"""
+        if not self.chunker:
+            return documents
+        return DocumentCollection(documents=[
+            chunk for doc in documents.documents for chunk in self.chunker.chunk(doc)
+        ])
+
+    def _log_cache_stats(self):
+        if isinstance(self.index_embedding_provider, CachedEmbeddingProvider):
+            logger.info(f"Кэш эмбеддингов: {self.index_embedding_provider.stats()}")
         
-    def reindex_with_new_model(self, new_model: str):
-        # Переиндексация с новой моделью
-        pass
-        
+    def reindex_with_new_model(self,
+                               documents_json_path: str,
+                               new_model: Optional[str] = None,
+                               new_provider: Optional[EmbeddingProviderType] = None):
+        """
+        Переиндексация без простоя.
+
+        Документы индексируются в новую версию коллекции (при необходимости
+        другой моделью), пока запросы продолжают идти в текущую. После
+        проверки новой версии алиас атомарно переключается на нее, а старые
+        версии удаляются (последние index_keep_versions сохраняются).
+
+        Args:
+            documents_json_path: Путь к documents.jsonl или documents.json
+            new_model: Новая модель эмбеддингов (по умолчанию - текущая)
+            new_provider: Новый провайдер эмбеддингов (по умолчанию - текущий)
+        """
+        provider_type = new_provider or self.embedding_provider_type
+        model = new_model or self.embedding_model
+
+        created = (provider_type, model) != (self.embedding_provider_type, self.embedding_model)
+        if created:
+            provider, index_provider = self._create_providers(provider_type, model)
+        else:
+            provider, index_provider = self.embedding_provider, self.index_embedding_provider
+
+        try:
+            # Незавершенная переиндексация того же файла той же моделью продолжается
+            version = self.db_connector.alias.new_version_name()
+            checkpoint = IndexCheckpoint.load(self._checkpoint_path())
+            if checkpoint and checkpoint.collection in self.db_connector.list_versions() and checkpoint.matches(
+                    IndexCheckpoint.for_source(checkpoint.collection, documents_json_path, self.model_key(provider_type, model),
+                                           settings.index_batch_size, self._chunking_key())):
+                version = checkpoint.collection
+            logger.info(f"Переиндексация в {version} моделью {provider_type.value}:{model}")
+
+            shadow = ChromaDBManager(
+                self.chroma_db_path,
+                version,
+                ChromaEmbeddingAdapter(provider),
+                use_alias=False,
+                store_texts=not settings.document_store_enabled
+            )
+            try:
+                self._build_document_store(documents_json_path, version)
+                self._write_all(shadow, documents_json_path, index_provider, self.model_key(provider_type, model))
+            except Exception as e:
+                # Теневая коллекция и чекпоинт остаются для продолжения
+                logger.error(f"Переиндексация прервана, текущий индекс не изменен: {e}")
+                raise
+
+            try:
+                self._validate(shadow, documents_json_path)
+            except Exception as e:
+                logger.error(f"Новая версия не прошла проверку, текущий индекс не изменен: {e}")
+                shadow.delete_collection()
+                DocumentStore.for_collection(settings.document_store_path, version).unlink(missing_ok=True)
+                raise
+
+            # Индекс BM25 и кластеры дубликатов (ID стабильны, поэтому они подходят
+            # и для старой версии). Хранилище текстов у новой версии свое и уже собрано
+            self._build_lexical_index(documents_json_path)
+            self._build_near_duplicate_index(documents_json_path)
+        except Exception:
+            # Созданные для новой модели провайдеры не должны оставлять потоки и соединения
+            if created:
+                self._close_provider(provider)
+                self._close_provider(index_provider)
+            raise
+
+        # Переключение: алиас для других процессов, затем этот процесс
+        self.db_connector.alias.switch(version, provider_type.value, model, self.model_key(provider_type, model))
+        with self._lock:
+            if created:
+                self._close_provider(self.embedding_provider)
+                self._close_provider(self.index_embedding_provider)
+            self.embedding_provider_type = provider_type
+            self.embedding_model = model
+            self.embedding_provider = provider
+            self.index_embedding_provider = index_provider
+            self.db_connector.collection = shadow.collection
+            self._alias_mtime = self.db_connector.alias.mtime()
+
+        self._garbage_collect()
+        self._log_cache_stats()
+        logger.info(f"Переиндексация завершена, активная версия: {version}")
+
+    def refresh(self) -> bool:
+        """
+        Подхватывает переключение алиаса, сделанное другим процессом.
+
+        Проверка - один stat файла алиаса, поэтому вызывается на каждый запрос.
+
+        Returns:
+            True, если активная версия коллекции сменилась
+        """
+        mtime = self.db_connector.alias.mtime()
+        if mtime == self._alias_mtime:
+            return False
+
+        with self._lock:
+            if mtime == self._alias_mtime:
+                return False
+
+            alias = self.db_connector.alias.read()
+            if not alias:
+                return False
+
+            provider_type = EmbeddingProviderType(alias["embedding_provider"])
+            model = alias["embedding_model"]
+            try:
+                self._check_embedding_key(alias, provider_type, model)
+            except RuntimeError:
+                # Ошибка уже в логе: продолжаем отвечать по текущей версии
+                self._alias_mtime = mtime
+                return False
+
+            if (provider_type, model) != (self.embedding_provider_type, self.embedding_model):
+                previous = (self.embedding_provider, self.index_embedding_provider)
+                self.embedding_provider, self.index_embedding_provider = self._create_providers(provider_type, model)
+                for provider in previous:
+                    self._close_provider(provider)
+                self.embedding_provider_type = provider_type
+                self.embedding_model = model
+
+            self.db_connector.collection = self.db_connector.client.get_collection(
+                name=alias["collection"],
+                embedding_function=ChromaEmbeddingAdapter(self.embedding_provider)
+            )
+            self._alias_mtime = mtime
+            logger.info(f"Индекс переключен на версию {alias['collection']}")
+            return True
+
+    def _write_all(self,
+                   db_connector: ChromaDBManager,
+                   documents_json_path: str,
+                   embedding_provider: BaseEmbeddingProvider,
+                   model_key: Optional[str] = None) -> int:
+        """Конвейерно записывает все документы файла в коллекцию, возвращает число документов"""
+        writer = BulkIndexWriter(
+            db_connector,
+            embedding_provider,
+            self._checkpoint_path(),
+            self._chunk,
+            model_key or self.model_key(self.embedding_provider_type, self.embedding_model),
+            self._chunking_key()
+        )
+        with embedding_provider.progress(settings.show_progress):
+            stats = writer.run(documents_json_path, settings.index_batch_size)
+        db_connector.flush()
+        return stats["documents"]
+
+    def _build_document_store(self, documents_json_path: str, collection: str):
+        """Пересобирает хранилище текстов версии коллекции из файла документов (без эмбеддингов - быстро)"""
+        if not settings.document_store_enabled:
+            return
+        DocumentStore.build(
+            DocumentStore.for_collection(settings.document_store_path, collection),
+            self._records(documents_json_path),
+            compress=settings.document_store_compression
+        )
+
+    def _build_lexical_index(self, documents_json_path: str):
+        """Пересобирает индекс BM25 по тем же записям, что и векторный индекс"""
+        if not settings.hybrid_search_enabled:
+            return
+        Bm25Index.build(settings.bm25_index_path, self._records(documents_json_path))
+
+    def _build_near_duplicate_index(self, documents_json_path: str):
+        """Пересобирает кластеры почти одинаковых документов по полным текстам (без чанкинга)"""
+        if not settings.near_duplicate_enabled:
+            return
+        documents = (
+            doc
+            for batch in DocumentCollection.iter_batches(documents_json_path, settings.index_batch_size)
+            for doc in batch.documents
+        )
+        NearDuplicateIndex.build(
+            settings.near_duplicate_index_path,
+            documents,
+            threshold=settings.near_duplicate_threshold,
+            shingle_size=settings.near_duplicate_shingle_size
+        )
+
+    def _records(self, documents_json_path: str):
+        """Записи индекса (документы или чанки) в порядке файла"""
+        for batch in DocumentCollection.iter_batches(documents_json_path, settings.index_batch_size):
+            yield from self._chunk(batch).documents
+
+    def _chunking_key(self) -> str:
+        """Параметры чанкинга для проверки чекпоинта: с другими параметрами записи не совпадут"""
+        if not self.chunker:
+            return "off"
+        return f"{settings.chunk_max_tokens}:{settings.chunk_overlap_tokens}"
+
+    def _garbage_collect(self):
+        """Удаляет старые версии коллекции и их хранилища текстов, недописанную по чекпоинту версию оставляет"""
+        checkpoint = IndexCheckpoint.load(self._checkpoint_path())
+        in_progress = [checkpoint.collection] if checkpoint else []
+        for name in self.db_connector.garbage_collect(settings.index_keep_versions, in_progress):
+            DocumentStore.for_collection(settings.document_store_path, name).unlink(missing_ok=True)
+
+    def _checkpoint_path(self) -> Path:
+        """Чекпоинт записи - один на логическую коллекцию"""
+        return Path(self.chroma_db_path) / f"{self.collection_name}.checkpoint.json"
+
+    def _validate(self, db_connector: ChromaDBManager, documents_json_path: str):
+        """
+        Проверяет новую версию перед переключением.
+
+        Число записей должно совпадать с числом документов (чанков) в файле,
+        а поиск по тексту первых документов должен находить их самих.
+        """
+        expected = 0
+        samples = []
+        for batch in DocumentCollection.iter_batches(documents_json_path, settings.index_batch_size):
+            chunks = self._chunk(batch).documents
+            expected += len(chunks)
+            samples.extend(chunks[:max(0, 3 - len(samples))])
+
+        count = db_connector.collection.count()
+        if count != expected:
+            raise RuntimeError(f"В новой версии {count} записей, ожидалось {expected}")
+
+        for doc in samples:
+            results = db_connector.collection.query(
+                query_texts=[f"{doc.title}\n{doc.text}"],
+                n_results=min(5, count),
+                include=[]
+            )
+            if str(doc.id) not in results["ids"][0]:
+                raise RuntimeError(f"Контрольный поиск не нашел документ {doc.id} в новой версии")
+
+        logger.info(f"Новая версия прошла проверку: {count} записей")
+
+    def compare_compression(self, k: int = 10, n_queries: int = 200, rescore_factor: int = 0) -> List[dict]:
+        """
+        Сравнивает recall@k сжатых представлений векторов с несжатым индексом.
+
+        Векторы берутся из текущей коллекции (она должна хранить их в полной
+        точности: ChromaDB, float32 или с пересчетом скоров), результат
+        помогает выбрать самое компактное представление с приемлемым recall.
+
+        Returns:
+            Строки отчета compare_recall, от меньших представлений к большим
+        """
+        data = self.db_connector.collection.get(include=["embeddings"])
+        vectors = np.asarray(data["embeddings"], dtype=np.float32)
+        if not len(vectors):
+            raise RuntimeError("В коллекции нет векторов для сравнения")
+
+        report = compare_recall(vectors, default_candidates(vectors.shape[1]), k, n_queries, rescore_factor)
+        for row in report:
+            logger.info(
+                f"{row['codec']:>20}: {row['bytes_per_vector']} байт/вектор (x{row['compression']}), "
+                f"recall@{k} {row[f'recall@{k}']}, {row['ms_per_query']} мс/запрос"
+            )
+        return report
+
     def clear_index(self):
-        """Очищает существующий индекс"""
+        """
+        Очищает существующий индекс.
+
+        Живая коллекция не удаляется: создается пустая версия и алиас
+        переключается на нее, старые версии убираются как после переиндексации.
+        """
         try:
-            collection_name = self.db_connector.collection.name
-            embedding_function = self.db_connector.collection._embedding_function
-            
-            # Удаляем коллекцию
-            self.db_connector.client.delete_collection(collection_name)
-            
-            # Пересоздаем пустую коллекцию
-            self.db_connector.collection = self.db_connector.client.get_or_create_collection(
-                name=collection_name,
-                embedding_function=embedding_function
+            version = self.db_connector.alias.new_version_name()
+            empty = ChromaDBManager(
+                self.chroma_db_path,
+                version,
+                ChromaEmbeddingAdapter(self.embedding_provider),
+                use_alias=False,
+                store_texts=not settings.document_store_enabled
             )
-            
-            logger.info("Индекс очищен и пересоздан")
+            self.db_connector.alias.switch(
+                version,
+                self.embedding_provider_type.value,
+                self.embedding_model,
+                self.model_key(self.embedding_provider_type, self.embedding_model)
+            )
+            with self._lock:
+                self.db_connector.collection = empty.collection
+                self._alias_mtime = self.db_connector.alias.mtime()
+
+            self._garbage_collect()
+            logger.info(f"Индекс очищен, активная версия: {version}")
         except Exception as e:
             logger.error(f"Ошибка при очистке индекса: {e}")
             raise
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Кластеризация почти одинаковых документов (MinHash + LSH)
+"""
+from ..models.document import Document
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import logging
+import os
+import re
+import zlib
+
+logger = logging.getLogger(__name__)
+
+NUM_PERMUTATIONS = 128
+# 16 полос по 8 строк: пары с похожестью ~0.7 и выше почти всегда становятся кандидатами
+LSH_BANDS = 16
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+WORD_PATTERN = re.compile(r"\w+")
+
+_rng = np.random.default_rng(20240601)
+# Параметры хэш-функций (a * x + b) mod p фиксированы, чтобы сигнатуры были воспроизводимы
+_A = _rng.integers(1, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, MERSENNE_PRIME, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(text: str, size: int = 5) -> np.ndarray:
+    """Хэши (crc32) словесных n-грамм текста без учета регистра"""
+    words = WORD_PATTERN.findall(text.lower().replace("ё", "е"))
+    if len(words) <= size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64)
+
+
+def minhash(hashes: np.ndarray) -> np.ndarray:
+    """MinHash-сигнатура множества хэшей (NUM_PERMUTATIONS значений uint32)"""
+    if not len(hashes):
+        return np.full(NUM_PERMUTATIONS, MAX_HASH, dtype=np.uint32)
+    signature = np.full(NUM_PERMUTATIONS, MAX_HASH, dtype=np.uint64)
+    # Блоками, чтобы не держать матрицу перестановки x шинглы для длинных документов
+    for start in range(0, len(hashes), 4096):
+        block = hashes[start:start + 4096]
+        # a < 2^61, x < 2^32: произведение берется по модулю 2^64, затем mod p - как в datasketch
+        permuted = ((_A[:, None] * block[None, :] + _B[:, None]) % MERSENNE_PRIME) & MAX_HASH
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Соответствие ID документа -> ID кластера почти одинаковых документов.
+
+    Строится при индексации по полным текстам исходных документов (не
+    чанков): для каждого документа считается MinHash-сигнатура по словесным
+    шинглам, кандидаты в дубликаты находятся через LSH по полосам
+    сигнатуры, а пары с оценкой похожести Жаккара не ниже threshold
+    объединяются в кластеры. ID кластера - наименьший ID документа в нем.
+    Хранятся только документы, у которых есть дубликаты. Файл .npz
+    заменяется атомарно, читатели переоткрывают его по mtime.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with np.load(self.path) as data:
+            self.clusters: Dict[int, int] = dict(zip(data["ids"].tolist(), data["clusters"].tolist()))
+        logger.debug(f"Открыт индекс дубликатов {self.path}: {len(self.clusters)} документов в кластерах")
+
+    def cluster_of(self, doc_id: int) -> Optional[int]:
+        """ID кластера документа или None, если дубликатов у него нет"""
+        return self.clusters.get(doc_id)
+
+    def __len__(self) -> int:
+        return len(self.clusters)
+
+    @staticmethod
+    def mtime(path: str | Path) -> Optional[float]:
+        """Время изменения файла индекса или None, если его нет"""
+        try:
+            return os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def build(path: str | Path, documents: Iterable[Document], threshold: float = 0.9, shingle_size: int = 5) -> int:
+        """
+        Кластеризует документы и атомарно заменяет файл индекса.
+
+        Returns:
+            Количество кластеров
+        """
+        ids: List[int] = []
+        signatures: List[np.ndarray] = []
+        for doc in documents:
+            hashes = shingles(doc.text, shingle_size)
+            # Документы без слов не считаются дубликатами друг друга
+            if len(hashes):
+                ids.append(doc.id)
+                signatures.append(minhash(hashes))
+
+        parent = list(range(len(ids)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        if ids:
+            matrix = np.stack(signatures)
+            rows = NUM_PERMUTATIONS // LSH_BANDS
+            for band in range(LSH_BANDS):
+                buckets: Dict[bytes, List[int]] = {}
+                for i, key in enumerate(matrix[:, band * rows:(band + 1) * rows]):
+                    buckets.setdefault(key.tobytes(), []).append(i)
+
+                for bucket in buckets.values():
+                    for position, j in enumerate(bucket[1:], 1):
+                        for i in bucket[:position]:
+                            if find(i) == find(j):
+                                break
+                            # Доля совпавших значений сигнатуры - оценка похожести Жаккара
+                            if np.mean(matrix[i] == matrix[j]) >= threshold:
+                                parent[find(j)] = find(i)
+                                break
+
+        groups: Dict[int, List[int]] = {}
+        for i in range(len(ids)):
+            groups.setdefault(find(i), []).append(i)
+
+        members, clusters = [], []
+        for group in groups.values():
+            if len(group) < 2:
+                continue
+            cluster_id = min(ids[i] for i in group)
+            members.extend(ids[i] for i in group)
+            clusters.extend([cluster_id] * len(group))
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp.npz")
+        np.savez(tmp_path, ids=np.array(members, dtype=np.int64), clusters=np.array(clusters, dtype=np.int64))
+        tmp_path.replace(path)
+
+        n_clusters = len(set(clusters))
+        logger.info(f"Индекс дубликатов {path} собран: {len(ids)} документов, {n_clusters} кластеров ({len(members)} документов в них)")
+        return n_clusters
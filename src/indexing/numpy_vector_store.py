@@ -0,0 +1,467 @@
+"""
+Векторное хранилище в памяти процесса: точный поиск на NumPy
+"""
+from .vector_codec import VectorCodec, normalize, search, top_k
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import json
+import logging
+import os
+import shutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Сколько сегментов журнала накапливать до автоматического уплотнения
+MAX_WAL_SEGMENTS = 64
+
+
+class CollectionNotFoundError(KeyError):
+    """Коллекция не найдена"""
+
+
+class _Snapshot:
+    """
+    Неизменяемое состояние коллекции: читатели берут ссылку на него без блокировок.
+
+    codes/scales - векторы в представлении кодека, full - исходные
+    нормализованные float32 (хранятся только для пересчета скоров и PCA).
+    Пустая коллекция хранит None вместо матриц.
+    """
+    __slots__ = ("ids", "codes", "scales", "full", "dim", "metadatas", "documents", "positions")
+
+    def __init__(self,
+                 ids: List[str],
+                 codes: Optional[np.ndarray],
+                 scales: Optional[np.ndarray],
+                 full: Optional[np.ndarray],
+                 dim: Optional[int],
+                 metadatas: List[Optional[dict]],
+                 documents: List[Optional[str]]):
+        self.ids = ids
+        self.codes = codes
+        self.scales = scales
+        self.full = full
+        self.dim = dim
+        self.metadatas = metadatas
+        self.documents = documents
+        self.positions = {doc_id: i for i, doc_id in enumerate(ids)}
+
+
+class NumpyCollection:
+    """
+    Коллекция с точным поиском по нормализованным векторам.
+
+    Повторяет используемую в проекте часть API коллекции ChromaDB (add,
+    upsert, delete, get, query, count), поэтому подключается за
+    ChromaDBManager без изменений в индексаторе и ретривере.
+
+    Векторы нормализуются по L2 и хранятся непрерывной матрицей в
+    представлении кодека (float32, float16 или int8 с масштабами, при
+    необходимости уменьшенной размерности). Поиск - умножение матрицы на
+    запросы и argpartition для top-k, порядок при равных скорах
+    детерминирован (по позиции). Если задан rescore_factor, лучшие
+    кандидаты пересчитываются по исходным векторам float32, которые лежат
+    на диске и читаются через mmap. Расстояние возвращается как квадрат L2
+    между нормализованными векторами (2 - 2cos), то есть в той же шкале,
+    что и у ChromaDB по умолчанию.
+
+    На диске: vectors.npy (+ scales.npy, full.npy, codec.npz) открываются
+    через mmap, records.json хранит ID, метаданные и тексты. Записи
+    дописываются сегментами журнала в wal/ (в полной точности), compact()
+    сливает их в базовые файлы и обучает PCA. Файл VERSION меняется при
+    каждой записи - по нему другие процессы перечитывают коллекцию.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 name: str,
+                 embedding_function=None,
+                 codec: Optional[VectorCodec] = None,
+                 rescore_factor: int = 0):
+        self.path = Path(path)
+        self.name = name
+        self.metadata = None
+        self._embedding_function = embedding_function
+        self.codec = self._resolve_codec(codec or VectorCodec())
+        self.rescore_factor = 0 if self.codec.is_identity else rescore_factor
+        # Полные векторы нужны для пересчета скоров и для обучения PCA
+        self.keep_full = bool(self.rescore_factor) or not self.codec.fitted or (self.path / "full.npy").exists()
+        self._lock = threading.Lock()
+        self._version = None
+        self._state = self._load()
+
+    # --- API коллекции ---
+
+    def count(self) -> int:
+        return len(self._current().ids)
+
+    def add(self, ids: List[str], embeddings=None, metadatas=None, documents=None):
+        self._write(ids, embeddings, metadatas, documents, upsert=False)
+
+    def upsert(self, ids: List[str], embeddings=None, metadatas=None, documents=None):
+        self._write(ids, embeddings, metadatas, documents, upsert=True)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            state = self._state
+            deleted = set(ids)
+            keep = [i for i, doc_id in enumerate(state.ids) if doc_id not in deleted]
+            self._state = self._select(state, keep)
+            self._append_wal({"op": "delete", "ids": list(ids)}, None)
+
+    def get(self, ids: Optional[List[str]] = None, include: Sequence[str] = ("metadatas", "documents")) -> Dict[str, Any]:
+        state = self._current()
+        positions = list(range(len(state.ids))) if ids is None else [state.positions[i] for i in ids if i in state.positions]
+        result = {"ids": [state.ids[p] for p in positions]}
+        if "metadatas" in include:
+            result["metadatas"] = [state.metadatas[p] for p in positions]
+        if "documents" in include:
+            result["documents"] = [state.documents[p] for p in positions]
+        if "embeddings" in include:
+            result["embeddings"] = self._embeddings(state, positions).tolist()
+        return result
+
+    def query(self,
+              query_texts: Optional[List[str]] = None,
+              query_embeddings=None,
+              n_results: int = 10,
+              include: Sequence[str] = ("metadatas", "documents", "distances")) -> Dict[str, Any]:
+        """Поиск top-k для одного или нескольких запросов"""
+        if query_embeddings is None:
+            query_embeddings = self._embedding_function(query_texts)
+
+        state = self._current()
+        queries = normalize(np.asarray(query_embeddings, dtype=np.float32))
+        if not state.ids:
+            positions, scores = np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0))
+        elif state.codes is None:
+            # PCA еще не обучена - точный поиск по полным векторам
+            positions, scores = top_k(queries @ np.asarray(state.full).T, n_results)
+        else:
+            positions, scores = search(self.codec, state.codes, state.scales, queries, n_results, state.full, self.rescore_factor)
+
+        result = {"ids": [[state.ids[p] for p in row] for row in positions]}
+        if "distances" in include:
+            result["distances"] = [(2.0 - 2.0 * row).tolist() for row in scores]
+        if "metadatas" in include:
+            result["metadatas"] = [[state.metadatas[p] for p in row] for row in positions]
+        if "documents" in include:
+            result["documents"] = [[state.documents[p] for p in row] for row in positions]
+        return result
+
+    def distances(self, ids: List[str], query_embedding) -> Dict[str, float]:
+        """
+        Расстояния от запроса до заданных записей в той же шкале, что и у query.
+
+        Считаются в представлении хранилища (нормализация, кодек и пересчет
+        по полным векторам - как при поиске), поэтому сравнимы с выдачей query.
+        """
+        state = self._current()
+        positions = [state.positions[i] for i in ids if i in state.positions]
+        if not positions:
+            return {}
+
+        query = normalize(np.asarray([query_embedding], dtype=np.float32))
+        if state.codes is None or (state.full is not None and self.rescore_factor):
+            scores = np.asarray(state.full[positions], dtype=np.float32) @ query[0]
+        else:
+            scales = state.scales[positions] if state.scales is not None else None
+            scores = self.codec.scores(np.asarray(state.codes[positions]), scales, self.codec.project(query))[0]
+        return {state.ids[p]: float(2.0 - 2.0 * score) for p, score in zip(positions, scores)}
+
+    def compact(self) -> None:
+        """Сливает журнал в базовые файлы (обучая PCA, если нужно) и переоткрывает матрицы через mmap"""
+        with self._lock:
+            state = self._state
+            self.path.mkdir(parents=True, exist_ok=True)
+
+            if not self.codec.fitted and state.full is not None:
+                self.codec.fit(np.asarray(state.full))
+                codes, scales = self.codec.encode(np.asarray(state.full))
+                state = _Snapshot(state.ids, codes, scales, state.full, state.dim, state.metadatas, state.documents)
+
+            arrays = {"vectors": state.codes, "scales": state.scales, "full": state.full}
+            for name, array in arrays.items():
+                if array is not None:
+                    np.save(self.path / f"{name}.tmp.npy", np.ascontiguousarray(array))
+            self.codec.save(self.path / "codec.tmp.npz")
+            tmp_records = self.path / "records.json.tmp"
+            with open(tmp_records, 'w', encoding='utf-8') as f:
+                json.dump({"ids": state.ids, "dim": state.dim, "metadatas": state.metadatas, "documents": state.documents}, f, ensure_ascii=False)
+
+            for name, array in arrays.items():
+                target = self.path / f"{name}.npy"
+                if array is not None:
+                    (self.path / f"{name}.tmp.npy").replace(target)
+                else:
+                    target.unlink(missing_ok=True)
+            (self.path / "codec.tmp.npz").replace(self.path / "codec.npz")
+            tmp_records.replace(self.path / "records.json")
+            shutil.rmtree(self.path / "wal", ignore_errors=True)
+            self._bump_version()
+
+            self._state = _Snapshot(
+                state.ids,
+                self._mmap("vectors"),
+                self._mmap("scales"),
+                self._mmap("full"),
+                state.dim,
+                state.metadatas,
+                state.documents
+            )
+            logger.debug(f"Коллекция {self.name} уплотнена: {len(state.ids)} векторов ({self.codec.describe()})")
+
+    # --- Запись ---
+
+    def _write(self, ids, embeddings, metadatas, documents, upsert: bool):
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self._embedding_function(documents)
+
+        vectors = normalize(np.asarray(embeddings, dtype=np.float32))
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        documents = list(documents) if documents is not None else [None] * len(ids)
+
+        with self._lock:
+            state = self._apply(self._state, list(ids), vectors, metadatas, documents, upsert)
+            self._state = state
+            self._append_wal(
+                {"op": "upsert" if upsert else "add", "ids": list(ids), "metadatas": metadatas, "documents": documents},
+                vectors
+            )
+
+        if self._wal_segments() > MAX_WAL_SEGMENTS:
+            self.compact()
+
+    def _apply(self, state: _Snapshot, ids, vectors, metadatas, documents, upsert: bool) -> _Snapshot:
+        """Новое состояние после добавления/обновления записей (vectors - полной точности)"""
+        if state.dim is not None and state.dim != vectors.shape[1]:
+            raise ValueError(f"Размерность {vectors.shape[1]} не совпадает с размерностью коллекции {state.dim}")
+
+        if not upsert:
+            existing = [doc_id for doc_id in ids if doc_id in state.positions]
+            if existing:
+                logger.warning(f"{len(existing)} ID уже есть в коллекции {self.name}, add их пропускает")
+                keep = [i for i, doc_id in enumerate(ids) if doc_id not in state.positions]
+                ids, vectors = [ids[i] for i in keep], vectors[keep]
+                metadatas, documents = [metadatas[i] for i in keep], [documents[i] for i in keep]
+
+        new_ids = list(state.ids)
+        new_metadatas = list(state.metadatas)
+        new_documents = list(state.documents)
+        updated, appended = [], []
+        for i, doc_id in enumerate(ids):
+            position = state.positions.get(doc_id)
+            if position is None:
+                appended.append(i)
+                new_ids.append(doc_id)
+                new_metadatas.append(metadatas[i])
+                new_documents.append(documents[i])
+            else:
+                updated.append((position, i))
+                new_metadatas[position] = metadatas[i]
+                new_documents[position] = documents[i]
+
+        codes, scales = self.codec.encode(vectors) if self.codec.fitted else (None, None)
+        return _Snapshot(
+            new_ids,
+            self._merge(state.codes, codes, updated, appended),
+            self._merge(state.scales, scales, updated, appended),
+            self._merge(state.full, vectors, updated, appended) if self.keep_full else None,
+            vectors.shape[1],
+            new_metadatas,
+            new_documents
+        )
+
+    @staticmethod
+    def _merge(base: Optional[np.ndarray], rows: Optional[np.ndarray], updated: List[Tuple[int, int]], appended: List[int]) -> Optional[np.ndarray]:
+        """Матрица с замененными и дописанными строками (исходная, возможно mmap, не меняется)"""
+        if rows is None:
+            return base
+        if base is None or len(base) == 0:
+            return rows[appended]
+        matrix = np.array(base) if updated else base
+        for position, i in updated:
+            matrix[position] = rows[i]
+        if appended:
+            matrix = np.concatenate([matrix, rows[appended]])
+        return matrix
+
+    @staticmethod
+    def _select(state: _Snapshot, keep: List[int]) -> _Snapshot:
+        def rows(matrix):
+            return matrix[keep] if matrix is not None else None
+
+        return _Snapshot(
+            [state.ids[i] for i in keep],
+            rows(state.codes),
+            rows(state.scales),
+            rows(state.full),
+            state.dim,
+            [state.metadatas[i] for i in keep],
+            [state.documents[i] for i in keep]
+        )
+
+    def _embeddings(self, state: _Snapshot, positions: List[int]) -> np.ndarray:
+        """Векторы записей: полные, если они хранятся, иначе восстановленные из кодов"""
+        if state.full is not None:
+            return np.asarray(state.full[positions], dtype=np.float32)
+        if state.codes is None:
+            return np.empty((0, state.dim or 0), dtype=np.float32)
+        vectors = np.asarray(state.codes[positions], dtype=np.float32)
+        if state.scales is not None:
+            vectors *= state.scales[positions][:, None]
+        return vectors
+
+    # --- Персистентность ---
+
+    def _resolve_codec(self, codec: VectorCodec) -> VectorCodec:
+        """Кодек сохраненной коллекции важнее настроек: смена представления требует переиндексации"""
+        codec_file = self.path / "codec.npz"
+        if not codec_file.exists():
+            return codec
+        saved = VectorCodec.load(codec_file)
+        if saved.describe() != codec.describe():
+            logger.warning(
+                f"Коллекция {self.name} сохранена как {saved.describe()}, а в настройках {codec.describe()}: "
+                f"используется сохраненное представление, для смены нужна переиндексация"
+            )
+        return saved
+
+    def _append_wal(self, record: dict, vectors: Optional[np.ndarray]) -> None:
+        """Дописывает сегмент журнала: сначала векторы, затем JSON (его наличие = сегмент полный)"""
+        wal_dir = self.path / "wal"
+        wal_dir.mkdir(parents=True, exist_ok=True)
+        segment = self._wal_segments() + 1
+        if vectors is not None:
+            np.save(wal_dir / f"{segment:06d}.npy", vectors)
+        tmp = wal_dir / f"{segment:06d}.json.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        tmp.replace(wal_dir / f"{segment:06d}.json")
+        self._bump_version()
+
+    def _wal_segments(self) -> int:
+        wal_dir = self.path / "wal"
+        if not wal_dir.exists():
+            return 0
+        return len(list(wal_dir.glob("*.json")))
+
+    def _bump_version(self) -> None:
+        version_file = self.path / "VERSION"
+        tmp = self.path / "VERSION.tmp"
+        tmp.write_text(f"{os.getpid()}-{os.urandom(8).hex()}")
+        tmp.replace(version_file)
+        self._version = self._read_version()
+
+    def _read_version(self) -> Optional[str]:
+        try:
+            return (self.path / "VERSION").read_text()
+        except FileNotFoundError:
+            return None
+
+    def _current(self) -> _Snapshot:
+        """Текущее состояние; перечитывается, если коллекцию изменил другой процесс"""
+        version = self._read_version()
+        if version != self._version:
+            with self._lock:
+                if self._read_version() != self._version:
+                    self._state = self._load()
+        return self._state
+
+    def _mmap(self, name: str) -> Optional[np.ndarray]:
+        path = self.path / f"{name}.npy"
+        return np.load(path, mmap_mode="r") if path.exists() else None
+
+    def _load(self) -> _Snapshot:
+        """Читает базовые файлы (матрицы через mmap) и применяет журнал"""
+        self._version = self._read_version()
+        records_file = self.path / "records.json"
+
+        if records_file.exists():
+            with open(records_file, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            state = _Snapshot(
+                records["ids"],
+                self._mmap("vectors"),
+                self._mmap("scales"),
+                self._mmap("full"),
+                records.get("dim"),
+                records["metadatas"],
+                records["documents"]
+            )
+        else:
+            state = _Snapshot([], None, None, None, None, [], [])
+
+        wal_dir = self.path / "wal"
+        if wal_dir.exists():
+            for record_file in sorted(wal_dir.glob("*.json")):
+                with open(record_file, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+                if record["op"] == "delete":
+                    deleted = set(record["ids"])
+                    state = self._select(state, [i for i, doc_id in enumerate(state.ids) if doc_id not in deleted])
+                else:
+                    vectors = np.load(record_file.with_suffix(".npy"))
+                    state = self._apply(state, record["ids"], vectors, record["metadatas"], record["documents"], upsert=True)
+        return state
+
+
+class NumpyVectorClient:
+    """
+    Клиент NumPy-хранилища с API, совместимым с используемой частью
+    chromadb.PersistentClient: коллекции лежат в {path}/numpy/{имя}/.
+
+    Attributes:
+        dtype, reduce_dim, reduction: Представление векторов новых коллекций (см. VectorCodec)
+        rescore_factor: Пересчет скоров по полным векторам (0 - без пересчета)
+    """
+
+    def __init__(self,
+                 path: str,
+                 dtype: str = "float32",
+                 reduce_dim: Optional[int] = None,
+                 reduction: str = "truncate",
+                 rescore_factor: int = 0):
+        self.root = Path(path) / "numpy"
+        self.dtype = dtype
+        self.reduce_dim = reduce_dim
+        self.reduction = reduction
+        self.rescore_factor = rescore_factor
+        self._collections: Dict[str, NumpyCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, name: str, embedding_function=None) -> NumpyCollection:
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = NumpyCollection(
+                    self.root / name,
+                    name,
+                    embedding_function,
+                    VectorCodec(self.dtype, self.reduce_dim, self.reduction),
+                    self.rescore_factor
+                )
+                self._collections[name] = collection
+            elif embedding_function is not None:
+                collection._embedding_function = embedding_function
+            return collection
+
+    def get_collection(self, name: str, embedding_function=None) -> NumpyCollection:
+        if name not in self._collections and not (self.root / name).exists():
+            raise CollectionNotFoundError(name)
+        return self.get_or_create_collection(name, embedding_function)
+
+    def delete_collection(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+            shutil.rmtree(self.root / name, ignore_errors=True)
+
+    def list_collections(self) -> List[str]:
+        names = set(self._collections)
+        if self.root.exists():
+            names.update(p.name for p in self.root.iterdir() if p.is_dir())
+        return sorted(names)
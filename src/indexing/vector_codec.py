@@ -0,0 +1,255 @@
+"""
+Сжатие векторов индекса: float16/int8 и уменьшение размерности
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Сколько векторов брать для обучения PCA
+PCA_FIT_SAMPLE = 20000
+# Блок строк при подсчете скоров по сжатой матрице
+SCORE_BLOCK_ROWS = 65536
+
+
+class VectorCodec:
+    """
+    Представление нормализованных векторов в индексе.
+
+    Вектор сначала уменьшается до dim измерений (отбрасыванием хвоста -
+    подходит для Matryoshka-моделей вроде Qwen3-Embedding - или проекцией
+    PCA) и нормализуется заново, затем хранится как float32, float16 или
+    int8 с масштабом на вектор. Запрос проходит ту же проекцию, а скор
+    считается прямо по сжатой матрице.
+
+    Attributes:
+        dtype: "float32", "float16" или "int8"
+        dim: Размерность после уменьшения (None - без уменьшения)
+        reduction: "truncate" или "pca"
+    """
+
+    def __init__(self, dtype: str = "float32", dim: Optional[int] = None, reduction: str = "truncate"):
+        if dtype not in ("float32", "float16", "int8"):
+            raise ValueError(f"Неподдерживаемый тип векторов: {dtype}")
+        if reduction not in ("truncate", "pca"):
+            raise ValueError(f"Неподдерживаемый способ уменьшения размерности: {reduction}")
+        self.dtype = dtype
+        self.dim = dim
+        self.reduction = reduction
+        self.mean: Optional[np.ndarray] = None
+        self.components: Optional[np.ndarray] = None
+
+    @property
+    def fitted(self) -> bool:
+        """Готов ли кодек (PCA нужно сначала обучить)"""
+        return self.reduction != "pca" or self.dim is None or self.components is not None
+
+    @property
+    def is_identity(self) -> bool:
+        return self.dtype == "float32" and self.dim is None
+
+    def fit(self, vectors: np.ndarray) -> 'VectorCodec':
+        """Обучает PCA на выборке векторов (для остальных режимов ничего не делает)"""
+        if self.reduction != "pca" or self.dim is None:
+            return self
+
+        if len(vectors) > PCA_FIT_SAMPLE:
+            sample = np.random.default_rng(0).choice(len(vectors), PCA_FIT_SAMPLE, replace=False)
+            vectors = vectors[np.sort(sample)]
+        vectors = np.asarray(vectors, dtype=np.float32)
+
+        self.mean = vectors.mean(axis=0)
+        centered = vectors - self.mean
+        # Собственные векторы ковариации (D x D) дешевле SVD всей выборки
+        eigenvalues, eigenvectors = np.linalg.eigh(centered.T @ centered)
+        order = np.argsort(eigenvalues)[::-1][:self.dim]
+        self.components = np.ascontiguousarray(eigenvectors[:, order].T, dtype=np.float32)
+
+        explained = eigenvalues[order].sum() / max(eigenvalues.sum(), 1e-12)
+        logger.info(f"PCA до {self.dim} измерений обучена на {len(vectors)} векторах, объясненная дисперсия {explained:.3f}")
+        return self
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """Уменьшает размерность и заново нормализует (float32)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            return vectors
+        if self.reduction == "truncate":
+            reduced = vectors[:, :self.dim]
+        else:
+            reduced = (vectors - self.mean) @ self.components.T
+        return normalize(reduced)
+
+    def encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Коды для хранения и масштабы (только для int8)"""
+        projected = self.project(vectors)
+        if self.dtype == "int8":
+            scales = np.abs(projected).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.round(projected / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return projected.astype(self.dtype), None
+
+    def scores(self, codes: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """Скоры (B, N) запросов, уже прошедших project, по сжатой матрице"""
+        if codes.dtype == np.float32:
+            return queries @ codes.T
+
+        # float16/int8 умножаются блоками во float32: для них нет BLAS
+        scores = np.empty((len(queries), codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            block_scores = queries @ block.T
+            if scales is not None:
+                block_scores *= scales[start:start + SCORE_BLOCK_ROWS]
+            scores[:, start:start + SCORE_BLOCK_ROWS] = block_scores
+        return scores
+
+    def bytes_per_vector(self, full_dim: int) -> int:
+        dim = self.dim or full_dim
+        return dim * np.dtype(self.dtype).itemsize + (4 if self.dtype == "int8" else 0)
+
+    def describe(self) -> str:
+        if self.dim is None:
+            return self.dtype
+        return f"{self.dtype}/{self.reduction}{self.dim}"
+
+    def save(self, path: Path) -> None:
+        np.savez(
+            path,
+            dtype=self.dtype,
+            dim=-1 if self.dim is None else self.dim,
+            reduction=self.reduction,
+            mean=self.mean if self.mean is not None else np.empty(0, dtype=np.float32),
+            components=self.components if self.components is not None else np.empty((0, 0), dtype=np.float32)
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> 'VectorCodec':
+        with np.load(path) as data:
+            dim = int(data["dim"])
+            codec = cls(str(data["dtype"]), None if dim < 0 else dim, str(data["reduction"]))
+            if data["components"].size:
+                codec.mean = data["mean"]
+                codec.components = data["components"]
+        return codec
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Нормализация строк по L2 (нулевые векторы остаются нулевыми)"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Позиции и скоры top-k по строкам, по убыванию скора; при равенстве - по позиции"""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64), np.empty((len(scores), 0), dtype=np.float32)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.lexsort((top, -top_scores), axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def search(codec: VectorCodec,
+           codes: np.ndarray,
+           scales: Optional[np.ndarray],
+           queries: np.ndarray,
+           k: int,
+           full: Optional[np.ndarray] = None,
+           rescore_factor: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Поиск по сжатой матрице с необязательным точным пересчетом.
+
+    Args:
+        codec: Кодек, которым сжаты codes
+        codes, scales: Сжатая матрица и масштабы int8
+        queries: Нормализованные запросы полной размерности
+        k: Сколько результатов вернуть
+        full: Исходные векторы для пересчета скоров (можно через mmap)
+        rescore_factor: Сколько кандидатов на результат пересчитывать (0 - без пересчета)
+
+    Returns:
+        Позиции и скоры (B, k)
+    """
+    scores = codec.scores(codes, scales, codec.project(queries))
+    if full is None or not rescore_factor:
+        return top_k(scores, k)
+
+    candidates, _ = top_k(scores, k * rescore_factor)
+    exact = np.einsum("bd,bkd->bk", queries, np.asarray(full[candidates.ravel()], dtype=np.float32).reshape(*candidates.shape, -1))
+    positions, exact_scores = top_k(exact, k)
+    return np.take_along_axis(candidates, positions, axis=1), exact_scores
+
+
+def compare_recall(vectors: np.ndarray,
+                   codecs: Dict[str, VectorCodec],
+                   k: int = 10,
+                   n_queries: int = 200,
+                   rescore_factor: int = 0) -> List[dict]:
+    """
+    Сравнивает recall@k сжатых представлений с точным поиском по float32.
+
+    Запросами служат случайные (с фиксированным seed) векторы самого
+    индекса, сам запрос из выдачи исключается.
+
+    Args:
+        vectors: Нормализованные векторы полной точности
+        codecs: Кандидаты {имя: кодек}
+        k: Глубина выдачи
+        n_queries: Число запросов
+        rescore_factor: Пересчет по полным векторам (0 - без пересчета)
+
+    Returns:
+        Строки {codec, bytes_per_vector, compression, recall, ms_per_query}, от меньших к большим
+    """
+    vectors = normalize(np.asarray(vectors, dtype=np.float32))
+    rng = np.random.default_rng(0)
+    query_positions = np.sort(rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False))
+    queries = vectors[query_positions]
+
+    def without_self(positions: np.ndarray) -> List[set]:
+        return [set(row[row != own][:k].tolist()) for row, own in zip(positions, query_positions)]
+
+    truth = without_self(top_k(queries @ vectors.T, k + 1)[0])
+    full_bytes = vectors.shape[1] * 4
+
+    report = []
+    for name, codec in codecs.items():
+        codec.fit(vectors)
+        codes, scales = codec.encode(vectors)
+        start = time.perf_counter()
+        positions, _ = search(codec, codes, scales, queries, k + 1, vectors if rescore_factor else None, rescore_factor)
+        ms_per_query = (time.perf_counter() - start) * 1000 / len(queries)
+        found = without_self(positions)
+
+        recall = float(np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)]))
+        size = codec.bytes_per_vector(vectors.shape[1])
+        report.append({
+            "codec": name,
+            "bytes_per_vector": size,
+            "compression": round(full_bytes / size, 2),
+            f"recall@{k}": round(recall, 4),
+            "ms_per_query": round(ms_per_query, 3)
+        })
+
+    report.sort(key=lambda row: row["bytes_per_vector"])
+    return report
+
+
+def default_candidates(full_dim: int) -> Dict[str, VectorCodec]:
+    """Стандартный набор представлений для сравнения"""
+    candidates = {"float32": VectorCodec("float32"), "float16": VectorCodec("float16"), "int8": VectorCodec("int8")}
+    for dim in (full_dim // 2, full_dim // 4):
+        if dim < 8:
+            continue
+        for reduction in ("truncate", "pca"):
+            for dtype in ("float16", "int8"):
+                codec = VectorCodec(dtype, dim, reduction)
+                candidates[codec.describe()] = codec
+    return candidates
@@ -1,10 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, TYPE_CHECKING
 from dataclasses import dataclass
-from gigachat import GigaChat
-from gigachat.models import Chat, Messages, ChatCompletion
+from src.config.startup import startup_report
 import logging
 import requests
+import httpx
+
+if TYPE_CHECKING:
+    from gigachat.models import Messages, ChatCompletion
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +28,18 @@ class BaseLLMClient(ABC):
     def chat(self, model: str, messages, **kwargs):
         pass
 
+    @abstractmethod
+    async def achat(self, model: str, messages, **kwargs):
+        """Асинхронный вариант chat, не блокирующий цикл событий"""
+        pass
+
 class OllamaClient(BaseLLMClient):
     """Клиент для работы с Ollama"""
 
     def __init__(self, base_url:str, timeout: int = 30):
         self.base_url = base_url
         self.timeout = timeout
+        self._async_client: Optional[httpx.AsyncClient] = None
 
 
     def chat(
@@ -42,16 +51,7 @@ class OllamaClient(BaseLLMClient):
         """Основной метод для чата с моделью"""
         
         try:
-            # Формируем payload для Ollama API
-            payload = {
-                "model": model,
-                "messages": messages,
-                "stream": False,
-                "options": {
-                    **kwargs
-                }
-            }
-
+            payload = self._build_payload(model, messages, **kwargs)
             logger.debug(f"Отправка запроса к ollama: {payload}")
 
             response = requests.post(
@@ -64,18 +64,7 @@ class OllamaClient(BaseLLMClient):
             result = response.json()
             logger.debug(f"Получен ответ от ollama: {result}")
 
-            if result.get("done"):
-                return LLLResponse(
-                    content=result.get("message", {}).get("content", "").strip(),
-                    model=result.get("model", model),
-                    load_duration=result.get("load_duration"),
-                    eval_duration=result.get("eval_duration"),
-                    total_duration=result.get("total_duration"),
-                    prompt_eval_count=result.get("prompt_eval_count"),
-                    eval_count=result.get("eval_count")
-                )
-            else:
-                raise RuntimeError("Ollama response is not done")
+            return self._parse_response(result, model)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Ошибка при отправке запроса к ollama: {e}")
@@ -84,6 +73,74 @@ class OllamaClient(BaseLLMClient):
             logger.error(f"Неизвестная ошибка: {e}")
             raise e
 
+    async def achat(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        **kwargs
+    ) -> LLLResponse:
+        """Асинхронный метод для чата с моделью через пул соединений httpx"""
+
+        try:
+            payload = self._build_payload(model, messages, **kwargs)
+            logger.debug(f"Отправка асинхронного запроса к ollama: {payload}")
+
+            response = await self._get_async_client().post(
+                f"{self.base_url}/api/chat",
+                json=payload
+            )
+
+            response.raise_for_status()
+            result = response.json()
+            logger.debug(f"Получен ответ от ollama: {result}")
+
+            return self._parse_response(result, model)
+
+        except httpx.HTTPError as e:
+            logger.error(f"Ошибка при отправке запроса к ollama: {e}")
+            raise e
+        except Exception as e:
+            logger.error(f"Неизвестная ошибка: {e}")
+            raise e
+
+    async def aclose(self):
+        """Закрывает асинхронный HTTP-клиент"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Лениво создает асинхронный HTTP-клиент (создается внутри работающего цикла событий)"""
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(timeout=self.timeout)
+        return self._async_client
+
+    def _build_payload(self, model: str, messages: List[Dict[str, str]], **kwargs) -> dict:
+        """Формирует payload для Ollama API"""
+        return {
+            "model": model,
+            "messages": messages,
+            "stream": False,
+            "options": {
+                **kwargs
+            }
+        }
+
+    def _parse_response(self, result: dict, model: str) -> LLLResponse:
+        """Преобразует ответ Ollama API в LLLResponse"""
+        if result.get("done"):
+            return LLLResponse(
+                content=result.get("message", {}).get("content", "").strip(),
+                model=result.get("model", model),
+                load_duration=result.get("load_duration"),
+                eval_duration=result.get("eval_duration"),
+                total_duration=result.get("total_duration"),
+                prompt_eval_count=result.get("prompt_eval_count"),
+                eval_count=result.get("eval_count")
+            )
+        else:
+            raise RuntimeError("Ollama response is not done")
+
 
     def is_healthy(self) -> bool:
         """Проверка доступности сервера"""
@@ -100,9 +157,11 @@ class OllamaClient(BaseLLMClient):
             logger.exception(f"Произошла ошибка при запросе к {self.base_url}: {e}")
             return False
 
-class GigaClient:
+class GigaClient(BaseLLMClient):
     def __init__(self, credentials):
-        self.giga = GigaChat(
+        gigachat = startup_report.import_module("gigachat", "llm")
+        self._chat_payload = startup_report.import_module("gigachat.models", "llm").Chat
+        self.giga = gigachat.GigaChat(
             credentials=credentials,
             scope="GIGACHAT_API_PERS"
         )
@@ -110,12 +169,12 @@ class GigaClient:
     def chat(
         self,
         model,
-        messages: List[Messages],
+        messages: List['Messages'],
         **kwargs
     ) -> LLLResponse:
         
         try:
-            payload = Chat(
+            payload = self._chat_payload(
                 messages=messages,
                 model=model,
                 **kwargs
@@ -123,15 +182,40 @@ class GigaClient:
 
             response = self.giga.chat(payload)
 
-            return LLLResponse(
-                    content=response.choices[0].message.content,
-                    model=response.model,
-                    prompt_eval_count=response.usage.prompt_tokens,
-                    eval_count=response.usage.completion_tokens
-                )
+            return self._parse_response(response)
         
         except Exception as e:
             logger.error(f"Неизвестная ошибка: {e}")
             raise e
 
-            
\ No newline at end of file
+    async def achat(
+        self,
+        model,
+        messages: List['Messages'],
+        **kwargs
+    ) -> LLLResponse:
+        """Асинхронный запрос к GigaChat"""
+
+        try:
+            payload = self._chat_payload(
+                messages=messages,
+                model=model,
+                **kwargs
+            )
+
+            response = await self.giga.achat(payload)
+
+            return self._parse_response(response)
+
+        except Exception as e:
+            logger.error(f"Неизвестная ошибка: {e}")
+            raise e
+
+    def _parse_response(self, response: 'ChatCompletion') -> LLLResponse:
+        """Преобразует ответ GigaChat в LLLResponse"""
+        return LLLResponse(
+                content=response.choices[0].message.content,
+                model=response.model,
+                prompt_eval_count=response.usage.prompt_tokens,
+                eval_count=response.usage.completion_tokens
+            )
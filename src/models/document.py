@@ -1,7 +1,8 @@
 from pydantic import BaseModel, Field, HttpUrl, ConfigDict
 from typing import Optional
 from datetime import datetime
-from typing import List
+from typing import Iterator, List
+import hashlib
 import json
 
 class Document(BaseModel):
@@ -9,12 +10,15 @@ class Document(BaseModel):
     Представление одного документа в системе.
     
     Attributes:
-        id: Уникальный индекс документа (позиция в FAISS)
+        id: Стабильный идентификатор документа (хэш пути исходного файла)
         title: Заголовок документа
         url: URL страницы документа
         text: Основной текст документа
         filename: Имя исходного файла (для отладки)
         created_at: Время индексации
+        parent_id: ID исходного документа, если это чанк
+        chunk_index: Порядковый номер чанка в исходном документе
+        section: Заголовок раздела (##/###), к которому относится чанк
     """
 
     model_config = ConfigDict(
@@ -22,12 +26,15 @@ class Document(BaseModel):
         validate_assignment=True
     )
 
-    id: int = Field(..., ge=0, description="Индекс в FAISS (начинается с 0)")
+    id: int = Field(..., ge=0, description="Стабильный идентификатор документа")
     title: str = Field(..., min_length=1, description="Заголовок документа")
     url: str = Field(..., description="URL страницы документа")
     text: str = Field(..., min_length=1, description="Основной текст документа")
     filename: Optional[str] = Field(None, min_length=1, description="Имя исходного MD файла")
     created_at: Optional[datetime] = Field(default_factory=datetime.now)
+    parent_id: Optional[int] = Field(None, ge=0, description="ID исходного документа для чанка")
+    chunk_index: Optional[int] = Field(None, ge=0, description="Номер чанка в исходном документе")
+    section: Optional[str] = Field(None, description="Заголовок раздела чанка")
 
     def to_dict(self) -> dict:
         d = {
@@ -39,13 +46,31 @@ class Document(BaseModel):
             'created_at': self.created_at.isoformat()
         }
 
+        # ChromaDB не принимает None в метаданных
+        for key in ('parent_id', 'chunk_index', 'section'):
+            value = getattr(self, key)
+            if value is not None:
+                d[key] = value
+
         return d
 
+    @property
+    def root_id(self) -> int:
+        """ID исходного документа (для чанка - ID родителя)"""
+        return self.parent_id if self.parent_id is not None else self.id
+
+    def content_hash(self) -> str:
+        """Хэш индексируемого содержимого (без времени создания)"""
+        content = f"{self.title}\n{self.url}\n{self.text}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
 class DocumentCollection(BaseModel):
     """
     Коллекция всех документов с метаданными.
     
-    Это то, что сохраняется в documents.json
+    Это то, что сохраняется в documents.json. Парсер пишет документы потоково
+    в documents.jsonl (по документу на строку), для чтения без загрузки всей
+    коллекции в память используются iter_file и iter_batches.
 
     Attributes:
         documents: Список документов
@@ -81,3 +106,29 @@ class DocumentCollection(BaseModel):
         
         documents = [Document(**doc_data) for doc_data in data['documents']]
         return cls(documents=documents)
+
+    @classmethod
+    def iter_file(cls, file_path: str) -> Iterator[Document]:
+        """Потоково читает документы из JSONL файла (JSON файл загружается целиком)"""
+        if not str(file_path).endswith(".jsonl"):
+            yield from cls.from_json_file(file_path).documents
+            return
+
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield Document.model_validate_json(line)
+
+    @classmethod
+    def iter_batches(cls, file_path: str, batch_size: int, skip: int = 0) -> Iterator['DocumentCollection']:
+        """Потоково читает документы батчами по batch_size, пропуская первые skip документов"""
+        batch = cls()
+        for position, doc in enumerate(cls.iter_file(file_path)):
+            if position < skip:
+                continue
+            batch.add_document(doc)
+            if len(batch.documents) >= batch_size:
+                yield batch
+                batch = cls()
+        if batch.documents:
+            yield batch
@@ -14,6 +14,7 @@ class VectorSearchResult:
     """Результат векторного поиска"""
     metrics:  StageMetrics
     results: List[SearchResult] = field(default_factory=list)
+    query_embedding_cached: bool = False
 
 @dataclass
 class RerankingResult:
@@ -21,6 +22,16 @@ class RerankingResult:
     metrics: StageMetrics
     results: List[SearchResult] = field(default_factory=list)
     total_tokens_used: Optional[int] = None
+    cache_hits: int = 0             # Оценок из кэша реранкера
+
+@dataclass
+class RerankDecision:
+    """Решение адаптивной политики реранкинга"""
+    skipped: bool
+    reason: str
+    candidates: int                 # Сколько кандидатов отдано реранкеру
+    total_candidates: int           # Сколько кандидатов нашел ретривер
+    margin: Optional[float] = None  # Отрыв лучшего документа по векторному расстоянию
 
 @dataclass
 class GenerationResult:
@@ -36,6 +47,13 @@ class GenerationResult:
     eval_duration: int
     model_used: str
 
+@dataclass
+class AnswerCacheHit:
+    """Ответ взят из семантического кэша"""
+    cached_query: str               # Запрос, для которого ответ был построен
+    similarity: float               # Косинусная близость запросов
+    age: float                      # Возраст ответа в секундах
+
 @dataclass
 class GeneralResults:
     total_tokens: int = None
@@ -47,10 +65,14 @@ class RAGPipeline:
     query: str
     retriever: Optional[VectorSearchResult] = None
     reranking: Optional[RerankingResult] = None
+    rerank_decision: Optional[RerankDecision] = None
     generation: Optional[GenerationResult] = None
     general: Optional[GeneralResults] = None
+    answer_cache: Optional[AnswerCacheHit] = None
 
     def update_general_results(self):
         self.general = GeneralResults()
-        self.general.total_duration = self.retriever.metrics.duration + (self.retriever.metrics.duration or 0) + self.generation.metrics.duration
-        self.general.total_tokens = (self.reranking.total_tokens_used or 0) + self.generation.total_tokens
+        rerank_duration = self.reranking.metrics.duration if self.reranking else None
+        rerank_tokens = self.reranking.total_tokens_used if self.reranking else None
+        self.general.total_duration = self.retriever.metrics.duration + (rerank_duration or 0) + self.generation.metrics.duration
+        self.general.total_tokens = (rerank_tokens or 0) + self.generation.total_tokens
@@ -1,13 +1,54 @@
 from .document import Document
 from dataclasses import dataclass
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
+
+@dataclass(frozen=True, slots=True)
+class DocumentRef:
+    """
+    Легкое представление найденного документа (только для чтения).
+
+    Создается из метаданных поиска без валидации pydantic. Текст не
+    запрашивается у векторной базы при поиске и подгружается батчем через
+    DocumentRetriever.hydrate только для кандидатов, дошедших до
+    реранкинга или генерации.
+
+    Attributes:
+        id: ID документа (для схлопнутых чанков - ID исходного документа)
+        title: Заголовок документа
+        url: URL страницы документа
+        source_ids: ID записей в векторной базе, из которых собирается текст
+        source_chunks: Номера чанков записей source_ids (для схлопнутых чанков)
+        text: Текст документа, None пока не загружен
+        duplicate_urls: URL почти одинаковых документов, схлопнутых в этот
+    """
+    id: int
+    title: str
+    url: str
+    source_ids: Tuple[str, ...] = ()
+    source_chunks: Tuple[Optional[int], ...] = ()
+    text: Optional[str] = None
+    parent_id: Optional[int] = None
+    chunk_index: Optional[int] = None
+    section: Optional[str] = None
+    duplicate_urls: Tuple[str, ...] = ()
+
+    @property
+    def root_id(self) -> int:
+        """ID исходного документа (для чанка - ID родителя)"""
+        return self.parent_id if self.parent_id is not None else self.id
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.text is not None
 
 @dataclass
 class SearchResult:
-    document: Document
+    document: Union[Document, DocumentRef]
     vector_score: float
     rerank_score: Optional[int | float] = None
     final_score: Optional[float] = None
+    lexical_score: Optional[float] = None    # BM25, если документ найден лексическим поиском
+    fusion_score: Optional[float] = None     # Reciprocal rank fusion векторного и лексического поиска
 
     def __post_init__(self):
         self.update_final_score()
@@ -16,6 +57,8 @@ class SearchResult:
         """Пересчитывает final_score на основе доступных скоров"""
         if self.rerank_score is not None:
             self.final_score = self.rerank_score
+        elif self.fusion_score is not None:
+            self.final_score = self.fusion_score
         else:
             # Используем векторный скор (distance, меньше = лучше)
             self.final_score = max(0, 1 - self.vector_score)
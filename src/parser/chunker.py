@@ -0,0 +1,139 @@
+"""
+Разбиение документов на чанки по заголовкам Markdown.
+
+Документ делится на разделы по заголовкам ## и ###. Небольшие соседние
+разделы объединяются, а слишком длинные режутся по абзацам (и по словам,
+если абзац сам больше бюджета) с перекрытием. Размер считается в словах -
+приближение числа токенов без зависимости от токенизатора модели.
+"""
+
+import re
+from typing import List, Optional, Tuple
+from ..models.document import Document
+from .md_parser import stable_document_id
+import logging
+
+logger = logging.getLogger(__name__)
+
+HEADING_PATTERN = re.compile(r'^(#{2,3})\s+(.+)$', re.MULTILINE)
+
+
+class MarkdownChunker:
+    """
+    Чанкер документов, полученных от MarkdownParser.
+
+    Attributes:
+        max_tokens: Максимальный размер чанка (в словах)
+        overlap_tokens: Перекрытие между соседними частями длинного раздела
+    """
+
+    def __init__(self, max_tokens: int = 512, overlap_tokens: int = 64):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("Перекрытие чанков должно быть меньше их размера")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def chunk(self, document: Document) -> List[Document]:
+        """
+        Разбивает документ на чанки.
+
+        Документ, который целиком укладывается в бюджет, возвращается как есть.
+        Чанки наследуют заголовок, URL и имя файла документа и ссылаются на
+        него через parent_id.
+        """
+        if self._count_tokens(document.text) <= self.max_tokens:
+            return [document]
+
+        pieces: List[Tuple[Optional[str], str]] = []
+        for section, text in self._merge_small(self._split_sections(document.text)):
+            pieces.extend((section, piece) for piece in self._split_by_budget(text))
+
+        chunks = [
+            Document(
+                id=stable_document_id(f"{document.id}#{i}"),
+                title=document.title,
+                url=document.url,
+                text=text,
+                filename=document.filename,
+                created_at=document.created_at,
+                parent_id=document.id,
+                chunk_index=i,
+                section=section
+            )
+            for i, (section, text) in enumerate(pieces)
+        ]
+        logger.debug(f"Документ {document.id} разбит на {len(chunks)} чанков")
+        return chunks
+
+    def _split_sections(self, text: str) -> List[Tuple[Optional[str], str]]:
+        """Делит текст на разделы по заголовкам ##/### (заголовок остается в тексте раздела)"""
+        matches = list(HEADING_PATTERN.finditer(text))
+        if not matches:
+            return [(None, text)]
+
+        sections = []
+        preamble = text[:matches[0].start()].strip()
+        if preamble:
+            sections.append((None, preamble))
+
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            section_text = text[match.start():end].strip()
+            if section_text:
+                sections.append((match.group(2).strip(), section_text))
+        return sections
+
+    def _merge_small(self, sections: List[Tuple[Optional[str], str]]) -> List[Tuple[Optional[str], str]]:
+        """Объединяет соседние разделы, пока они укладываются в бюджет"""
+        merged = []
+        for section, text in sections:
+            if merged and self._count_tokens(merged[-1][1]) + self._count_tokens(text) <= self.max_tokens:
+                prev_section, prev_text = merged[-1]
+                merged[-1] = (prev_section or section, f"{prev_text}\n\n{text}")
+            else:
+                merged.append((section, text))
+        return merged
+
+    def _split_by_budget(self, text: str) -> List[str]:
+        """Режет длинный раздел на части по абзацам с перекрытием"""
+        if self._count_tokens(text) <= self.max_tokens:
+            return [text]
+
+        # Абзацы длиннее бюджета режутся на окна по словам, окна уже перекрываются
+        units: List[Tuple[str, bool]] = []
+        step = self.max_tokens - self.overlap_tokens
+        for paragraph in re.split(r'\n\s*\n', text):
+            words = paragraph.split()
+            if len(words) <= self.max_tokens:
+                units.append((paragraph.strip(), False))
+            else:
+                starts = range(0, len(words) - self.overlap_tokens, step)
+                units.extend((" ".join(words[i:i + self.max_tokens]), i > 0) for i in starts)
+
+        pieces = []
+        current: List[str] = []
+        current_tokens = 0
+        for unit, is_continuation in units:
+            unit_tokens = self._count_tokens(unit)
+            if current and current_tokens + unit_tokens > self.max_tokens:
+                pieces.append("\n\n".join(current))
+                overlap = "" if is_continuation else self._tail(pieces[-1], min(self.overlap_tokens, self.max_tokens - unit_tokens))
+                current = [overlap] if overlap else []
+                current_tokens = self._count_tokens(overlap)
+            current.append(unit)
+            current_tokens += unit_tokens
+
+        if current:
+            pieces.append("\n\n".join(current))
+        return pieces
+
+    @staticmethod
+    def _tail(text: str, n_tokens: int) -> str:
+        """Последние n_tokens слов текста"""
+        if n_tokens <= 0:
+            return ""
+        return " ".join(text.split()[-n_tokens:])
+
+    @staticmethod
+    def _count_tokens(text: str) -> int:
+        return len(text.split())
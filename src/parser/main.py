@@ -1,8 +1,12 @@
-from src.parser.md_parser import MarkdownParser
+from src.parser.md_parser import MarkdownParser, stable_document_id
+from src.parser.manifest import IngestManifest
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-from ..models.document import DocumentCollection
+from typing import Optional, Tuple
+import argparse
 import logging
 import json
+import os
 
 # Настройка логирования
 logging.basicConfig(
@@ -11,38 +15,139 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def main():
+
+def parse_file(file_path: Path, doc_id: int) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Парсит один файл в процессе-воркере.
+
+    Returns:
+        (JSON строка документа, None) или (None, текст ошибки)
+    """
+    try:
+        document = MarkdownParser().parse(file_path, doc_id)
+        return document.model_dump_json(), None
+    except Exception as e:
+        return None, str(e)
+
+
+def copy_unchanged(previous_file: Path, unchanged_ids: set, out) -> set:
+    """Переносит неизмененные документы из прошлого результата построчно, возвращает их ID"""
+    copied = set()
+    if not previous_file.exists():
+        return copied
+
+    with open(previous_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            doc_id = json.loads(line)["id"]
+            if doc_id in unchanged_ids and doc_id not in copied:
+                out.write(line if line.endswith("\n") else line + "\n")
+                copied.add(doc_id)
+    return copied
+
+
+def main(incremental: bool = False, workers: Optional[int] = None):
     # Пути
     data_dir = Path('data')
     storage_dir = Path("storage/documents")
-    output_file = storage_dir / "documents.json"
+    output_file = storage_dir / "documents.jsonl"
+    manifest_file = storage_dir / "manifest.json"
 
     storage_dir.mkdir(parents=True, exist_ok=True)
 
     parser = MarkdownParser()
+    workers = workers or os.cpu_count() or 1
 
-    collection = DocumentCollection()
-    doc_id = 0
+    # В инкрементальном режиме неизмененные файлы берутся из прошлого результата
+    manifest = IngestManifest.load(manifest_file) if incremental else IngestManifest()
+    new_manifest = IngestManifest()
 
-    logger.info(f"Начинаем парсинг файлов из {data_dir}")
+    logger.info(f"Начинаем {'инкрементальный ' if incremental else ''}парсинг файлов из {data_dir} ({workers} процессов)")
 
-    # Парсим файлы
-    for file_path in data_dir.iterdir():
+    files = {}
+    unchanged = {}
+    current_keys = set()
+    errors = []
+    for file_path in sorted(data_dir.iterdir()):
         if not parser.supports_extension(file_path.suffix):
             continue
+
+        key = file_path.relative_to(data_dir).as_posix()
+        current_keys.add(key)
+        doc_id = stable_document_id(key)
+        if doc_id in files or doc_id in unchanged:
+            raise RuntimeError(f"Коллизия стабильных ID документов: {key}")
+
         try:
-            document = parser.parse(file_path, doc_id)
-            collection.add_document(document)
-            doc_id += 1
-        except Exception as e:
-            logger.error(f"Ошибка при парсинге файла {file_path.name}: {e}")
+            file_hash = IngestManifest.file_hash(file_path)
+        except OSError as e:
+            logger.error(f"Ошибка при чтении файла {key}: {e}")
+            errors.append(key)
             continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(collection.to_json_dict(), f, ensure_ascii=False, indent=2)
 
-    logger.info(f"Парсинг завершен. Обработано {len(collection.documents)} документов")
+        if manifest.is_unchanged(key, file_hash):
+            unchanged[doc_id] = (key, file_hash)
+        else:
+            files[doc_id] = (key, file_path, file_hash)
+
+    written = 0
+    tmp_file = output_file.with_suffix(".jsonl.tmp")
+
+    with open(tmp_file, 'w', encoding='utf-8') as out:
+        copied = copy_unchanged(output_file, set(unchanged), out) if incremental else set()
+        for doc_id in copied:
+            key, file_hash = unchanged[doc_id]
+            new_manifest.files[key] = file_hash
+
+        # Неизмененные по манифесту, но отсутствующие в прошлом результате - парсим заново
+        for doc_id, (key, file_hash) in unchanged.items():
+            if doc_id not in copied:
+                files[doc_id] = (key, data_dir / key, file_hash)
+
+        # Парсим файлы, держа в работе ограниченное число задач
+        pending = {}
+        tasks = iter(files.items())
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                while len(pending) < workers * 4:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    doc_id, (key, file_path, file_hash) = task
+                    pending[executor.submit(parse_file, file_path, doc_id)] = (key, file_hash)
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, file_hash = pending.pop(future)
+                    document_json, error = future.result()
+
+                    if error is not None:
+                        logger.error(f"Ошибка при парсинге файла {key}: {error}")
+                        errors.append(key)
+                        continue
+
+                    out.write(document_json + "\n")
+                    new_manifest.files[key] = file_hash
+                    written += 1
+
+    tmp_file.replace(output_file)
+    new_manifest.save(manifest_file)
+
+    removed = [key for key in manifest.files if key not in current_keys]
+
+    logger.info(f"Парсинг завершен. Обработано {written + len(copied)} документов")
+    logger.info(f"Распарсено заново: {written}, без изменений: {len(copied)}, удалено: {len(removed)}, с ошибками: {len(errors)}")
+    if errors:
+        logger.warning(f"Файлы с ошибками: {', '.join(errors)}")
     logger.info(f"Результат сохранен в {output_file}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Парсинг Markdown документов")
+    arg_parser.add_argument("--incremental", action="store_true", help="Парсить только новые и измененные файлы")
+    arg_parser.add_argument("--workers", type=int, default=None, help="Число процессов парсинга (по умолчанию - число CPU)")
+    args = arg_parser.parse_args()
+    main(incremental=args.incremental, workers=args.workers)
@@ -0,0 +1,52 @@
+"""
+Манифест инкрементального парсинга: хэши содержимого исходных файлов.
+"""
+
+from pathlib import Path
+from typing import Dict, Optional
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IngestManifest:
+    """
+    Хэши содержимого исходных файлов на момент последнего парсинга.
+
+    Хранится рядом с documents.jsonl. Позволяет заново парсить только новые
+    и измененные файлы и находить удаленные.
+
+    Attributes:
+        files: Словарь {путь файла относительно data_dir: sha256 содержимого}
+    """
+
+    def __init__(self, files: Optional[Dict[str, str]] = None):
+        self.files: Dict[str, str] = files or {}
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'IngestManifest':
+        """Загружает манифест, если файла нет - возвращает пустой"""
+        path = Path(path)
+        if not path.exists():
+            return cls()
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f).get("files", {}))
+
+    def save(self, path: str | Path) -> None:
+        """Атомарно сохраняет манифест"""
+        path = Path(path)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"files": self.files}, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(path)
+
+    def is_unchanged(self, key: str, file_hash: str) -> bool:
+        """Проверяет, совпадает ли хэш файла с сохраненным"""
+        return self.files.get(key) == file_hash
+
+    @staticmethod
+    def file_hash(file_path: str | Path) -> str:
+        """sha256 содержимого файла"""
+        return hashlib.sha256(Path(file_path).read_bytes()).hexdigest()
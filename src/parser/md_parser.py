@@ -8,6 +8,7 @@
 """
 
 import re
+import hashlib
 from pathlib import Path
 from ..models.document import Document
 import logging
@@ -15,6 +16,16 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+def stable_document_id(key: str) -> int:
+    """
+    Стабильный ID документа по пути исходного файла (или URL).
+
+    Первые 7 байт sha256 - ID не зависит от порядка файлов и остается
+    тем же между запусками парсера.
+    """
+    return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:7], "big")
+
+
 class MarkdownParser:
     """
     Парсер Markdown файлов с инструкциями.
@@ -29,7 +40,7 @@ class MarkdownParser:
         
         Args:
             file_path: Путь к MD файлу
-            doc_id: ID документа для FAISS индекса
+            doc_id: Стабильный ID документа (см. stable_document_id)
             
         Returns:
             Document объект
@@ -0,0 +1,136 @@
+"""
+Семантический кэш ответов для перефразированных вопросов
+"""
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+import numpy as np
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """
+    LRU-кэш ответов с поиском по близости эмбеддингов запросов.
+
+    Нормированные эмбеддинги закэшированных запросов лежат в одной
+    матрице (max_size x dim), поиск - одно матричное умножение. Ответ
+    переиспользуется, если косинусная близость нового запроса к одному
+    из закэшированных не меньше threshold. При смене версии индекса или
+    размерности эмбеддингов кэш очищается целиком.
+
+    Attributes:
+        max_size: Максимум ответов в кэше
+        ttl: Время жизни ответа в секундах (0 - без ограничения)
+        threshold: Минимальная косинусная близость запросов
+        hits: Количество попаданий
+        misses: Количество промахов
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 3600, threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+
+        self._version: Optional[Hashable] = None
+        self._matrix: Optional[np.ndarray] = None
+        self._valid = np.zeros(max_size, dtype=bool)
+        # слот матрицы -> (запрос, значение, время записи) в порядке LRU
+        self._entries: "OrderedDict[int, Tuple[str, Any, float]]" = OrderedDict()
+        self._free: List[int] = list(range(max_size - 1, -1, -1))
+        self._lock = threading.Lock()
+
+    def get(self, embedding: List[float], version: Hashable) -> Optional[Tuple[str, Any, float, float]]:
+        """
+        Ближайший закэшированный ответ.
+
+        Returns:
+            (закэшированный запрос, значение, близость, возраст в секундах) или None
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            if not self._entries or query is None or query.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix @ query
+            similarities[~self._valid] = -np.inf
+            now = time.monotonic()
+            for slot in np.argsort(-similarities):
+                similarity = float(similarities[slot])
+                if similarity < self.threshold:
+                    break
+                slot = int(slot)
+                cached_query, value, created = self._entries[slot]
+                if self.ttl and now - created > self.ttl:
+                    self._release(slot)
+                    continue
+
+                self._entries.move_to_end(slot)
+                self.hits += 1
+                return cached_query, value, similarity, now - created
+
+            self.misses += 1
+            return None
+
+    def put(self, query: str, embedding: List[float], value: Any, version: Hashable) -> None:
+        vector = self._normalize(embedding)
+        if vector is None or not self.max_size:
+            return
+
+        with self._lock:
+            self._check_version(version)
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._reset()
+                self._matrix = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+
+            if not self._free:
+                self._release(next(iter(self._entries)))
+            slot = self._free.pop()
+            self._matrix[slot] = vector
+            self._valid[slot] = True
+            self._entries[slot] = (query, value, time.monotonic())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+    @staticmethod
+    def _normalize(embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def _check_version(self, version: Hashable) -> None:
+        """Ответы, построенные по старому индексу, могут ссылаться на удаленные документы"""
+        if version != self._version:
+            if self._entries:
+                logger.info("Версия индекса сменилась, кэш ответов очищен")
+            self._reset()
+            self._version = version
+
+    def _release(self, slot: int) -> None:
+        del self._entries[slot]
+        self._valid[slot] = False
+        self._free.append(slot)
+
+    def _reset(self) -> None:
+        self._entries.clear()
+        self._valid[:] = False
+        self._free = list(range(self.max_size - 1, -1, -1))
@@ -0,0 +1,138 @@
+"""
+Пакетный прогон вопросов из JSONL через RAG пайплайн.
+
+Используется для офлайн-оценки, прогрева кэшей и регрессионных прогонов:
+
+    python -m src.rag.batch questions.jsonl answers.jsonl --batch-size 64 --concurrency 4
+
+Каждая строка входа - JSON с полем "query" (или "question"), остальные
+поля (ID, эталонный ответ и т.п.) переносятся в выход без изменений.
+Выход - JSONL в порядке входа: ответ, источники и полный RAGPipeline
+без текстов документов, для упавших запросов - поле "error".
+"""
+from src.rag.rag_system import RAGSystem
+from src.models.pipeline import RAGPipeline
+from src.config.settings import settings
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterator, List, Optional
+import argparse
+import asyncio
+import logging
+import json
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def read_records(path: str | Path) -> Iterator[dict]:
+    """Записи входного JSONL; строка без JSON-объекта становится запросом целиком"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = line
+            yield record if isinstance(record, dict) else {"query": str(record)}
+
+
+def iter_chunks(records: Iterator[dict], size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def pipeline_to_dict(pipeline: RAGPipeline) -> dict:
+    """RAGPipeline в JSON-совместимый словарь без текстов документов"""
+    return _jsonable(asdict(pipeline))
+
+
+def _jsonable(value):
+    if hasattr(value, "model_dump"):
+        value = value.model_dump(mode="json")
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items() if not (key == "text" and "url" in value)}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+async def arun_batch(rag: RAGSystem,
+                     input_path: str | Path,
+                     output_path: str | Path,
+                     batch_size: int = 32,
+                     concurrency: Optional[int] = None) -> dict:
+    """
+    Прогоняет вопросы из input_path через RAG и пишет ответы в output_path.
+
+    Вопросы читаются потоково пачками по batch_size: каждая пачка - один
+    вызов модели эмбеддингов и один векторный поиск, реранкинг и
+    генерация внутри пачки идут конкурентно (см. RAGSystem.arequest_batch).
+
+    Returns:
+        Статистика прогона: запросов, ошибок, из кэша ответов, секунд
+    """
+    start_time = time.time()
+    stats = {"queries": 0, "errors": 0, "answer_cache_hits": 0}
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for chunk in iter_chunks(read_records(input_path), batch_size):
+            queries = [str(record.get("query") or record.get("question") or "") for record in chunk]
+            valid = [i for i, query in enumerate(queries) if query.strip()]
+            pipelines = await rag.arequest_batch([queries[i] for i in valid], concurrency)
+            results = dict(zip(valid, pipelines))
+
+            for i, record in enumerate(chunk):
+                pipeline = results.get(i, ValueError("В записи нет поля query"))
+                if isinstance(pipeline, Exception):
+                    line = {**record, "error": str(pipeline)}
+                    stats["errors"] += 1
+                else:
+                    line = {
+                        **record,
+                        "answer": pipeline.generation.answer if pipeline.generation else None,
+                        "sources": pipeline.generation.source_urls if pipeline.generation else [],
+                        "pipeline": pipeline_to_dict(pipeline)
+                    }
+                    stats["answer_cache_hits"] += pipeline.answer_cache is not None
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            out.flush()
+
+            stats["queries"] += len(chunk)
+            logger.info(f"Обработано запросов: {stats['queries']}")
+
+    stats["seconds"] = round(time.time() - start_time, 3)
+    logger.info(f"Пакетный прогон завершен: {stats}. Результат сохранен в {output_path}")
+    return stats
+
+
+def main(input_path: str, output_path: str, batch_size: int = 32, concurrency: Optional[int] = None):
+    rag = RAGSystem()
+    asyncio.run(arun_batch(rag, input_path, output_path, batch_size, concurrency))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    arg_parser = argparse.ArgumentParser(description="Пакетный прогон вопросов через RAG")
+    arg_parser.add_argument("input", help="JSONL с вопросами (поле query или question)")
+    arg_parser.add_argument("output", help="JSONL для ответов и метрик пайплайна")
+    arg_parser.add_argument("--batch-size", type=int, default=32, help="Вопросов в одном векторном поиске")
+    arg_parser.add_argument("--concurrency", type=int, default=None, help=f"Запросов, одновременно проходящих реранкинг и генерацию (по умолчанию - max_concurrent_requests = {settings.max_concurrent_requests})")
+    args = arg_parser.parse_args()
+    main(args.input, args.output, batch_size=args.batch_size, concurrency=args.concurrency)
@@ -1,4 +1,5 @@
 from src.llm.llm_factory import LLMClientsFactory
+from src.llm.llm_clients import LLLResponse
 from ..models.pipeline import GenerationResult, StageMetrics
 from ..models.document import Document
 from ..config.prompts import create_response_messages
@@ -32,7 +33,6 @@ class ResponseGenerator:
             logger.debug("Начало этапа генерации ответа от LLM")
 
             selected_docs = documents[:settings.max_context_documents]
-            source_urls = [doc.url for doc in selected_docs]
 
             response = self.client.chat(
                 model=self.model,
@@ -42,30 +42,67 @@ class ResponseGenerator:
                 # top_k=self.top_k
             )
 
-            logger.debug(f"Сгенерированный ответ:\n {response.content}")
+            return self._build_result(response, selected_docs, start_time)
 
-            # Парсинг ответа и извлечение URL
-            answer = response.content
+        except Exception as e:
+            logger.error(f"Ошибка при генерации ответа: {e}")
+            raise
 
-            logger.debug(f"Генерация ответа: {response.prompt_eval_count} входных + {response.eval_count} выходных токенов.\nВремя загрузки: {response.load_duration}\nВремя генерации ответа: {response.eval_duration}\nОбщее время: {response.total_duration}")
+    async def agenerate_answer(self,
+                               query: str,
+                               documents: List[Document]
+    ) -> GenerationResult:
+        """Асинхронно генерирует ответ на основе найденных документов"""
 
-            total_time = time.time() - start_time
-            logger.info(f"Успешная генерация ответа от llm. Время выполнения: {total_time:3f}")
-            logger.info(f"Ответ RAG-системы:\n — {answer}")
+        try:
+            start_time = time.time()
+            logger.debug("Начало этапа асинхронной генерации ответа от LLM")
 
-            return GenerationResult(
-                metrics=StageMetrics("generation", total_time),
-                answer=answer,
-                source_urls=source_urls,
-                source_documents=selected_docs,
-                input_tokens=response.prompt_eval_count,
-                output_tokens=response.eval_count,
-                total_tokens=response.prompt_eval_count + response.eval_count,
-                load_duration=response.load_duration / 1_000_000_000 if response.load_duration is not None else None,
-                eval_duration=response.eval_duration / 1_000_000_000 if response.eval_duration is not None else None,
-                model_used=response.model
+            selected_docs = documents[:settings.max_context_documents]
+
+            response = await self.client.achat(
+                model=self.model,
+                messages=create_response_messages(query, selected_docs),
+                temperature=self.temperature,
             )
 
+            return self._build_result(response, selected_docs, start_time)
+
         except Exception as e:
             logger.error(f"Ошибка при генерации ответа: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def _build_result(self,
+                      response: LLLResponse,
+                      selected_docs: List[Document],
+                      start_time: float
+    ) -> GenerationResult:
+        """Формирует результат этапа генерации из ответа LLM"""
+        # URL дубликатов, схлопнутых ретривером, - такие же источники ответа
+        source_urls = list(dict.fromkeys(
+            url for doc in selected_docs for url in (doc.url, *getattr(doc, "duplicate_urls", ()))
+        ))
+
+        logger.debug(f"Сгенерированный ответ:\n {response.content}")
+
+        # Парсинг ответа и извлечение URL
+        answer = response.content
+
+        logger.debug(f"Генерация ответа: {response.prompt_eval_count} входных + {response.eval_count} выходных токенов.\nВремя загрузки: {response.load_duration}\nВремя генерации ответа: {response.eval_duration}\nОбщее время: {response.total_duration}")
+
+        total_time = time.time() - start_time
+        logger.info(f"Успешная генерация ответа от llm. Время выполнения: {total_time:3f}")
+        logger.info(f"Ответ RAG-системы:\n — {answer}")
+
+        return GenerationResult(
+            metrics=StageMetrics("generation", total_time),
+            answer=answer,
+            source_urls=source_urls,
+            source_documents=selected_docs,
+            input_tokens=response.prompt_eval_count,
+            output_tokens=response.eval_count,
+            total_tokens=response.prompt_eval_count + response.eval_count,
+            load_duration=response.load_duration / 1_000_000_000 if response.load_duration is not None else None,
+            eval_duration=response.eval_duration / 1_000_000_000 if response.eval_duration is not None else None,
+            model_used=response.model
+        )
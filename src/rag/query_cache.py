@@ -0,0 +1,87 @@
+"""
+Кэш эмбеддингов запросов в памяти процесса
+"""
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueryEmbeddingCache:
+    """
+    LRU-кэш эмбеддингов запросов с TTL.
+
+    Ключ - модель эмбеддингов и нормализованный текст запроса (регистр и
+    пробелы не учитываются), поэтому повторные вопросы не идут в модель.
+    При смене модели кэш очищается целиком.
+
+    Attributes:
+        max_size: Максимум запросов в кэше
+        ttl: Время жизни записи в секундах (0 - без ограничения)
+        hits: Количество попаданий
+        misses: Количество промахов
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._model_key: Optional[str] = None
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[List[float], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.split()).casefold()
+
+    def get(self, model_key: str, query: str) -> Optional[List[float]]:
+        """Эмбеддинг запроса из кэша или None"""
+        key = (model_key, self.normalize(query))
+        with self._lock:
+            self._check_model(model_key)
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, model_key: str, query: str, embedding: List[float]) -> None:
+        key = (model_key, self.normalize(query))
+        with self._lock:
+            self._check_model(model_key)
+            self._entries[key] = (embedding, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+    def _check_model(self, model_key: str) -> None:
+        """Векторы другой модели несравнимы с индексом - сбрасываем кэш"""
+        if model_key != self._model_key:
+            if self._entries:
+                logger.info(f"Модель эмбеддингов сменилась на {model_key}, кэш запросов очищен")
+            self._entries.clear()
+            self._model_key = model_key
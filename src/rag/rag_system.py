@@ -1,8 +1,15 @@
 from src.rag.retriever import DocumentRetriever
 from src.reranker.reranker_factory import RerankerProviderFactory
 from src.rag.generator import ResponseGenerator
-from src.models.pipeline import RAGPipeline
+from src.rag.rerank_policy import RerankPolicy
+from src.rag.answer_cache import SemanticAnswerCache
+from src.models.pipeline import AnswerCacheHit, GeneralResults, RAGPipeline, VectorSearchResult
+from src.models.search import SearchResult
+from dataclasses import replace
+from typing import Hashable, List, Optional, Tuple
 from src.config.settings import settings
+from src.config.startup import startup_report
+import asyncio
 import logging
 import time
 
@@ -10,43 +17,214 @@ logger = logging.getLogger(__name__)
 
 class RAGSystem:
     def __init__(self):
-        self.retriever = DocumentRetriever()
-        self.generator = ResponseGenerator()
+        with startup_report.measure("retriever"):
+            self.retriever = DocumentRetriever()
+        with startup_report.measure("generator"):
+            self.generator = ResponseGenerator()
         self.reranker = None
-        self.pipeline = None
+        self.rerank_policy = RerankPolicy.from_settings()
+        if self.rerank_policy.enabled and not self.retriever.distances_normalized():
+            # Пороги политики заданы в шкале 2 - 2cos и для таких расстояний ничего не значат
+            logger.error("Эмбеддинги не нормированы: адаптивный реранкинг выключен, реранжируются все кандидаты")
+            self.rerank_policy.enabled = False
+        self.answer_cache = None
+        if settings.answer_cache_size:
+            self.answer_cache = SemanticAnswerCache(
+                settings.answer_cache_size,
+                settings.answer_cache_ttl,
+                settings.answer_cache_similarity
+            )
 
         if settings.enable_reranking:
-            self.reranker = RerankerProviderFactory.create_provider(settings.reranker_provider)
+            with startup_report.measure("reranker"):
+                self.reranker = RerankerProviderFactory.create_provider(settings.reranker_provider)
 
-    def request(self, query: str) -> str:
+    def request(self, query: str) -> RAGPipeline:
+        """Обрабатывает запрос и возвращает собственный пайплайн запроса (ответ в pipeline.generation)"""
         start_time = time.time()
         logger.debug("Начало обработки запроса")
 
-        self.pipeline = RAGPipeline(query)
+        # Эмбеддинг запроса считается один раз: для кэша ответов и для поиска
+        prepared = self.retriever.prepare_query(query)
+        version = self.retriever.index_version()
+        cached = self._cached_answer(query, prepared[0], version, start_time)
+        if cached:
+            return cached
 
-        retriever_results = self.retriever.search(query, top_k=settings.initial_candidates)
-        self.pipeline.retriever = retriever_results
+        retriever_results = self.retriever.search(query, top_k=settings.initial_candidates, prepared=prepared)
+        pipeline = self._complete(query, retriever_results, prepared[0], version)
 
-        if self.reranker and len(retriever_results.results) > 1:
-            rerank_results = self.reranker.rerank(query, retriever_results.results)
-            self.pipeline.reranking = rerank_results
-            documents = [result.document for result in rerank_results.results]
-        else:
-            documents = [result.document for result in retriever_results.results]
-        
-        response = self.generator.generate_answer(query, documents)
-        self.pipeline.generation = response
-        self.pipeline.update_general_results()
+        total_time = time.time() - start_time
+        logger.info(f"Успешная обработка запроса. Время выполнения: {total_time:3f}")
+        return pipeline
+
+    async def arequest(self, query: str) -> RAGPipeline:
+        """Асинхронная обработка запроса, не блокирующая цикл событий"""
+        start_time = time.time()
+        logger.debug("Начало асинхронной обработки запроса")
+
+        # Эмбеддинг запроса считается один раз: для кэша ответов и для поиска
+        prepared = await self.retriever.aprepare_query(query)
+        version = await asyncio.to_thread(self.retriever.index_version)
+        cached = self._cached_answer(query, prepared[0], version, start_time)
+        if cached:
+            return cached
+
+        retriever_results = await self.retriever.asearch(query, top_k=settings.initial_candidates, prepared=prepared)
+        pipeline = await self._acomplete(query, retriever_results, prepared[0], version)
 
         total_time = time.time() - start_time
         logger.info(f"Успешная обработка запроса. Время выполнения: {total_time:3f}")
-        return response.answer
-    
-    def get_debug_info(self) -> RAGPipeline:
-        if self.pipeline:
-            return self.pipeline
-        else:
-            raise Exception("Object RAGPipeline does not exist, please run RAGSystem.request() first.")
+        return pipeline
+
+    async def arequest_batch(self, queries: List[str], concurrency: Optional[int] = None) -> List[RAGPipeline | Exception]:
+        """
+        Обрабатывает пачку запросов с максимальной пропускной способностью.
+
+        Эмбеддинги всех запросов считаются одним вызовом модели, векторный
+        поиск - один запрос к базе на всю пачку. Реранкинг и генерация
+        идут конкурентно, не более concurrency запросов одновременно
+        (каждый реранкинг дополнительно ограничен max_concurrent_requests).
+
+        Returns:
+            Пайплайны в порядке запросов; для упавших запросов - исключение
+        """
+        start_time = time.time()
+        logger.info(f"Пакетная обработка {len(queries)} запросов")
+
+        try:
+            prepared = await self.retriever.aprepare_queries(queries)
+            version = await asyncio.to_thread(self.retriever.index_version)
+        except Exception as e:
+            logger.error(f"Ошибка при подготовке пакета запросов: {e}")
+            return [e] * len(queries)
+
+        pipelines: List[Optional[RAGPipeline | Exception]] = [
+            self._cached_answer(query, embedding, version, start_time)
+            for query, (embedding, _) in zip(queries, prepared)
+        ]
+
+        pending = [i for i, pipeline in enumerate(pipelines) if pipeline is None]
+        try:
+            retriever_results = await self.retriever.asearch_batch(
+                [queries[i] for i in pending],
+                top_k=settings.initial_candidates,
+                prepared=[prepared[i] for i in pending]
+            )
+        except Exception as e:
+            # Поиск общий на всю пачку: ошибка относится ко всем запросам без ответа из кэша
+            logger.error(f"Ошибка при поиске по пакету запросов: {e}")
+            for i in pending:
+                pipelines[i] = e
+            retriever_results = []
+
+        semaphore = asyncio.Semaphore(concurrency or settings.max_concurrent_requests)
+
+        async def complete(i: int, results: VectorSearchResult):
+            async with semaphore:
+                try:
+                    pipelines[i] = await self._acomplete(queries[i], results, prepared[i][0], version)
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке запроса \"{queries[i]}\": {e}")
+                    pipelines[i] = e
+
+        await asyncio.gather(*(complete(i, results) for i, results in zip(pending, retriever_results)))
+
+        total_time = time.time() - start_time
+        logger.info(f"Пакет из {len(queries)} запросов обработан за {total_time:.3f} (из кэша ответов: {len(queries) - len(pending)})")
+        return pipelines
+
+    def _complete(self,
+                  query: str,
+                  retriever_results: VectorSearchResult,
+                  embedding: Optional[List[float]],
+                  version: Hashable
+    ) -> RAGPipeline:
+        """Реранкинг и генерация по результатам поиска"""
+        pipeline = RAGPipeline(query)
+        pipeline.retriever = retriever_results
+
+        # Текст подгружается только для кандидатов, которые пойдут дальше
+        candidates, rest = self._plan_rerank(pipeline)
+        self.retriever.hydrate(candidates + rest)
+        if candidates:
+            rerank_results = self.reranker.rerank(query, candidates)
+            pipeline.reranking = rerank_results
+            candidates = rerank_results.results
+        documents = [result.document for result in candidates + rest]
+        
+        response = self.generator.generate_answer(query, documents)
+        pipeline.generation = response
+        pipeline.update_general_results()
+        self._remember_answer(pipeline, embedding, version)
+        return pipeline
+
+    async def _acomplete(self,
+                         query: str,
+                         retriever_results: VectorSearchResult,
+                         embedding: Optional[List[float]],
+                         version: Hashable
+    ) -> RAGPipeline:
+        """Асинхронные реранкинг и генерация по результатам поиска"""
+        pipeline = RAGPipeline(query)
+        pipeline.retriever = retriever_results
+
+        # Текст подгружается только для кандидатов, которые пойдут дальше
+        candidates, rest = self._plan_rerank(pipeline)
+        await self.retriever.ahydrate(candidates + rest)
+        if candidates:
+            rerank_results = await self.reranker.arerank(query, candidates)
+            pipeline.reranking = rerank_results
+            candidates = rerank_results.results
+        documents = [result.document for result in candidates + rest]
+
+        response = await self.generator.agenerate_answer(query, documents)
+        pipeline.generation = response
+        pipeline.update_general_results()
+        self._remember_answer(pipeline, embedding, version)
+        return pipeline
+
+    def _plan_rerank(self, pipeline: RAGPipeline) -> Tuple[List[SearchResult], List[SearchResult]]:
+        """
+        Делит результаты поиска на кандидатов для реранкера и документы,
+        которые дополняют контекст генерации в порядке поиска. Решение
+        политики сохраняется в pipeline.rerank_decision.
+        """
+        results = pipeline.retriever.results
+        candidates = []
+        if self.reranker:
+            decision, candidates = self.rerank_policy.decide(results)
+            pipeline.rerank_decision = decision
+
+        selected = {id(result) for result in candidates}
+        free_slots = max(0, settings.max_context_documents - len(candidates))
+        rest = [result for result in results if id(result) not in selected][:free_slots]
+        return candidates, rest
+
+    def _cached_answer(self,
+                       query: str,
+                       embedding: Optional[List[float]],
+                       version: Hashable,
+                       start_time: float
+    ) -> Optional[RAGPipeline]:
+        """Пайплайн перефразированного вопроса из кэша ответов (с пометкой в answer_cache) или None"""
+        if not self.answer_cache or embedding is None:
+            return None
+
+        hit = self.answer_cache.get(embedding, version)
+        if hit is None:
+            return None
 
+        cached_query, cached, similarity, age = hit
+        logger.info(f"Ответ взят из кэша (близость {similarity:.3f} к запросу \"{cached_query}\")")
+        return replace(
+            cached,
+            query=query,
+            answer_cache=AnswerCacheHit(cached_query, similarity, age),
+            general=GeneralResults(total_tokens=0, total_duration=time.time() - start_time)
+        )
 
-        
\ No newline at end of file
+    def _remember_answer(self, pipeline: RAGPipeline, embedding: Optional[List[float]], version: Hashable):
+        """Кэшируются только ответы, построенные по найденным документам"""
+        if self.answer_cache and embedding is not None and pipeline.retriever.results and pipeline.generation:
+            self.answer_cache.put(pipeline.query, embedding, pipeline, version)
@@ -0,0 +1,102 @@
+"""
+Адаптивный выбор кандидатов для реранкинга по распределению векторных скоров
+"""
+from ..models.pipeline import RerankDecision
+from ..models.search import SearchResult
+from ..config.settings import settings
+from typing import List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RerankPolicy:
+    """
+    Решает, сколько кандидатов отдавать реранкеру и нужен ли он вообще.
+
+    Скоры - векторные расстояния (vector_score, меньше = лучше). Реранкинг
+    пропускается, если лучший документ уверенно впереди: его расстояние не
+    больше skip_max_distance, а отрыв от второго по расстоянию не меньше
+    skip_margin. При гибридном поиске лучший документ по итоговому скору
+    должен совпадать с лучшим по вектору, иначе сигналы расходятся и
+    реранкинг нужен. В остальных случаях реранжируются кандидаты в окне
+    candidate_window от лучшего расстояния, но не меньше min_candidates
+    и не больше max_candidates.
+
+    Пороги абсолютные и рассчитаны на расстояния между нормированными
+    векторами (квадрат L2 = 2 - 2cos). Для ненормированных эмбеддингов
+    (Ollama /api/embeddings в ChromaDB) политика выключается при запуске.
+
+    Attributes:
+        enabled: Если False, реранжируются все кандидаты
+        skip_margin: Отрыв лучшего документа, при котором реранкинг не нужен
+        skip_max_distance: Максимальное расстояние лучшего документа для пропуска
+        candidate_window: Ширина окна расстояний от лучшего документа
+        min_candidates, max_candidates: Границы числа кандидатов
+    """
+
+    def __init__(self,
+                 enabled: bool = True,
+                 skip_margin: float = 0.15,
+                 skip_max_distance: float = 0.6,
+                 candidate_window: float = 0.2,
+                 min_candidates: int = 3,
+                 max_candidates: Optional[int] = None):
+        self.enabled = enabled
+        self.skip_margin = skip_margin
+        self.skip_max_distance = skip_max_distance
+        self.candidate_window = candidate_window
+        self.min_candidates = min_candidates
+        self.max_candidates = max_candidates
+
+    @classmethod
+    def from_settings(cls) -> "RerankPolicy":
+        return cls(
+            enabled=settings.adaptive_rerank_enabled,
+            skip_margin=settings.rerank_skip_margin,
+            skip_max_distance=settings.rerank_skip_max_distance,
+            candidate_window=settings.rerank_candidate_window,
+            min_candidates=settings.rerank_min_candidates,
+            max_candidates=settings.rerank_max_candidates
+        )
+
+    def decide(self, results: List[SearchResult]) -> Tuple[RerankDecision, List[SearchResult]]:
+        """
+        Выбирает кандидатов для реранкинга.
+
+        Args:
+            results: Результаты поиска в порядке итогового скора
+
+        Returns:
+            Решение и список кандидатов для реранкера (пустой, если реранкинг пропущен)
+        """
+        total = len(results)
+        if total < 2:
+            return RerankDecision(True, "меньше двух кандидатов", 0, total), []
+
+        by_distance = sorted(results, key=lambda r: r.vector_score)
+        best, second = by_distance[0], by_distance[1]
+        margin = second.vector_score - best.vector_score
+
+        if not self.enabled:
+            return RerankDecision(False, "адаптивный реранкинг выключен", total, total, margin), list(results)
+
+        if margin >= self.skip_margin and best.vector_score <= self.skip_max_distance:
+            if results[0] is best:
+                decision = RerankDecision(True, f"отрыв лучшего документа {margin:.3f} >= {self.skip_margin}", 0, total, margin)
+                logger.debug(f"Реранкинг пропущен: {decision.reason}")
+                return decision, []
+
+        limit = min(self.max_candidates or total, total)
+        low = min(self.min_candidates, limit)
+        threshold = best.vector_score + self.candidate_window
+        # Порядок кандидатов - по итоговому скору, окно задается по расстоянию
+        selected = [r for r in results if r.vector_score <= threshold][:limit]
+        if len(selected) < low:
+            chosen = {id(r) for r in selected}
+            selected += [r for r in results if id(r) not in chosen][:low - len(selected)]
+
+        reason = f"окно {self.candidate_window} от лучшего расстояния {best.vector_score:.3f}"
+        decision = RerankDecision(False, reason, len(selected), total, margin)
+        logger.debug(f"Реранкинг {len(selected)} из {total} кандидатов: {reason}")
+        return decision, selected
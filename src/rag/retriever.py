@@ -1,14 +1,26 @@
 from src.indexing.indexer import DocumentIndexer
 from src.config import settings
-from ..models.document import Document
-from ..models.search import SearchResult
+from src.config.settings import VectorBackendType
+from ..models.search import SearchResult, DocumentRef
 from ..models.pipeline import VectorSearchResult, StageMetrics
-from typing import List
+from dataclasses import replace
+from typing import Dict, List, Optional, Tuple
+from src.indexing.document_store import DocumentStore
+from src.indexing.bm25_index import Bm25Index
+from src.indexing.near_duplicates import NearDuplicateIndex
+from .query_cache import QueryEmbeddingCache
+import numpy as np
+import re
+import threading
+import asyncio
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
+# Эмбеддинг запроса (None, если векторизовать не удалось) и признак попадания в кэш
+PreparedQuery = Tuple[Optional[List[float]], bool]
+
 class DocumentRetriever:
     def __init__(self):
         logger.debug("Инициализация индексатора")
@@ -18,26 +30,38 @@ class DocumentRetriever:
             chroma_db_path=settings.chroma_db_path,
             collection_name=settings.collection_name
         )
+        self._store: Optional[DocumentStore] = None
+        self._store_key: Optional[tuple] = None
+        self._store_lock = threading.Lock()
+        self._lexical: Optional[Bm25Index] = None
+        self._lexical_mtime: Optional[float] = None
+        self._duplicates: Optional[NearDuplicateIndex] = None
+        self._duplicates_mtime: Optional[float] = None
+        self.query_cache = None
+        if settings.query_embedding_cache_size:
+            self.query_cache = QueryEmbeddingCache(settings.query_embedding_cache_size, settings.query_embedding_cache_ttl)
         logger.debug("Завершение инициализации индексатора")
 
-    def search(self, query: str, top_k: int = 1) -> VectorSearchResult:
+    def search(self,
+               query: str,
+               top_k: int = 1,
+               prepared: Optional[PreparedQuery] = None
+    ) -> VectorSearchResult:
+        """
+        Поиск документов по запросу.
+
+        Args:
+            query: Текст запроса
+            top_k: Сколько документов вернуть
+            prepared: Результат prepare_query, если эмбеддинг запроса уже посчитан
+        """
         start_time = time.time()
         logger.debug("Начало векторного поиска")
         logger.info(f"Запрос пользователя:\n — {query}")
 
-        vector_results = self._vector_search(query, settings.initial_candidates)
-        vector_search_time = time.time() - start_time
-
-        vector_results.sort(key=lambda x: x.final_score, reverse=True)
-        final_results = vector_results[:top_k]
+        result = self.search_batch([query], top_k, [prepared] if prepared is not None else None)[0]
+        final_results = result.results
 
-        result = VectorSearchResult(
-            StageMetrics(
-                stage_name="retriever", 
-                duration=vector_search_time),
-            final_results
-        )
-        
         total_time = time.time() - start_time
         # logging.info(f"Поиск завершен: {len(final_results)} результатов за {total_time:.3f}с")
         logger.info(f"Успешный векторный поиск. Время выполнения: {total_time:3f}")
@@ -45,38 +69,431 @@ class DocumentRetriever:
         
         return result
 
-    def _vector_search(self, query: str, top_k: int = 1) -> List[SearchResult]:
+    async def asearch(self,
+                      query: str,
+                      top_k: int = 1,
+                      prepared: Optional[PreparedQuery] = None
+    ) -> VectorSearchResult:
+        """Асинхронный поиск: запрос к ChromaDB и эмбеддинг выполняются в отдельном потоке"""
+        return await asyncio.to_thread(self.search, query, top_k, prepared)
+
+    def search_batch(self,
+                     queries: List[str],
+                     top_k: int = 1,
+                     prepared: Optional[List[PreparedQuery]] = None
+    ) -> List[VectorSearchResult]:
+        """
+        Поиск по пачке запросов: один вызов модели эмбеддингов и один
+        запрос к векторной базе на всю пачку.
+
+        Длительность этапа у каждого запроса - его доля общей векторизации
+        и векторного поиска плюс собственные BM25, объединение и схлопывание.
+        """
+        start_time = time.time()
+        prepared = prepared if prepared is not None else self.prepare_queries(queries)
+        candidates = settings.initial_candidates * settings.chunk_search_multiplier
+        batch_results = self._vector_search([embedding for embedding, _ in prepared], candidates)
+        shared_time = (time.time() - start_time) / max(len(queries), 1)
+
+        results = []
+        for query, (embedding, cached), vector_results in zip(queries, prepared, batch_results):
+            query_start = time.time()
+            if settings.hybrid_search_enabled:
+                vector_results = self._fuse(vector_results, self._lexical_search(query, candidates), embedding)
+            vector_results = self._collapse_duplicates(self._collapse_chunks(vector_results))
+            vector_results.sort(key=lambda x: x.final_score, reverse=True)
+            final_results = vector_results[:top_k]
+            vector_search_time = shared_time + time.time() - query_start
+
+            if not settings.lean_retrieval:
+                self.hydrate(final_results)
+
+            results.append(VectorSearchResult(
+                StageMetrics(
+                    stage_name="retriever",
+                    duration=vector_search_time),
+                final_results,
+                query_embedding_cached=cached
+            ))
+        return results
+
+    async def asearch_batch(self,
+                            queries: List[str],
+                            top_k: int = 1,
+                            prepared: Optional[List[PreparedQuery]] = None
+    ) -> List[VectorSearchResult]:
+        return await asyncio.to_thread(self.search_batch, queries, top_k, prepared)
+
+    def prepare_query(self, query: str) -> PreparedQuery:
+        """Эмбеддинг запроса и признак попадания в кэш (None, если векторизовать не удалось)"""
+        return self.prepare_queries([query])[0]
+
+    async def aprepare_query(self, query: str) -> PreparedQuery:
+        return await asyncio.to_thread(self.prepare_query, query)
+
+    def prepare_queries(self, queries: List[str]) -> List[PreparedQuery]:
+        """Эмбеддинги пачки запросов одним вызовом провайдера"""
+        try:
+            # Переиндексация могла переключить активную версию коллекции
+            self.indexer.refresh()
+            return self._embed_queries(queries)
+        except Exception as e:
+            logger.error(f"Ошибка при векторизации запроса: {e}")
+            return [(None, False)] * len(queries)
+
+    async def aprepare_queries(self, queries: List[str]) -> List[PreparedQuery]:
+        return await asyncio.to_thread(self.prepare_queries, queries)
+
+    def _embed_queries(self, queries: List[str]) -> List[PreparedQuery]:
+        """Эмбеддинги запросов: из кэша или от провайдера текущей модели (повторы векторизуются один раз)"""
+        indexer = self.indexer
+        provider = indexer.embedding_provider
+        model_key = indexer.model_key(indexer.embedding_provider_type, indexer.embedding_model)
+
+        prepared: List[PreparedQuery] = [(None, False)] * len(queries)
+        pending = {}
+        for i, query in enumerate(queries):
+            embedding = self.query_cache.get(model_key, query) if self.query_cache else None
+            if embedding is not None:
+                prepared[i] = (embedding, True)
+            else:
+                pending.setdefault(query, []).append(i)
+
+        if len(pending) < len(queries) and self.query_cache:
+            logger.debug(f"Эмбеддингов запросов из кэша: {len(queries) - sum(map(len, pending.values()))} ({self.query_cache.stats()})")
+
+        if pending:
+            texts = list(pending)
+            for text, embedding in zip(texts, provider.encode(texts)):
+                if self.query_cache:
+                    self.query_cache.put(model_key, text, embedding)
+                for i in pending[text]:
+                    prepared[i] = (embedding, False)
+        return prepared
+
+    def distances_normalized(self) -> bool:
+        """
+        Сравнимы ли векторные расстояния с порогами в шкале 2 - 2cos.
+
+        NumPy и FAISS хранят нормированные векторы сами, ChromaDB - как их
+        вернула модель, поэтому для нее проверяется норма пробного эмбеддинга.
+        """
+        if settings.vector_backend in (VectorBackendType.NUMPY, VectorBackendType.FAISS):
+            return True
         try:
-            results = self.indexer.db_connector.collection.query(
-                query_texts=[query],
+            vector = self.indexer.embedding_provider.encode(["проверка нормы эмбеддинга"])[0]
+        except Exception as e:
+            logger.warning(f"Не удалось проверить нормированность эмбеддингов: {e}")
+            return False
+        return abs(float(np.linalg.norm(vector)) - 1.0) < 1e-2
+
+    def index_version(self) -> tuple:
+        """
+        Признак версии индекса для кэшей поверх результатов поиска.
+
+        Меняется при переключении коллекции, изменении числа записей и
+        пересборке хранилища документов, индекса BM25 или кластеров
+        дубликатов (они пересобираются при каждой индексации и синхронизации).
+        """
+        collection = self.indexer.db_connector.collection
+        return (
+            collection.name,
+            collection.count(),
+            DocumentStore.mtime(DocumentStore.for_collection(settings.document_store_path, collection.name)),
+            Bm25Index.mtime(settings.bm25_index_path),
+            NearDuplicateIndex.mtime(settings.near_duplicate_index_path)
+        )
+
+    def _vector_search(self, embeddings: List[Optional[List[float]]], top_k: int = 1) -> List[List[SearchResult]]:
+        """Поиск чанков по эмбеддингам запросов одним запросом к векторной базе"""
+        results: List[List[SearchResult]] = [[] for _ in embeddings]
+        positions = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+        if not positions:
+            return results
+        try:
+            # Только ID, расстояния и компактные метаданные: без эмбеддингов и текста
+            data = self.indexer.db_connector.collection.query(
+                query_embeddings=[embeddings[i] for i in positions],
                 n_results=top_k,
-                include=["documents", "embeddings", "metadatas", "distances"]
+                include=["metadatas", "distances"]
             )
 
-            search_results = []
-            logger.debug(f"Найдено {len(results['ids'][0])} результатов поиска")
-
-            for i, (doc_id, distance, metadata) in enumerate(zip(
-                results['ids'][0], 
-                results['distances'][0],
-                results['metadatas'][0]
-            )):
-                doc = Document(
-                    id=int(doc_id),
-                    title=metadata.get('title', ''),
-                    url=metadata.get('url', ''),
-                    text=metadata.get('text', '')
-                )
-
-                search_result = SearchResult(
-                    document=doc,
-                    vector_score=distance,
-                )
-
-                search_results.append(search_result)
-
-            logger.debug(f"Обработано {len(search_results)} результатов поиска")
-            return search_results
+            for i, ids, distances, metadatas in zip(positions, data['ids'], data['distances'], data['metadatas']):
+                results[i] = [
+                    SearchResult(document=self._make_ref(doc_id, metadata), vector_score=distance)
+                    for doc_id, distance, metadata in zip(ids, distances, metadatas)
+                ]
+
+            logger.debug(f"Найдено {sum(map(len, results))} результатов поиска по {len(positions)} запросам")
+            return results
         except Exception as e:
             logger.error(f"Ошибка при векторном поиске: {e}")
-            return []
\ No newline at end of file
+            return results
+
+    def _lexical_search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        """Поиск BM25 по точным терминам: названиям, кодам ошибок и т.п."""
+        try:
+            index = self._lexical_index()
+            return index.search(query, top_k) if index else []
+        except Exception as e:
+            logger.error(f"Ошибка при лексическом поиске: {e}")
+            return []
+
+    def _fuse(self,
+              vector_results: List[SearchResult],
+              lexical_results: List[Tuple[int, float]],
+              embedding: Optional[List[float]]) -> List[SearchResult]:
+        """
+        Объединяет векторную и лексическую выдачу чанков через reciprocal rank fusion.
+
+        Для чанков, найденных только BM25, векторное расстояние считается
+        по их эмбеддингам из векторной базы, чтобы vector_score оставался
+        сравнимым у всех кандидатов.
+        """
+        if not lexical_results:
+            return vector_results
+
+        k = settings.rrf_k
+        by_id = {r.document.source_ids[0]: r for r in vector_results}
+        fusion = {doc_id: 1 / (k + rank + 1) for rank, doc_id in enumerate(by_id)}
+        lexical = {}
+        for rank, (doc_id, score) in enumerate(lexical_results):
+            key = str(doc_id)
+            lexical[key] = score
+            fusion[key] = fusion.get(key, 0.0) + 1 / (k + rank + 1)
+
+        missing = [key for key in lexical if key not in by_id]
+        if missing:
+            try:
+                collection = self.indexer.db_connector.collection
+                data = collection.get(ids=missing, include=["metadatas"])
+                distances = self._distances(missing, embedding)
+                for doc_id, metadata in zip(data["ids"], data["metadatas"]):
+                    by_id[doc_id] = SearchResult(document=self._make_ref(doc_id, metadata), vector_score=distances.get(doc_id, 2.0))
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке найденных BM25 записей, они пропущены: {e}")
+
+        for doc_id, result in by_id.items():
+            result.lexical_score = lexical.get(doc_id)
+            result.fusion_score = fusion[doc_id]
+            result.update_final_score()
+
+        added = len(by_id) - len(vector_results)
+        logger.debug(f"Гибридный поиск: {len(vector_results)} векторных, {len(lexical)} BM25, {added} найдено только BM25")
+        return list(by_id.values())
+
+    def _distances(self, ids: List[str], embedding: Optional[List[float]]) -> Dict[str, float]:
+        """
+        Векторные расстояния от запроса до записей в шкале векторного поиска.
+
+        NumPy и FAISS хранят нормализованные (и, возможно, сжатые) векторы и
+        считают расстояние сами. ChromaDB хранит векторы как есть и считает
+        квадрат L2 по ним же - так же считается и здесь.
+        """
+        if embedding is None:
+            return {}
+
+        collection = self.indexer.db_connector.collection
+        if hasattr(collection, "distances"):
+            return collection.distances(ids, embedding)
+
+        data = collection.get(ids=ids, include=["embeddings"])
+        query_vector = np.asarray(embedding, dtype=np.float32)
+        return {
+            doc_id: float(np.sum((query_vector - np.asarray(doc_vector, dtype=np.float32)) ** 2))
+            for doc_id, doc_vector in zip(data["ids"], data["embeddings"])
+        }
+
+    @staticmethod
+    def _make_ref(doc_id: str, metadata: Optional[dict]) -> DocumentRef:
+        """Легкая ссылка на запись по ее метаданным"""
+        metadata = metadata or {}
+        return DocumentRef(
+            id=int(doc_id),
+            title=metadata.get('title', ''),
+            url=metadata.get('url', ''),
+            source_ids=(doc_id,),
+            parent_id=metadata.get('parent_id'),
+            chunk_index=metadata.get('chunk_index'),
+            section=metadata.get('section')
+        )
+
+    def _collapse_chunks(self, results: List[SearchResult]) -> List[SearchResult]:
+        """
+        Схлопывает найденные чанки в исходные документы.
+
+        Для каждого документа остается один результат с лучшим скором чанка
+        (векторным или объединенным, если включен гибридный поиск),
+        текст - найденные чанки документа в исходном порядке.
+        """
+        groups = {}
+        for result in results:
+            groups.setdefault(result.document.root_id, []).append(result)
+
+        collapsed = []
+        for root_id, group in groups.items():
+            best = max(group, key=lambda r: r.final_score)
+            if len(group) == 1 and best.document.parent_id is None:
+                collapsed.append(best)
+                continue
+
+            chunks = sorted(group, key=lambda r: r.document.chunk_index or 0)
+            doc = DocumentRef(
+                id=root_id,
+                title=best.document.title,
+                url=best.document.url,
+                source_ids=tuple(r.document.source_ids[0] for r in chunks),
+                source_chunks=tuple(r.document.chunk_index for r in chunks)
+            )
+            lexical = [r.lexical_score for r in group if r.lexical_score is not None]
+            collapsed.append(SearchResult(
+                document=doc,
+                vector_score=min(r.vector_score for r in group),
+                lexical_score=max(lexical) if lexical else None,
+                fusion_score=best.fusion_score
+            ))
+
+        logger.debug(f"{len(results)} чанков схлопнуто в {len(collapsed)} документов")
+        return collapsed
+
+    def _collapse_duplicates(self, results: List[SearchResult]) -> List[SearchResult]:
+        """
+        Оставляет один документ из каждого кластера почти одинаковых документов.
+
+        Представитель - документ с лучшим итоговым скором, URL остальных
+        найденных документов кластера сохраняются в duplicate_urls и
+        попадают в источники ответа.
+        """
+        index = self._duplicate_index()
+        if not index:
+            return results
+
+        clusters = {}
+        collapsed = []
+        for result in results:
+            cluster_id = index.cluster_of(result.document.root_id)
+            if cluster_id is None:
+                collapsed.append(result)
+            else:
+                clusters.setdefault(cluster_id, []).append(result)
+
+        for group in clusters.values():
+            best = max(group, key=lambda r: r.final_score)
+            urls = tuple(dict.fromkeys(r.document.url for r in group if r.document.url != best.document.url))
+            if urls:
+                best.document = replace(best.document, duplicate_urls=best.document.duplicate_urls + urls)
+            collapsed.append(best)
+
+        if len(collapsed) < len(results):
+            logger.debug(f"Схлопнуто дубликатов: {len(results) - len(collapsed)}")
+        return collapsed
+
+    def hydrate(self, results: List[SearchResult]) -> List[SearchResult]:
+        """
+        Подгружает текст документов одним запросом к векторной базе.
+
+        Вызывается только для кандидатов, которые пойдут в реранкер или
+        генератор. Уже загруженные документы не запрашиваются повторно.
+        """
+        pending = [r for r in results if isinstance(r.document, DocumentRef) and not r.document.is_loaded]
+        if not pending:
+            return results
+
+        ids = list(dict.fromkeys(source_id for r in pending for source_id in r.document.source_ids))
+
+        # Сначала хранилище документов, недостающее - из векторной базы
+        texts = {}
+        store = self._document_store()
+        if store:
+            texts = {str(doc_id): text for doc_id, text in store.get_texts(int(i) for i in ids).items()}
+
+        missing = [i for i in ids if i not in texts]
+        if missing:
+            data = self.indexer.db_connector.collection.get(ids=missing, include=["documents"])
+            for doc_id, stored_text in zip(data["ids"], data["documents"]):
+                if stored_text:
+                    texts[doc_id] = stored_text
+            if store:
+                logger.warning(f"{len(missing)} записей нет в хранилище документов, загружены из ChromaDB")
+
+        for result in pending:
+            doc = result.document
+            stored = [self._strip_title(texts.get(source_id) or "", doc.title) for source_id in doc.source_ids]
+            parts = list(stored)
+            # Соседние чанки начинаются с перекрытия - хвоста предыдущего чанка
+            for i in range(1, len(doc.source_chunks)):
+                previous, current = doc.source_chunks[i - 1], doc.source_chunks[i]
+                if previous is not None and current == previous + 1:
+                    parts[i] = self._strip_overlap(stored[i - 1], stored[i], settings.chunk_overlap_tokens)
+            result.document = replace(doc, text="\n\n".join(part for part in parts if part))
+
+        logger.debug(f"Загружен текст {len(pending)} документов ({len(ids)} записей)")
+        return results
+
+    async def ahydrate(self, results: List[SearchResult]) -> List[SearchResult]:
+        """Асинхронная подгрузка текста документов"""
+        return await asyncio.to_thread(self.hydrate, results)
+
+    def _document_store(self) -> Optional[DocumentStore]:
+        """Открытое хранилище активной версии коллекции (переоткрывается после пересборки файла или переключения версии)"""
+        if not settings.document_store_enabled:
+            return None
+
+        path = DocumentStore.for_collection(settings.document_store_path, self.indexer.db_connector.collection.name)
+        mtime = DocumentStore.mtime(path)
+        if mtime is None:
+            return None
+
+        key = (path, mtime)
+        if key != self._store_key:
+            with self._store_lock:
+                if key != self._store_key:
+                    # Старое хранилище не закрываем: им могут пользоваться параллельные запросы
+                    self._store = DocumentStore(path)
+                    self._store_key = key
+        return self._store
+
+    def _lexical_index(self) -> Optional[Bm25Index]:
+        """Открытый индекс BM25 (переоткрывается после пересборки файла)"""
+        mtime = Bm25Index.mtime(settings.bm25_index_path)
+        if mtime is None:
+            return None
+
+        if mtime != self._lexical_mtime:
+            with self._store_lock:
+                if mtime != self._lexical_mtime:
+                    self._lexical = Bm25Index(settings.bm25_index_path, settings.bm25_k1, settings.bm25_b)
+                    self._lexical_mtime = mtime
+        return self._lexical
+
+    def _duplicate_index(self) -> Optional[NearDuplicateIndex]:
+        """Открытый индекс кластеров дубликатов (переоткрывается после пересборки файла)"""
+        if not settings.near_duplicate_enabled:
+            return None
+
+        mtime = NearDuplicateIndex.mtime(settings.near_duplicate_index_path)
+        if mtime is None:
+            return None
+
+        if mtime != self._duplicates_mtime:
+            with self._store_lock:
+                if mtime != self._duplicates_mtime:
+                    self._duplicates = NearDuplicateIndex(settings.near_duplicate_index_path)
+                    self._duplicates_mtime = mtime
+        return self._duplicates
+
+    @staticmethod
+    def _strip_overlap(previous: str, text: str, max_words: int) -> str:
+        """Убирает из начала text самое длинное (не более max_words слов) повторение конца previous"""
+        words = list(re.finditer(r"\S+", text))
+        tail = previous.split()[-max_words:] if max_words > 0 else []
+        for n in range(min(len(tail), len(words)), 0, -1):
+            if [w.group() for w in words[:n]] == tail[-n:]:
+                return text[words[n - 1].end():].lstrip()
+        return text
+
+    @staticmethod
+    def _strip_title(stored_text: str, title: str) -> str:
+        """В базе хранится f"{title}\\n{text}" - возвращает только text"""
+        prefix = f"{title}\n"
+        return stored_text[len(prefix):] if stored_text.startswith(prefix) else stored_text
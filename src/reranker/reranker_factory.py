@@ -7,7 +7,8 @@ from .reranker_providers import (
     LocalBGERerankerProvider,
     LocalJinarerankerProvider
 )
-from src.config.settings import RerankerProviderType
+from .score_cache import CachedRerankerProvider
+from src.config.settings import RerankerProviderType, settings
 
 class RerankerProviderFactory:
 
@@ -17,10 +18,23 @@ class RerankerProviderFactory:
     ) -> BaseRerankerProvider:
         
         if provider_type == RerankerProviderType.OLLAMA:
-            return OllamaRerankerProvider()
+            provider = OllamaRerankerProvider()
         elif provider_type == RerankerProviderType.LocalBGE:
-            return LocalBGERerankerProvider()
+            provider = LocalBGERerankerProvider()
         elif provider_type == RerankerProviderType.LocalJina:
-            return LocalJinarerankerProvider()
+            provider = LocalJinarerankerProvider()
         else:
-            raise ValueError(f"Неподдерживаемый тип провайдера: {provider_type}")
\ No newline at end of file
+            raise ValueError(f"Неподдерживаемый тип провайдера: {provider_type}")
+
+        if settings.rerank_cache_enabled:
+            model_key = f"{provider_type.value}:{settings.reranker_model}"
+            if provider_type == RerankerProviderType.OLLAMA:
+                # Оценки LLM-реранкера зависят от клиента (Ollama/GigaChat) и температуры
+                model_key = f"{provider_type.value}:{settings.llm_client.value}:{settings.reranker_model}:t{settings.reranker_temperature}"
+            provider = CachedRerankerProvider(
+                provider,
+                model_key,
+                settings.rerank_cache_path,
+                settings.rerank_cache_max_entries
+            )
+        return provider
\ No newline at end of file
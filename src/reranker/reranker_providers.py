@@ -1,13 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Tuple
 from ..models.pipeline import RerankingResult, StageMetrics
 from ..models.search import SearchResult
 from src.llm.llm_factory import LLMClientsFactory
-from FlagEmbedding import FlagReranker
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.config.settings import settings
-from src.config.prompts import create_rerank_messages
-from transformers import AutoModel
+from src.config.prompts import RERANK_PROMPT_VERSION, create_listwise_rerank_messages, create_rerank_messages
+from src.config.startup import startup_report
+import asyncio
 import logging
 import time
 import re
@@ -17,12 +17,31 @@ logger = logging.getLogger(__name__)
 class BaseRerankerProvider(ABC):
     """Абстрактный базовый класс для провайдеров реранкера"""
 
+    # Версия промпта для ключа кэша оценок (у локальных моделей промпта нет)
+    prompt_version: str = ""
+
     @abstractmethod
     def rerank(self, query: str, documents: List[SearchResult]) -> RerankingResult:
         pass
 
+    async def arerank(self, query: str, documents: List[SearchResult]) -> RerankingResult:
+        """
+        Асинхронный реранкинг.
+
+        По умолчанию выполняет rerank в отдельном потоке, чтобы локальные
+        модели не блокировали цикл событий.
+        """
+        return await asyncio.to_thread(self.rerank, query, documents)
+
 class OllamaRerankerProvider(BaseRerankerProvider):
-    """Реранкер через модель на сервере"""
+    """
+    Реранкер через модель на сервере.
+
+    В режиме pointwise каждый кандидат оценивается отдельным запросом.
+    В режиме listwise все кандидаты (обрезанные до reranker_listwise_max_chars)
+    оцениваются одним запросом, а те, для кого модель не вернула оценку,
+    дооцениваются по одному.
+    """
 
     def __init__(self):
         self.client  = LLMClientsFactory.create_llm_client(settings.llm_client)
@@ -32,6 +51,9 @@ class OllamaRerankerProvider(BaseRerankerProvider):
         self.temperature = settings.reranker_temperature
         self.top_p = settings.reranker_top_p
         self.top_k = settings.reranker_top_k
+        self.mode = settings.reranker_mode
+        self.listwise_max_chars = settings.reranker_listwise_max_chars
+        self.prompt_version = f"{RERANK_PROMPT_VERSION}:{self.mode}"
 
     def rerank(self, query: str, documents: List[SearchResult]) -> RerankingResult:
         start_time = time.time()
@@ -42,9 +64,12 @@ class OllamaRerankerProvider(BaseRerankerProvider):
         #     return documents
         
         total_tokens = 0
+        pending = documents
+        if self.mode == "listwise" and len(documents) > 1:
+            total_tokens, pending = self._rerank_listwise(query, documents)
 
         with ThreadPoolExecutor(max_workers=settings.max_concurrent_requests) as executor:
-            futures = [executor.submit(self._rerank_single_document, query, doc) for doc in documents]
+            futures = [executor.submit(self._rerank_single_document, query, doc) for doc in pending]
 
             # Ожидаем завершения всех задач
             for future in as_completed(futures):
@@ -54,6 +79,86 @@ class OllamaRerankerProvider(BaseRerankerProvider):
                 except Exception as e:
                     logger.error(f"Ошибка в параллельной задаче: {e}")
         
+        return self._build_result(documents, start_time, total_tokens)
+
+    async def arerank(self, query: str, documents: List[SearchResult]) -> RerankingResult:
+        """Асинхронный реранкинг: запросы к LLM идут конкурентно, не более max_concurrent_requests одновременно"""
+        start_time = time.time()
+        logger.debug("начало этапа асинхронного реранжирования")
+
+        total_tokens = 0
+        pending = documents
+        if self.mode == "listwise" and len(documents) > 1:
+            total_tokens, pending = await self._arerank_listwise(query, documents)
+
+        semaphore = asyncio.Semaphore(settings.max_concurrent_requests)
+
+        async def rerank_with_limit(doc: SearchResult) -> int:
+            async with semaphore:
+                return await self._arerank_single_document(query, doc)
+
+        tokens = await asyncio.gather(*(rerank_with_limit(doc) for doc in pending))
+
+        return self._build_result(documents, start_time, total_tokens + sum(tokens))
+
+    def _rerank_listwise(self, query: str, documents: List[SearchResult]) -> Tuple[int, List[SearchResult]]:
+        """Оценивает всех кандидатов одним запросом, возвращает токены и кандидатов без оценки"""
+        try:
+            response = self.client.chat(
+                model=self.model,
+                messages=create_listwise_rerank_messages(query, self._listwise_texts(documents)),
+                temperature=self.temperature,
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при listwise реранжировании, оценка по одному документу: {e}")
+            return 0, documents
+
+        return self._apply_listwise_scores(documents, response)
+
+    async def _arerank_listwise(self, query: str, documents: List[SearchResult]) -> Tuple[int, List[SearchResult]]:
+        try:
+            response = await self.client.achat(
+                model=self.model,
+                messages=create_listwise_rerank_messages(query, self._listwise_texts(documents)),
+                temperature=self.temperature,
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при listwise реранжировании, оценка по одному документу: {e}")
+            return 0, documents
+
+        return self._apply_listwise_scores(documents, response)
+
+    def _listwise_texts(self, documents: List[SearchResult]) -> List[str]:
+        """Заголовок и начало текста каждого кандидата"""
+        texts = []
+        for doc in documents:
+            text = doc.document.text or ""
+            if len(text) > self.listwise_max_chars:
+                text = text[:self.listwise_max_chars] + "…"
+            texts.append(f"{doc.document.title}\n{text}")
+        return texts
+
+    def _apply_listwise_scores(self, documents: List[SearchResult], response) -> Tuple[int, List[SearchResult]]:
+        """Записывает оценки из ответа вида "номер: оценка", возвращает токены и пропущенных моделью кандидатов"""
+        scores = {}
+        for number, score in re.findall(r'(?m)^\W*(\d+)\W*?[:=\-–—]\s*([1-5])\b', response.content or ""):
+            scores.setdefault(int(number), float(score))
+
+        missing = []
+        for i, doc in enumerate(documents, 1):
+            if i in scores:
+                doc.rerank_score = scores[i]
+                doc.update_final_score()
+            else:
+                missing.append(doc)
+
+        if missing:
+            logger.warning(f"Listwise реранкинг: модель не оценила {len(missing)} из {len(documents)} документов, они оцениваются по одному")
+        # Клиенты не всегда сообщают число токенов
+        return (response.prompt_eval_count or 0) + (response.eval_count or 0), missing
+
+    def _build_result(self, documents: List[SearchResult], start_time: float, total_tokens: int) -> RerankingResult:
+        """Сортирует документы по итоговому скору и формирует результат этапа"""
         documents.sort(key=lambda x: x.final_score, reverse=True)
 
         total_time = time.time() - start_time
@@ -79,17 +184,36 @@ class OllamaRerankerProvider(BaseRerankerProvider):
                 # top_k=self.top_k
             )
             
-            score = self._extract_score(response.content)
-            doc.rerank_score = score
-            doc.update_final_score()
-            
-            # Возвращаем количество токенов
-            return response.prompt_eval_count + response.eval_count
+            return self._apply_score(doc, response)
             
         except Exception as e:
             logger.error(f"Ошибка при реранжировании документа: {e}")
             return 0  # Возвращаем 0 токенов при ошибке
 
+    async def _arerank_single_document(self, query, doc):
+        try:
+            content = f"{doc.document.title}\n{doc.document.text}"
+
+            response = await self.client.achat(
+                model=self.model,
+                messages=create_rerank_messages(query, content),
+                temperature=self.temperature,
+            )
+
+            return self._apply_score(doc, response)
+
+        except Exception as e:
+            logger.error(f"Ошибка при реранжировании документа: {e}")
+            return 0  # Возвращаем 0 токенов при ошибке
+
+    def _apply_score(self, doc: SearchResult, response) -> int:
+        """Записывает оценку модели в документ и возвращает количество токенов"""
+        score = self._extract_score(response.content)
+        doc.rerank_score = score
+        doc.update_final_score()
+
+        return response.prompt_eval_count + response.eval_count
+
 
     def _extract_score(self, content: str) -> int:
         """Извлечение оценки из ответа модели"""
@@ -104,7 +228,8 @@ class OllamaRerankerProvider(BaseRerankerProvider):
 class LocalBGERerankerProvider(BaseRerankerProvider):
     def __init__(self):
         self.model = settings.reranker_model
-        self.reranker = FlagReranker(self.model)
+        flag_embedding = startup_report.import_module("FlagEmbedding", "reranker")
+        self.reranker = flag_embedding.FlagReranker(self.model)
     
     def rerank(self, query: str, documents: List[SearchResult]) -> RerankingResult:
         start_time = time.time()
@@ -135,7 +260,8 @@ class LocalBGERerankerProvider(BaseRerankerProvider):
     
 class LocalJinarerankerProvider(BaseRerankerProvider):
     def __init__(self):
-        self.model = AutoModel.from_pretrained(
+        transformers = startup_report.import_module("transformers", "reranker")
+        self.model = transformers.AutoModel.from_pretrained(
             settings.reranker_model,
             dtype="auto",
             trust_remote_code=True,
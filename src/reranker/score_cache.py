@@ -0,0 +1,210 @@
+"""
+Персистентный кэш оценок реранкера
+"""
+from .reranker_providers import BaseRerankerProvider
+from ..models.pipeline import RerankingResult, StageMetrics
+from ..models.search import SearchResult
+from pathlib import Path
+from typing import Dict, List, Tuple
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# (хэш запроса, ID документа, хэш содержимого)
+ScoreKey = Tuple[str, int, str]
+
+
+class CachedRerankerProvider(BaseRerankerProvider):
+    """
+    Кэширующая обертка над любым провайдером реранкера.
+
+    Оценки хранятся в SQLite по ключу (хэш нормализованного запроса, ID
+    документа, хэш заголовка и текста, модель, версия промпта), поэтому
+    повторяющиеся пары запрос-документ не оцениваются заново, а изменение
+    документа, модели или промпта делает старые оценки недействительными.
+    Провайдер получает только кандидатов без оценки в кэше. Размер кэша
+    ограничен max_entries: при переполнении удаляются записи, к которым
+    дольше всего не обращались.
+
+    Attributes:
+        provider: Оборачиваемый провайдер
+        model_key: Идентификатор модели в ключе кэша
+        prompt_version: Версия промпта в ключе кэша
+        hits: Количество оценок, найденных в кэше
+        misses: Количество оценок, посчитанных провайдером
+    """
+
+    def __init__(self,
+                 provider: BaseRerankerProvider,
+                 model_key: str,
+                 db_path: str = "storage/rerank_cache.sqlite",
+                 max_entries: int = 200_000):
+        self.provider = provider
+        self.model_key = model_key
+        self.prompt_version = provider.prompt_version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rerank_scores (
+                query_hash TEXT NOT NULL,
+                doc_id INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                score REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (query_hash, doc_id, content_hash, model, prompt_version)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rerank_scores_last_access ON rerank_scores (last_access)")
+        self._conn.commit()
+        logger.debug(f"Кэш оценок реранкера {db_path} для модели {model_key}, промпт {self.prompt_version or '-'}")
+
+    def rerank(self, query: str, documents: List[SearchResult]) -> RerankingResult:
+        start_time = time.time()
+        keys = [self._key(query, doc) for doc in documents]
+        pending, hits = self._apply_cached(documents, keys, self._get_many(set(keys)))
+
+        total_tokens = None
+        if pending:
+            result = self.provider.rerank(query, [doc for _, doc in pending])
+            total_tokens = result.total_tokens_used
+            self._put_many(self._scored(pending))
+
+        return self._build_result(documents, start_time, total_tokens, hits)
+
+    async def arerank(self, query: str, documents: List[SearchResult]) -> RerankingResult:
+        start_time = time.time()
+        keys = [self._key(query, doc) for doc in documents]
+        cached = await asyncio.to_thread(self._get_many, set(keys))
+        pending, hits = self._apply_cached(documents, keys, cached)
+
+        total_tokens = None
+        if pending:
+            result = await self.provider.arerank(query, [doc for _, doc in pending])
+            total_tokens = result.total_tokens_used
+            await asyncio.to_thread(self._put_many, self._scored(pending))
+
+        return self._build_result(documents, start_time, total_tokens, hits)
+
+    def stats(self) -> dict:
+        """Статистика попаданий в кэш"""
+        total = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM rerank_scores").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries
+        }
+
+    def clear(self) -> None:
+        """Удаляет из кэша все оценки текущей модели"""
+        with self._lock:
+            self._conn.execute("DELETE FROM rerank_scores WHERE model = ?", (self.model_key,))
+            self._conn.commit()
+
+    def _apply_cached(self,
+                      documents: List[SearchResult],
+                      keys: List[ScoreKey],
+                      cached: Dict[ScoreKey, float]
+    ) -> Tuple[List[Tuple[ScoreKey, SearchResult]], int]:
+        """Проставляет оценки из кэша, возвращает кандидатов без оценки и число попаданий"""
+        pending = []
+        for key, doc in zip(keys, documents):
+            if key in cached:
+                doc.rerank_score = cached[key]
+                doc.update_final_score()
+            else:
+                pending.append((key, doc))
+
+        hits = len(documents) - len(pending)
+        self.hits += hits
+        self.misses += len(pending)
+        logger.debug(f"Кэш оценок реранкера: {hits} из {len(documents)} найдено")
+        return pending, hits
+
+    @staticmethod
+    def _scored(pending: List[Tuple[ScoreKey, SearchResult]]) -> Dict[ScoreKey, float]:
+        """Оценки, которые провайдер смог посчитать (ошибки не кэшируются)"""
+        return {key: float(doc.rerank_score) for key, doc in pending if doc.rerank_score is not None}
+
+    def _build_result(self, documents: List[SearchResult], start_time: float, total_tokens, hits: int) -> RerankingResult:
+        documents.sort(key=lambda x: x.final_score, reverse=True)
+        total_time = time.time() - start_time
+        if hits:
+            logger.info(f"Реранжирование: {hits} из {len(documents)} оценок из кэша. Время выполнения: {total_time:.3f}")
+        return RerankingResult(
+            StageMetrics("rerank", total_time),
+            documents,
+            total_tokens,
+            cache_hits=hits
+        )
+
+    def _get_many(self, keys: set) -> Dict[ScoreKey, float]:
+        """Читает оценки по ключам и обновляет время последнего обращения"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for query_hash, doc_id, content_hash in keys:
+                row = self._conn.execute(
+                    "SELECT score FROM rerank_scores WHERE query_hash = ? AND doc_id = ? AND content_hash = ? "
+                    "AND model = ? AND prompt_version = ?",
+                    (query_hash, doc_id, content_hash, self.model_key, self.prompt_version)
+                ).fetchone()
+                if row is not None:
+                    found[(query_hash, doc_id, content_hash)] = row[0]
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE rerank_scores SET last_access = ? WHERE query_hash = ? AND doc_id = ? AND content_hash = ? "
+                    "AND model = ? AND prompt_version = ?",
+                    [(now, *key, self.model_key, self.prompt_version) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def _put_many(self, scores: Dict[ScoreKey, float]) -> None:
+        """Сохраняет оценки и вытесняет самые давние записи при переполнении"""
+        if not scores:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rerank_scores "
+                "(query_hash, doc_id, content_hash, model, prompt_version, score, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*key, self.model_key, self.prompt_version, score, now) for key, score in scores.items()]
+            )
+
+            count = self._conn.execute("SELECT COUNT(*) FROM rerank_scores").fetchone()[0]
+            if count > self.max_entries:
+                evicted = count - self.max_entries
+                self._conn.execute(
+                    "DELETE FROM rerank_scores WHERE rowid IN "
+                    "(SELECT rowid FROM rerank_scores ORDER BY last_access ASC LIMIT ?)",
+                    (evicted,)
+                )
+                logger.debug(f"Из кэша оценок реранкера вытеснено {evicted} записей")
+            self._conn.commit()
+
+    @staticmethod
+    def _key(query: str, doc: SearchResult) -> ScoreKey:
+        normalized = " ".join(query.split()).casefold()
+        content = f"{doc.document.title}\n{doc.document.text or ''}"
+        return (
+            hashlib.sha256(normalized.encode("utf-8")).hexdigest(),
+            int(doc.document.id),
+            hashlib.sha256(content.encode("utf-8")).hexdigest()
+        )